@@ -0,0 +1,186 @@
+# Deterministic benchmark inputs: Python sources of increasing size and shape, realistic LLM
+# responses, comment arrays and history entries. Everything is generated from fixed seeds, so
+# two runs (or two machines) benchmark exactly the same bytes.
+
+import json
+import random
+from typing import Any, Dict, List, Tuple
+
+SEVERITIES = ('error', 'warning', 'info')
+CATEGORIES = ('Performance', 'Readability', 'Security', 'Maintainability', 'Style', 'Other')
+LIBRARIES = ('requests', 'numpy', 'pandas', 'flask', 'django', 'sqlalchemy', 'matplotlib', 'lodash',
+             'attrs', 'pydantic', 'httpx', 'boto3', 'bits/stdc++.h', 'express', 'axios')
+
+# (name, target lines, shape)
+SOURCES = (
+    ('flat_50', 50, 'flat'),
+    ('flat_500', 500, 'flat'),
+    ('classes_1000', 1000, 'classes'),
+    ('mixed_2000', 2000, 'mixed'),
+    ('mixed_5000', 5000, 'mixed'),
+    ('nested_300', 300, 'nested'),
+    ('nested_2000', 2000, 'nested'),
+)
+QUICK_SOURCES = ('flat_50', 'flat_500', 'nested_300')
+
+
+def _function(rng: random.Random, name: str, indent: str = '') -> List[str]:
+    args = ', '.join(f'arg{i}' for i in range(rng.randint(1, 4)))
+    lines = [f'{indent}def {name}({args}):',
+             f'{indent}    """Compute {name} from its arguments."""',
+             f'{indent}    total = 0']
+    for i in range(rng.randint(2, 8)):
+        kind = rng.random()
+        if kind < 0.3:
+            lines += [f'{indent}    for item in range(arg0 if isinstance(arg0, int) else {i + 3}):',
+                      f'{indent}        total += item * {rng.randint(1, 9)}']
+        elif kind < 0.6:
+            lines += [f'{indent}    if total > {rng.randint(10, 500)}:',
+                      f'{indent}        total -= {rng.randint(1, 50)}',
+                      f'{indent}    elif total < 0:',
+                      f'{indent}        total = abs(total)']
+        elif kind < 0.8:
+            lines += [f'{indent}    values = [v * 2 for v in range({rng.randint(2, 20)}) if v % 3]',
+                      f'{indent}    total += sum(values)']
+        else:
+            lines += [f'{indent}    try:',
+                      f'{indent}        total += int(str(arg0)[:{rng.randint(1, 4)}] or 0)',
+                      f'{indent}    except ValueError:',
+                      f'{indent}        pass']
+    lines += [f'{indent}    return total', '']
+    return lines
+
+
+def _class(rng: random.Random, name: str) -> List[str]:
+    lines = [f'class {name}:', f'    """Container for {name.lower()} state."""', '',
+             '    def __init__(self, value=0):', '        self.value = value', '']
+    for i in range(rng.randint(3, 7)):
+        lines += _function(rng, f'method_{i}', '    ')
+    return lines + ['']
+
+
+def _nested(rng: random.Random, depth: int) -> List[str]:
+    # deep if/elif ladders and nested loops up to just under CPython's 20 nested blocks,
+    # plus a deeply parenthesised expression: worst cases for the AST walkers and radon
+    lines = [f'def nested_{rng.randint(0, 10**6)}(x, y):']
+    indent = '    '
+    for level in range(depth):
+        if level % 3 == 0 and level // 3 < 15:
+            lines.append(f'{indent}for i{level} in range(x):')
+        else:
+            lines.append(f'{indent}if x > {level} and (y < {level * 2} or x % {level + 2} == 0):')
+        indent += '    '
+    lines.append(f'{indent}y += ' + '(' * 40 + 'x + 1' + ')' * 40)
+    for level in range(depth, 0, -1):
+        indent = '    ' * level
+        lines.append(f'{indent}y -= {level}')
+    lines += ['    return y', '']
+    return lines
+
+
+def python_source(lines: int, shape: str, seed: int = 1) -> str:
+    """A syntactically valid Python module of about `lines` lines."""
+    rng = random.Random(f'{shape}:{lines}:{seed}')
+    out = ['"""Synthetic benchmark module."""', 'import os', 'import json', 'from typing import Any, Dict', '']
+    n = 0
+    while len(out) < lines:
+        if shape == 'flat':
+            out += _function(rng, f'func_{n}')
+        elif shape == 'classes':
+            out += _class(rng, f'Model{n}')
+        elif shape == 'nested':
+            out += _nested(rng, rng.randint(20, 45))
+        else:
+            choice = rng.random()
+            if choice < 0.5:
+                out += _function(rng, f'func_{n}')
+            elif choice < 0.85:
+                out += _class(rng, f'Model{n}')
+            else:
+                out += _nested(rng, rng.randint(8, 25))
+        n += 1
+    return '\n'.join(out[:lines]).rsplit('\ndef ', 1)[0].rsplit('\nclass ', 1)[0] + '\n'
+
+
+def js_source(lines: int, seed: int = 1) -> str:
+    """A JavaScript module of about `lines` lines (functions, classes, arrows), for the tokenizer metrics."""
+    rng = random.Random(f'js:{lines}:{seed}')
+    out = ["'use strict';", "const path = require('path');", '']
+    n = 0
+    while len(out) < lines:
+        body = []
+        for i in range(rng.randint(2, 6)):
+            kind = rng.random()
+            if kind < 0.4:
+                body += [f'  if (total > {rng.randint(10, 500)} && arg0) {{', f'    total -= {rng.randint(1, 50)};',
+                         '  } else if (total < 0 || !arg1) {', '    total = Math.abs(total);', '  }']
+            elif kind < 0.7:
+                body += [f'  for (let i = 0; i < {rng.randint(2, 20)}; i++) {{', '    total += i % 3 ? i : 0;', '  }']
+            else:
+                body += [f'  const values = [1, 2, 3].map((v) => v * {rng.randint(1, 9)});',
+                         "  total += values.reduce((a, b) => a + b, 0); // sum"]
+        if rng.random() < 0.3:
+            out += [f'class Model{n} {{', '  constructor(value) { this.value = value; }',
+                    '  get(key) { return this.value ? this.value[key] : undefined; }', '}', '']
+        out += [f'function func{n}(arg0, arg1) {{', '  let total = 0;'] + body + ['  return total;', '}', '']
+        n += 1
+    return '\n'.join(out) + '\n'
+
+
+def sources(quick: bool = False) -> List[Tuple[str, str]]:
+    return [(name, python_source(lines, shape)) for name, lines, shape in SOURCES
+            if not quick or name in QUICK_SOURCES]
+
+
+def comments(n: int, seed: int = 2) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [{
+        'line': rng.randint(1, 5000),
+        'column': rng.choice((None, rng.randint(0, 80))),
+        'severity': rng.choice(SEVERITIES),
+        'category': rng.choice(CATEGORIES),
+        'message': f'Issue {i}: the value computed here is reassigned before use, which hides a logic error.',
+        'suggestion': rng.choice((None, 'Remove the dead assignment or use the intermediate value explicitly.')),
+    } for i in range(n)]
+
+
+def docs_entries(n: int, seed: int = 3) -> List[Any]:
+    rng = random.Random(seed)
+    out: List[Any] = []
+    for i in range(n):
+        lib = rng.choice(LIBRARIES) if i % 4 else f'internal_lib_{i}'
+        if i % 3 == 0:
+            out.append(f'{lib} — used for I/O in module section {i}')
+        else:
+            out.append({'name': lib, 'snippet': f'import {lib}', 'url': None if i % 5 else f'https://example.com/{lib}'})
+    return out
+
+
+def llm_responses() -> List[Tuple[str, str]]:
+    """Model outputs as they arrive: clean, wrapped in prose, fenced, large, and malformed."""
+    review = comments(40)
+    big = comments(1000)
+    summary = {'summary': 'Parses configuration files and exposes typed accessors.',
+               'key_points': ['Loads YAML and JSON', 'Caches parsed files', 'No input validation']}
+    return [
+        ('summary_clean', json.dumps(summary)),
+        ('summary_prose', 'Sure! Here is the summary you asked for:\n' + json.dumps(summary, indent=2) + '\nLet me know if you need more.'),
+        ('review_fenced', '```json\n' + json.dumps(review, indent=2) + '\n```'),
+        ('review_1000', json.dumps(big)),
+        ('tags_array', '["Performance", "Security", "Readability"]'),
+        # unbalanced tail: the progressive parser tries every prefix before giving up
+        ('review_truncated', json.dumps(review)[:-40]),
+    ]
+
+
+def history_entry(i: int, seed: int = 4) -> Dict[str, Any]:
+    # the shape the frontend posts: the analysis result itself plus fileName
+    rng = random.Random(seed * 100003 + i)
+    return {
+        'fileName': f'src/module_{i % 40}.py',
+        'metrics': {'cc_avg': round(rng.uniform(1, 15), 3), 'mi_avg': round(rng.uniform(20, 100), 3),
+                    'pylint_score': round(rng.uniform(0, 10), 2), 'lines': rng.randint(20, 2000)},
+        'summary': {'summary': f'Module {i} handles request routing and caching.', 'key_points': []},
+        'comments': comments(rng.randint(0, 60), seed=i),
+        'tags': rng.sample(list(CATEGORIES), 2),
+    }
@@ -0,0 +1,269 @@
+# Benchmark suite for the analysis pipeline.
+# Run from the backend dir: python benchmarks/run.py [--quick] [--only metrics,pdf] [--repeat 3]
+#
+# Cases (see benchmarks/corpus.py for the deterministic inputs):
+#   metrics/*      analyze_metrics per corpus file, with radon_cc / radon_mi / pylint stage times
+#                  (Python) or the single tokenizer pass (token_metrics, JavaScript)
+#   json_extract/* _extract_json_from_text on clean, wrapped, fenced, large and truncated responses
+#   validators/*   validate_comments / validate_docs on large arrays
+#   docs_links/*   docs-link post-processing
+#   pdf/*          build_pdf_report, standard and large layout
+#   history/*      history store writes, pages, filters, search and rollups
+#   pipeline/*     run_analysis in cloud mode against the offline replay LLM (LLM_BACKEND=replay)
+#
+# Each case runs once to warm up, then --repeat times; the report (--output, JSON) holds the
+# median/min/max wall time and median per-stage times from the pipeline's own timed() spans.
+# With a baseline (--baseline, default benchmarks/baseline.json) every case is compared to it:
+# slower than --threshold x the baseline median (and by more than --min-delta-ms) is a
+# regression, and --fail-on-regression turns regressions into exit status 1 (and a missing
+# baseline into an error, so a CI gate cannot pass without comparing). The committed
+# benchmarks/baseline.json was recorded with --save-baseline; its "meta" block says on what
+# machine. Re-record it on the reference machine when that changes, and commit it.
+#
+# History and usage data go to a throwaway directory; nothing touches backend/data.
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+# configure the services before they are imported: offline LLM, scratch storage, no result cache
+_SCRATCH = tempfile.mkdtemp(prefix='code-review-bench-')
+os.environ['HISTORY_DIR'] = _SCRATCH
+os.environ['LLM_BACKEND'] = 'replay'
+os.environ['LLM_REPLAY_ON_MISS'] = 'stub'
+os.environ['LLM_CASSETTE_DIR'] = os.path.join(_SCRATCH, 'cassettes')
+os.environ['RESULT_CACHE_ENABLED'] = '0'
+os.environ.setdefault('HISTORY_MAX_ENTRIES', '100000')
+
+from benchmarks import corpus  # noqa: E402
+from services.instrumentation import collect_timings  # noqa: E402
+
+GROUPS = ('metrics', 'json_extract', 'validators', 'docs_links', 'pdf', 'history', 'pipeline')
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, 'benchmarks', 'baseline.json')
+DEFAULT_OUTPUT = os.path.join(BACKEND_DIR, 'benchmarks', 'results', 'latest.json')
+
+Case = Tuple[str, Callable[[], Any]]
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    fn()  # warmup: imports, pylint bytecode, SQLite pages
+    times: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    for _ in range(repeat):
+        with collect_timings() as timings:
+            start = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - start) * 1000.0)
+        for stage, ms in timings.totals_ms().items():
+            if stage != 'total':
+                stages.setdefault(stage, []).append(ms)
+    return {
+        'median_ms': round(statistics.median(times), 3),
+        'min_ms': round(min(times), 3),
+        'max_ms': round(max(times), 3),
+        'runs': repeat,
+        'stages': {s: round(statistics.median(v), 3) for s, v in sorted(stages.items())},
+    }
+
+
+def metrics_cases(quick: bool) -> List[Case]:
+    from services.metrics import analyze_metrics
+    cases: List[Case] = [(f'metrics/{name}', lambda code=code, name=name: analyze_metrics(code, f'{name}.py'))
+                         for name, code in corpus.sources(quick)]
+    for lines in ((500,) if quick else (500, 5000)):
+        cases.append((f'metrics/js_{lines}', lambda code=corpus.js_source(lines): analyze_metrics(code, 'module.js')))
+    return cases
+
+
+def json_extract_cases(quick: bool) -> List[Case]:
+    from services.gemini_client import _extract_json_from_text
+    return [(f'json_extract/{name}', lambda text=text: _extract_json_from_text(text))
+            for name, text in corpus.llm_responses()]
+
+
+def validators_cases(quick: bool) -> List[Case]:
+    from services.validators import validate_comments, validate_docs
+    sizes = (1000,) if quick else (1000, 10000)
+    cases: List[Case] = [(f'validators/comments_{n}', lambda c=corpus.comments(n): validate_comments(c)) for n in sizes]
+    cases.append(('validators/docs_2000', lambda d=corpus.docs_entries(2000): validate_docs(d)))
+    return cases
+
+
+def docs_links_cases(quick: bool) -> List[Case]:
+    from services.analyzer import _build_docs_links
+    sizes = (200,) if quick else (200, 2000)
+    return [(f'docs_links/{n}', lambda d=corpus.docs_entries(n): _build_docs_links(d)) for n in sizes]
+
+
+def pdf_cases(quick: bool) -> List[Case]:
+    from services.pdf_exporter import build_pdf_report
+
+    def payload(n: int) -> Dict[str, Any]:
+        return {'summary': {'summary': 'Synthetic report for benchmarking.', 'key_points': ['generated']},
+                'metrics': {'cc_avg': 3.2, 'mi_avg': 61.5, 'lines': n * 4},
+                'comments': corpus.comments(n), 'docs_links': []}
+
+    cases: List[Case] = [('pdf/standard_200', lambda p=payload(200): build_pdf_report(p, large=False))]
+    if not quick:
+        cases.append(('pdf/large_3000', lambda p=payload(3000): build_pdf_report(p, large=True)))
+    return cases
+
+
+def history_cases(quick: bool) -> List[Case]:
+    from services import history_store as hs
+    existing = 200 if quick else 1000
+    hs.clear_history()
+    for i in range(existing):
+        hs.save_entry(corpus.history_entry(i))
+    newest = hs.list_history_index(1)[0][0]['id']
+    counter = [existing]
+
+    def save_batch():
+        for _ in range(20):
+            hs.save_entry(corpus.history_entry(counter[0]))
+            counter[0] += 1
+
+    return [
+        ('history/save_20', save_batch),
+        ('history/index_page_50', lambda: hs.list_history_index(50)),
+        ('history/payload_page_50', lambda: hs.list_history_page(50)),
+        ('history/get_entry', lambda: hs.get_entry(newest)),
+        ('history/filter_severity_error', lambda: hs.list_history_index(50, filters={'severity': 'error'})),
+        ('history/search_q', lambda: hs.list_history_index(50, filters={'q': 'routing'})),
+        ('history/stats_day', lambda: hs.history_stats('day')),
+        ('history/iter_all', lambda: sum(1 for _ in hs.iter_entries())),
+    ]
+
+
+def pipeline_cases(quick: bool) -> List[Case]:
+    from services.analyzer import run_analysis
+    names = ('flat_500',) if quick else ('flat_500', 'mixed_2000')
+    codes = dict(corpus.sources(False))
+    return [(f'pipeline/{name}', lambda code=codes[name]: run_analysis(code, {}, 'cloud', api_key='benchmark',
+                                                                        api_key_source='benchmark'))
+            for name in names]
+
+
+CASE_BUILDERS = {
+    'metrics': metrics_cases,
+    'json_extract': json_extract_cases,
+    'validators': validators_cases,
+    'docs_links': docs_links_cases,
+    'pdf': pdf_cases,
+    'history': history_cases,
+    'pipeline': pipeline_cases,
+}
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_delta_ms: float) -> Dict[str, Any]:
+    out = {}
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base or not base.get('median_ms'):
+            out[name] = {'status': 'new'}
+            continue
+        ratio = current['median_ms'] / base['median_ms']
+        delta = current['median_ms'] - base['median_ms']
+        if ratio > threshold and delta > min_delta_ms:
+            status = 'regression'
+        elif ratio < 1.0 / threshold and -delta > min_delta_ms:
+            status = 'improvement'
+        else:
+            status = 'ok'
+        out[name] = {'status': status, 'ratio': round(ratio, 3), 'baseline_ms': base['median_ms']}
+    return out
+
+
+def _write_json(path: str, data: Dict[str, Any]):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the analysis pipeline')
+    parser.add_argument('--quick', action='store_true', help='small corpus and fewer cases (CI smoke run)')
+    parser.add_argument('--only', default='', help='comma-separated groups: ' + ','.join(GROUPS))
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case (after one warmup run)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='where to write the JSON report')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline report to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='also write this report as the baseline')
+    parser.add_argument('--threshold', type=float, default=1.25, help='regression when slower than this x baseline')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore differences below this (noise floor)')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit 1 if any case regressed')
+    args = parser.parse_args(argv)
+
+    groups = [g.strip() for g in args.only.split(',') if g.strip()] or list(GROUPS)
+    unknown = [g for g in groups if g not in CASE_BUILDERS]
+    if unknown:
+        parser.error(f'unknown groups: {", ".join(unknown)}')
+    if args.fail_on_regression and not args.save_baseline and not os.path.exists(args.baseline):
+        parser.error(f'--fail-on-regression needs a baseline, and {args.baseline} does not exist '
+                     '(record one with --save-baseline)')
+
+    results: Dict[str, Any] = {}
+    try:
+        for group in groups:
+            for name, fn in CASE_BUILDERS[group](args.quick):
+                results[name] = measure(fn, max(args.repeat, 1))
+                print(f'{name:<36} {results[name]["median_ms"]:>11.2f} ms  (min {results[name]["min_ms"]:.2f})', flush=True)
+    finally:
+        shutil.rmtree(_SCRATCH, ignore_errors=True)
+
+    report: Dict[str, Any] = {
+        'meta': {
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+            'quick': args.quick,
+            'groups': groups,
+        },
+        'results': results,
+    }
+
+    regressions = []
+    if args.save_baseline:
+        pass
+    elif not os.path.exists(args.baseline):
+        print(f'\nno baseline at {args.baseline}; nothing compared')
+    else:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['baseline_meta'] = baseline.get('meta')
+        if (baseline.get('meta') or {}).get('quick') != args.quick:
+            print('\nnote: the baseline was recorded ' + ('with' if not args.quick else 'without')
+                  + ' --quick; cases it does not have are reported as new')
+        report['comparison'] = compare(results, baseline.get('results', {}), args.threshold, args.min_delta_ms)
+        print(f'\n--- compared with {args.baseline} (threshold {args.threshold}x)')
+        for name, c in report['comparison'].items():
+            if c['status'] != 'ok':
+                detail = f'{c["ratio"]:.2f}x of {c["baseline_ms"]:.2f} ms' if 'ratio' in c else ''
+                print(f'{name:<36} {c["status"]:<12} {detail}')
+        regressions = [n for n, c in report['comparison'].items() if c['status'] == 'regression']
+        print(f'{len(regressions)} regression(s)')
+
+    _write_json(args.output, report)
+    print(f'\nreport written to {args.output}')
+    if args.save_baseline:
+        _write_json(args.baseline, report)
+        print(f'baseline written to {args.baseline}')
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
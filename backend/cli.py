@@ -0,0 +1,268 @@
+# Headless bulk analysis: run the review pipeline over a directory tree, without the HTTP API.
+# Run from the backend dir: python cli.py path/to/repo --output review.jsonl [--jobs 4] [--llm-concurrency 4]
+#
+# Files matching --include (and not --exclude; directories matching --exclude are not entered)
+# are analysed in a process pool through the same result cache as the API (cached_analysis), so
+# unchanged files cost nothing on the next nightly run. Every model call made by any worker holds
+# one slot of a semaphore shared by the pool, so --llm-concurrency caps the whole run's in-flight
+# LLM requests regardless of --jobs.
+#
+# One JSON line per file is appended to --output as soon as it finishes: path, sha256, status
+# (ok, error or skipped), the analysis result and the LLM usage. Re-running with the same output
+# resumes: files already recorded with the same content hash are skipped (--no-resume starts
+# over). The final summary (metrics averages, severity counts, degraded LLM results) covers
+# every line in the output, including those from earlier runs; --summary writes it as JSON.
+#
+# The LLM key comes from --api-key or GOOGLE_GENAI_API_KEY; without one (or with --mode local)
+# only the local metrics run.
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.file_utils import MAX_UPLOAD_BYTES  # noqa: E402
+
+DEFAULT_INCLUDE = ('*.py',)
+DEFAULT_EXCLUDE = ('.git', '.hg', '.svn', '__pycache__', 'node_modules', '.venv', 'venv', '.tox',
+                   'build', 'dist', '*.egg-info')
+SEVERITIES = ('error', 'warning', 'info')
+_METRIC_KEYS = ('cc_avg', 'mi_avg', 'pylint_score', 'naming_quality', 'oop_compliance', 'coding_standards')
+_DEGRADED_KEYS = ('metrics_error', 'summary_error', 'comments_error', 'tags_error', 'docs_error')
+
+
+def _matches(rel_path: str, patterns) -> bool:
+    name = rel_path.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatch(rel_path, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+
+def walk(root: str, include, exclude) -> Iterator[str]:
+    """Relative paths ('/'-separated, sorted) of the files to analyse under root."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root).replace(os.sep, '/')
+        rel_dir = '' if rel_dir == '.' else rel_dir + '/'
+        dirnames[:] = sorted(d for d in dirnames if not _matches(rel_dir + d, exclude))
+        for name in sorted(filenames):
+            rel = rel_dir + name
+            if _matches(rel, include) and not _matches(rel, exclude):
+                yield rel
+
+
+def _init_worker(limiter, log_level: int):
+    logging.basicConfig(level=log_level, format='%(processName)s %(levelname)s %(name)s: %(message)s')
+    from services.gemini_client import set_llm_limiter
+    set_llm_limiter(limiter)
+
+
+def analyze_path(root: str, rel: str, mode: str, features: Dict[str, Any], api_key: Optional[str],
+                 key_source: str, max_bytes: int) -> Dict[str, Any]:
+    """Analyse one file (in a worker process); always returns a record, never raises."""
+    from services.result_cache import cached_analysis
+    from services.usage import collect_usage
+
+    record: Dict[str, Any] = {'path': rel}
+    started = time.perf_counter()
+    try:
+        with open(os.path.join(root, rel), 'rb') as f:
+            data = f.read()
+        record['sha256'] = hashlib.sha256(data).hexdigest()
+        if len(data) > max_bytes:
+            record.update(status='skipped', reason=f'larger than {max_bytes} bytes')
+            return record
+        if b'\x00' in data:
+            record.update(status='skipped', reason='binary file')
+            return record
+        try:
+            code = data.decode('utf-8')
+        except UnicodeDecodeError:
+            record.update(status='skipped', reason='not UTF-8 text')
+            return record
+        with collect_usage() as usage:
+            result = cached_analysis(code, features, mode, api_key=api_key, api_key_source=key_source, filename=rel)
+        if usage.calls:
+            result['llm_usage'] = usage.as_dict()
+        record.update(status='ok', result=result)
+    except Exception as e:  # one bad file must not stop the run
+        logging.getLogger(__name__).exception("Analysis of %s failed", rel)
+        record.update(status='error', error=f'{type(e).__name__}: {e}')
+    finally:
+        record['seconds'] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def read_records(path: str) -> List[Dict[str, Any]]:
+    """Records already in the output; a torn last line (interrupted write) is ignored."""
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def _open_output(path: str, resume: bool):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if not resume:
+        return open(path, 'w', encoding='utf-8')
+    out = open(path, 'a+', encoding='utf-8')
+    # drop a partial line left by an interrupted run before appending
+    out.seek(0)
+    content = out.read()
+    if content and not content.endswith('\n'):
+        out.truncate(content.rfind('\n') + 1)
+    out.seek(0, os.SEEK_END)
+    return out
+
+
+def _done_paths(records: List[Dict[str, Any]], retry_errors: bool) -> Set[Tuple[str, str]]:
+    done = set()
+    for r in records:
+        if r.get('status') == 'error' and retry_errors:
+            continue
+        if r.get('path') and r.get('sha256'):
+            done.add((r['path'], r['sha256']))
+    return done
+
+
+def _file_sha(root: str, rel: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, rel), 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def aggregate(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Totals over the latest record of each path."""
+    latest: Dict[str, Dict[str, Any]] = {}
+    for r in records:
+        if r.get('path'):
+            latest[r['path']] = r
+    status = {'ok': 0, 'error': 0, 'skipped': 0}
+    severity = dict.fromkeys(SEVERITIES, 0)
+    sums = dict.fromkeys(_METRIC_KEYS, 0.0)
+    counts = dict.fromkeys(_METRIC_KEYS, 0)
+    lines = comments = degraded = 0
+    tokens = {'calls': 0, 'input_tokens': 0, 'cached_tokens': 0, 'output_tokens': 0}
+    for r in latest.values():
+        status[r.get('status', 'error')] = status.get(r.get('status', 'error'), 0) + 1
+        result = r.get('result') or {}
+        metrics = result.get('metrics') or {}
+        lines += metrics.get('lines') or 0
+        for k in _METRIC_KEYS:
+            if isinstance(metrics.get(k), (int, float)):
+                sums[k] += metrics[k]
+                counts[k] += 1
+        for c in result.get('comments') or []:
+            sev = c.get('severity') if isinstance(c, dict) else None
+            if sev in severity:
+                severity[sev] += 1
+                comments += 1
+        if result.get('llm_disabled') or any(result.get(k) for k in _DEGRADED_KEYS):
+            degraded += 1
+        total = (result.get('llm_usage') or {}).get('total') or {}
+        for k in tokens:
+            tokens[k] += total.get(k, 0)
+    return {
+        'files': len(latest),
+        'status': status,
+        'lines': lines,
+        'metrics_avg': {k: round(sums[k] / counts[k], 3) for k in _METRIC_KEYS if counts[k]},
+        'comments': comments,
+        'severity': severity,
+        'llm_degraded': degraded,
+        'llm_usage': tokens,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Analyse every matching file under a directory')
+    parser.add_argument('root', help='directory to analyse')
+    parser.add_argument('--output', '-o', default='review.jsonl', help='JSONL file, one record per file')
+    parser.add_argument('--include', action='append', help=f'glob to analyse (repeatable; default {",".join(DEFAULT_INCLUDE)})')
+    parser.add_argument('--exclude', action='append', default=[], help='glob of files/directories to skip (repeatable)')
+    parser.add_argument('--no-default-excludes', action='store_true', help='also enter .git, node_modules, venvs, build dirs')
+    parser.add_argument('--mode', default='cloud', choices=('cloud', 'local'))
+    parser.add_argument('--features', default='{}', help='JSON feature switches, as the API form field')
+    parser.add_argument('--api-key', default=None, help='LLM key (default: GOOGLE_GENAI_API_KEY)')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1, help='worker processes')
+    parser.add_argument('--llm-concurrency', type=int, default=4, help='max in-flight LLM calls across all workers')
+    parser.add_argument('--max-bytes', type=int, default=MAX_UPLOAD_BYTES, help='skip larger files')
+    parser.add_argument('--no-resume', action='store_true', help='overwrite the output instead of resuming it')
+    parser.add_argument('--retry-errors', action='store_true', help='on resume, analyse files that failed again')
+    parser.add_argument('--summary', help='also write the final summary as JSON here')
+    parser.add_argument('--verbose', '-v', action='store_true')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        parser.error(f'not a directory: {args.root}')
+    try:
+        features = json.loads(args.features)
+    except ValueError:
+        parser.error('--features must be a JSON object')
+    log_level = logging.INFO if args.verbose else logging.WARNING
+    logging.basicConfig(level=log_level, format='%(levelname)s %(name)s: %(message)s')
+
+    root = os.path.abspath(args.root)
+    include = args.include or list(DEFAULT_INCLUDE)
+    exclude = list(args.exclude) + ([] if args.no_default_excludes else list(DEFAULT_EXCLUDE))
+    api_key = args.api_key or os.environ.get('GOOGLE_GENAI_API_KEY') or None
+    key_source = 'cli' if args.api_key else 'server_env'
+
+    resume = not args.no_resume
+    previous = read_records(args.output) if resume else []
+    done = _done_paths(previous, args.retry_errors)
+    todo = []
+    for rel in walk(root, include, exclude):
+        if done and (rel, _file_sha(root, rel)) in done:
+            continue
+        todo.append(rel)
+    print(f'{len(todo)} file(s) to analyse, {len(previous)} record(s) already in {args.output}', file=sys.stderr)
+
+    limiter = multiprocessing.Semaphore(max(args.llm_concurrency, 1))
+    finished = 0
+    interrupted = False
+    with _open_output(args.output, resume) as out:
+        executor = ProcessPoolExecutor(max_workers=max(args.jobs, 1), initializer=_init_worker,
+                                       initargs=(limiter, log_level))
+        try:
+            futures = [executor.submit(analyze_path, root, rel, args.mode, features, api_key, key_source, args.max_bytes)
+                       for rel in todo]
+            for future in as_completed(futures):
+                record = future.result()
+                out.write(json.dumps(record, default=str) + '\n')
+                out.flush()
+                finished += 1
+                if args.verbose or record['status'] != 'ok':
+                    print(f'[{finished}/{len(todo)}] {record["status"]:<7} {record["path"]}', file=sys.stderr)
+        except KeyboardInterrupt:
+            interrupted = True
+            print(f'\ninterrupted after {finished} file(s); run again to resume', file=sys.stderr)
+        finally:
+            executor.shutdown(wait=not interrupted, cancel_futures=True)
+        os.fsync(out.fileno())
+
+    summary = aggregate(read_records(args.output))
+    print(json.dumps(summary, indent=2))
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+            f.write('\n')
+    return 130 if interrupted else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,13 +2,35 @@
 
 #bootstraps ASGI app
 
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from routers import analyze
+from services.instrumentation import IMPORT_SECONDS
 
-app = FastAPI(title="Code Analysis API", version="1.0")
+# the LLM and PDF stacks load on first use (or during warmup), so this should stay small
+_import_started = time.perf_counter()
+from routers import analyze, observability  # noqa: E402
+from services.pdf_jobs import shutdown_pdf_pool  # noqa: E402
+from services.warmup import start_warmup  # noqa: E402
+from services.loop_monitor import start_loop_monitor, stop_loop_monitor  # noqa: E402
+IMPORT_SECONDS.set(time.perf_counter() - _import_started, module="routers")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_warmup()
+    monitor = start_loop_monitor()
+    yield
+    await stop_loop_monitor(monitor)
+    shutdown_pdf_pool()
+
+
+app = FastAPI(title="Code Analysis API", version="1.0", lifespan=lifespan)
 
 # used to keep code modular and testable
 app.include_router(analyze.router, prefix="/api/v1")
+# /metrics stays unversioned so scrapers use the conventional path
+app.include_router(observability.router)
 
 from fastapi.middleware.cors import CORSMiddleware
 
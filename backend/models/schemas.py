@@ -1,6 +1,6 @@
 # Pydantic request/response models
 
-from typing import Optional, List, Dict, Any, Literal
+from typing import Optional, List, Dict, Any, Literal, Union
 from pydantic import BaseModel, Field, validator
 
 class CommentModel(BaseModel):
@@ -98,9 +98,13 @@ class MetricsModel(BaseModel):
     lines: Optional[int] = None
     func_count: Optional[int] = None
     class_count: Optional[int] = None
+    # brace languages only (tokenizer metrics); pylint_score / coding_standards are Python only
+    max_nesting_depth: Optional[int] = None
+    language: Optional[str] = None
 
 class AnalyzeResponse(BaseModel):
-    summary: Optional[SummaryModel] = None
+    # summary is an empty string when LLM features were disabled mid-request
+    summary: Optional[Union[SummaryModel, str]] = None
     summary_validation_errors: Optional[List[str]] = None
     summary_error: Optional[str] = None
 
@@ -110,24 +114,30 @@ class AnalyzeResponse(BaseModel):
     comments: Optional[List[CommentModel]] = None
     comments_validation_errors: Optional[List[str]] = None
     comments_error: Optional[str] = None
-    comments_raw: Optional[str] = None
 
     tags: Optional[List[str]] = None
     tags_validation_errors: Optional[List[str]] = None
     tags_error: Optional[str] = None
-    tags_raw: Optional[str] = None
 
     docs: Optional[List[str]] = None
     docs_links: Optional[List[Dict[str, Any]]] = None
     docs_validation_errors: Optional[List[str]] = None
     docs_error: Optional[str] = None
-    docs_raw: Optional[str] = None
 
     # LLM disabled / quota metadata
     llm_disabled: Optional[bool] = None
     llm_disabled_reason: Optional[str] = None
     llm_retry_after_seconds: Optional[float] = None
     llm_disabled_key_source: Optional[str] = None
+    llm_error: Optional[str] = None
+    # tokens used by this request's LLM calls, per feature and in total (absent when none were made)
+    llm_usage: Optional[Dict[str, Any]] = None
+
+    # set when a session re-analysis only re-reviewed the changed regions
+    incremental: Optional[Dict[str, Any]] = None
+
+    # per-stage wall time in milliseconds, only when requested with ?timings=true
+    timings: Optional[Dict[str, float]] = None
 
 # helper typing aliases
 CommentList = List[CommentModel]
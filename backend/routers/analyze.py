@@ -2,18 +2,34 @@
 """Routes for file analysis and lightweight history storage.
 
 This router exposes the endpoints used by the frontend: /analyze, /history, /export and /health.
+/export and /history/export also stream SARIF, JSON Lines and Markdown (?format=).
 It centralizes API-key extraction and keeps behavior stable while simplifying code paths.
 """
 
-from fastapi import APIRouter, UploadFile, Form, HTTPException, Body, Request
-from typing import Optional, Tuple
+from fastapi import APIRouter, UploadFile, Form, HTTPException, Body, Request, Query
+from typing import Optional, Tuple, Set
+import asyncio
+import functools
 import json
-from services.analyzer import run_analysis
-from utils.file_utils import validate_file_lines
-from services.history_store import list_history, save_entry, clear_history
+import datetime
+import os
+from services.sessions import analyze_in_session, check_session_key, SessionKeyMismatch
+from services.result_cache import cached_analysis
+from utils.file_utils import read_upload_text, UploadRejected
+from services.history_store import list_history_page, list_history_index, get_entry, save_entry, clear_history, history_stats, iter_entries
+from services.history_store import FILTER_KEYS as HISTORY_FILTER_KEYS
 import logging
 from fastapi.responses import StreamingResponse
-from services.pdf_exporter import build_pdf_report
+from services.pdf_jobs import (render_pdf, render_pdf_file, write_report_file, iter_report_file,
+                               build_report_bytes, is_large_report)
+from services.exporter import EXPORT_FORMATS, normalize_format, iter_export
+from models.schemas import AnalyzeResponse
+from utils.responses import json_response
+from services.instrumentation import timed, collect_timings, write_trace, record_cancelled
+from services.usage import collect_usage
+from services.cancellation import CancelToken, AnalysisCancelled, cancel_scope, register_session, release_session
+from starlette.concurrency import run_in_threadpool
+from services.profiling import start_profile, finish_profile, profiled
 
 router_logger = logging.getLogger("backend.routers.analyze")
 
@@ -36,78 +52,300 @@ def _extract_api_key(request: Optional[Request], form_key: Optional[str]) -> Tup
     return (auth or None), 'header'
 
 
-@router.post("/analyze")
+# response field groups selectable via ?fields=, e.g. "metrics" -> metrics, metrics_error
+_RESPONSE_FIELDS = list(AnalyzeResponse.__fields__.keys())
+_FIELD_GROUPS = {}
+for _name in _RESPONSE_FIELDS:
+    _FIELD_GROUPS.setdefault(_name.split('_', 1)[0], set()).add(_name)
+    _FIELD_GROUPS.setdefault(_name, set()).add(_name)
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """Expand a comma-separated fields selector into response keys; None means all fields."""
+    if not fields:
+        return None
+    selected = set()
+    for f in fields.split(','):
+        f = f.strip().lower()
+        if not f:
+            continue
+        if f not in _FIELD_GROUPS:
+            raise HTTPException(status_code=400, detail=f"Unknown field '{f}'.")
+        selected |= _FIELD_GROUPS[f]
+    return selected or None
+
+
+# how often a running analysis checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+def _run_analysis_cancellable(token: CancelToken, profile, analyze, *args, **kwargs):
+    # runs in a worker thread: the profiler and the cancel token both need to live in this thread
+    with cancel_scope(token), profiled(profile):
+        return analyze(*args, **kwargs)
+
+
+async def _await_unless_disconnected(request: Request, task: asyncio.Future, token: CancelToken):
+    """Await the analysis, cancelling its token as soon as the client goes away."""
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if not token.cancelled and await request.is_disconnected():
+                router_logger.info("Client disconnected; cancelling analysis")
+                token.cancel("client_disconnected")
+    except asyncio.CancelledError:
+        # the handler itself was cancelled (e.g. server shutdown): stop the worker too
+        token.cancel("server_cancelled")
+        raise
+
+
+def _shape_response(results: dict, include: Optional[Set[str]] = None) -> dict:
+    """Project analysis results onto AnalyzeResponse keys, dropping top-level None values.
+
+    The results are not re-validated through AnalyzeResponse: each feature was already validated
+    by services/validators, and a second pydantic pass over large comment lists is what this
+    route avoids. Nested values are sent as produced.
+    """
+    out = {}
+    for name in _RESPONSE_FIELDS:
+        if include is not None and name not in include:
+            continue
+        v = results.get(name)
+        if v is not None:
+            out[name] = v
+    return out
+
+
+# the handler returns a pre-serialized Response, so FastAPI never applies a response_model; the
+# schema is declared for the OpenAPI docs only
+@router.post("/analyze", responses={200: {"model": AnalyzeResponse, "description": "Analysis results"}})
 async def analyze_file(
     request: Request,
     file: UploadFile,
     mode: str = Form("cloud"),
     features: str = Form("{}"),
     api_key: Optional[str] = Form(None),
+    session_id: Optional[str] = Form(None),
+    request_id: Optional[str] = Form(None),
+    incremental: bool = Form(True),
+    fields: Optional[str] = None,
+    want_timings: bool = Query(False, alias='timings'),
 ):
-    """Analyze uploaded file. Returns a JSON object with summary, metrics, comments, tags, docs, etc."""
-    content = (await file.read()).decode("utf-8")
+    """Analyze uploaded file. Returns a JSON object with summary, metrics, comments, tags, docs, etc.
 
-    if not validate_file_lines(content):
-        raise HTTPException(status_code=400, detail="File exceeds 500 lines limit.")
+    Pass ?fields=metrics,comments to receive only those groups; None-valued keys are omitted.
+    Per-stage timings are always sent in the Server-Timing header and, with ?timings=true, in the body.
+    The analysis is abandoned if the client disconnects; with a session_id, a newer submission from the
+    same session supersedes (cancels) the older one, which then gets a 409. Sessions also keep the last
+    result, so a resubmission only re-reviews the changed functions (send incremental=false for a full pass);
+    a session is bound to the API key that opened it, and other keys get a 403.
+    """
+    include = _parse_fields(fields)
 
-    try:
-        features_dict = json.loads(features)
-    except Exception:
-        features_dict = {}
+    # spans from every timed() stage below (router, analyzer, metrics, gemini client) land here
+    with collect_timings() as timings, collect_usage() as usage:
+        # stream the upload with size/line caps; rejects binary or non UTF-8 content early
+        try:
+            with timed("upload_decode"):
+                content = await read_upload_text(file)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+
+        try:
+            features_dict = json.loads(features)
+        except Exception:
+            features_dict = {}
+
+        used_key, key_source = _extract_api_key(request, api_key)
+
+        try:
+            llm_enabled = (mode == 'cloud') and bool(used_key)
+            router_logger.info("analyze request: mode=%s, key_source=%s, llm_enabled=%s, file_len=%d",
+                               mode, key_source, llm_enabled, len(content))
+        except Exception:
+            pass
 
-    used_key, key_source = _extract_api_key(request, api_key)
+        # operator-only: X-Profile header, honoured when ENABLE_REQUEST_PROFILING is set
+        profile = start_profile(request, 'analyze')
+        token = CancelToken()
+        analyze = functools.partial(cached_analysis, filename=file.filename)
+        if session_id:
+            # before register_session: another key's submission must not supersede the owner's request
+            try:
+                check_session_key(session_id, used_key)
+            except SessionKeyMismatch:
+                raise HTTPException(status_code=403, detail='session belongs to another API key')
+            register_session(session_id, request_id, token)
+            analyze = functools.partial(analyze_in_session, session_id, file.filename, incremental=incremental)
+        try:
+            task = asyncio.ensure_future(run_in_threadpool(
+                _run_analysis_cancellable, token, profile, analyze, content, features_dict, mode,
+                api_key=used_key, api_key_source=key_source))
+            results = await _await_unless_disconnected(request, task, token)
+        except SessionKeyMismatch:
+            # the session changed hands between the check above and the analysis
+            raise HTTPException(status_code=403, detail='session belongs to another API key')
+        except AnalysisCancelled as e:
+            record_cancelled(e.reason, e.stage)
+            router_logger.info("analysis cancelled: reason=%s, stage=%s, request_id=%s", e.reason, e.stage, request_id)
+            # 499 (client closed request) is never seen by the client; superseded requests may still be listening
+            status = 409 if e.reason == 'superseded' else 499
+            raise HTTPException(status_code=status, detail=f'analysis cancelled: {e.reason}')
+        finally:
+            if session_id:
+                release_session(session_id, token)
 
+    headers = {'Server-Timing': timings.server_timing()}
+    headers.update(finish_profile(profile))
+    # only the calls made for this request; cached and reused results cost nothing
+    if usage.calls:
+        results['llm_usage'] = usage.as_dict()
+    if want_timings:
+        results['timings'] = timings.totals_ms()
+        if include is not None:
+            include.add('timings')
+    write_trace('analyze', timings, mode=mode, key_source=key_source, file_len=len(content))
+
+    # results were already validated per feature; avoid a second pydantic pass over large comment lists
+    return json_response(request, _shape_response(results, include), headers=headers)
+
+
+@router.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+def _parse_time(value: Optional[str], name: str) -> Optional[float]:
+    """Accept epoch seconds or an ISO-8601 date/datetime (naive values are UTC)."""
+    if value is None or value == '':
+        return None
     try:
-        llm_enabled = (mode == 'cloud') and bool(used_key)
-        router_logger.info("analyze request: mode=%s, key_source=%s, llm_enabled=%s, file_len=%d",
-                           mode, key_source, llm_enabled, len(content))
-    except Exception:
+        return float(value)
+    except ValueError:
         pass
+    try:
+        dt = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"invalid {name}: expected epoch seconds or ISO-8601")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.timestamp()
+
 
-    results = run_analysis(content, features_dict, mode, api_key=used_key, api_key_source=key_source)
-
-    normalized = {
-        "summary": results.get("summary"),
-        "summary_validation_errors": results.get("summary_validation_errors"),
-        "summary_error": results.get("summary_error"),
-        "metrics": results.get("metrics"),
-        "metrics_error": results.get("metrics_error"),
-        "comments": results.get("comments"),
-        "comments_validation_errors": results.get("comments_validation_errors"),
-        "comments_error": results.get("comments_error"),
-        "comments_raw": results.get("comments_raw"),
-        "tags": results.get("tags"),
-        "tags_validation_errors": results.get("tags_validation_errors"),
-        "tags_error": results.get("tags_error"),
-        "tags_raw": results.get("tags_raw"),
-        "docs": results.get("docs"),
-        "docs_links": results.get("docs_links"),
-        "docs_validation_errors": results.get("docs_validation_errors"),
-        "docs_error": results.get("docs_error"),
-        "docs_raw": results.get("docs_raw"),
-        "llm_disabled": results.get("llm_disabled"),
-        "llm_disabled_reason": results.get("llm_disabled_reason"),
-        "llm_retry_after_seconds": results.get("llm_retry_after_seconds"),
-        "llm_error": results.get("llm_error"),
-        "llm_disabled_key_source": results.get("llm_disabled_key_source"),
+def _history_filters(request: Request, since, until, file_name, tag, severity, category, q) -> dict:
+    filters = {
+        'since': _parse_time(since, 'since'),
+        'until': _parse_time(until, 'until'),
+        'file_name': file_name,
+        'tag': tag,
+        'severity': severity,
+        'category': category,
+        'q': q,
     }
+    # metric thresholds are open-ended (<metric>_min/_max), so read them from the raw query string
+    for key in HISTORY_FILTER_KEYS:
+        if key.endswith(('_min', '_max')) and key in request.query_params:
+            try:
+                filters[key] = float(request.query_params[key])
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"invalid {key}: expected a number")
+    return filters
+
 
+def _export_format(fmt: Optional[str]) -> str:
+    normalized = normalize_format(fmt)
+    if normalized is None:
+        raise HTTPException(status_code=400, detail=f"unsupported format; expected one of: {', '.join(EXPORT_FORMATS)}")
     return normalized
 
 
-@router.get("/health")
-async def health():
-    return {"status": "ok"}
+def _export_response(fmt: str, chunks, basename: str) -> StreamingResponse:
+    media_type, ext = EXPORT_FORMATS[fmt]
+    headers = {'Content-Disposition': f'attachment; filename="{basename}.{ext}"'}
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
 
 
 @router.get('/history')
-async def get_history(limit: int = 50):
-    items = list_history(limit)
-    return {'items': items}
+def get_history(
+    request: Request,
+    limit: int = 50,
+    before: Optional[int] = None,
+    full: bool = False,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    file_name: Optional[str] = None,
+    tag: Optional[str] = None,
+    severity: Optional[str] = None,
+    category: Optional[str] = None,
+    q: Optional[str] = None,
+):
+    """List history, newest first (sync: the SQLite reads run in the threadpool, not on the event loop).
+
+    Filters: since/until (epoch or ISO-8601), file_name, tag, severity, category, q (full text over
+    comment messages and summaries) and metric thresholds <metric>_min / <metric>_max for
+    cc_avg, mi_avg, pylint_score, naming_quality and lines.
+    """
+    filters = _history_filters(request, since, until, file_name, tag, severity, category, q)
+    # lightweight index rows by default; full=true returns complete payloads (older clients)
+    # keyset pagination: pass the returned next_before to fetch the following (older) page
+    if full:
+        items, next_before = list_history_page(limit, before_id=before, filters=filters)
+    else:
+        items, next_before = list_history_index(limit, before_id=before, filters=filters)
+    return {'items': items, 'next_before': next_before}
+
+
+@router.get('/history/stats')
+def get_history_stats(granularity: str = 'day', file_name: Optional[str] = None,
+                      since: Optional[str] = None, until: Optional[str] = None):
+    # declared before /history/{entry_id} so "stats" is not parsed as an id
+    try:
+        buckets = history_stats(granularity, file_name=file_name,
+                                since=_parse_time(since, 'since'), until=_parse_time(until, 'until'))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {'granularity': granularity, 'file_name': file_name, 'buckets': buckets}
+
+
+@router.get('/history/export')
+async def export_history(
+    request: Request,
+    fmt: str = Query(..., alias='format'),
+    limit: Optional[int] = None,
+    before: Optional[int] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    file_name: Optional[str] = None,
+    tag: Optional[str] = None,
+    severity: Optional[str] = None,
+    category: Optional[str] = None,
+    q: Optional[str] = None,
+):
+    """Batch-export matching history entries (same filters as GET /history) as sarif, jsonl or markdown.
+
+    Entries are read page by page while the response streams, so large histories are never
+    loaded into memory at once.
+    """
+    fmt = _export_format(fmt)
+    filters = _history_filters(request, since, until, file_name, tag, severity, category, q)
+    entries = iter_entries(filters, before_id=before, limit=limit)
+    return _export_response(fmt, iter_export(fmt, entries), 'code_review_history')
+
+
+@router.get('/history/{entry_id}')
+def get_history_entry(entry_id: int):
+    entry = get_entry(entry_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail='history entry not found')
+    return entry
 
 
 @router.post('/history')
-async def post_history(payload: dict = Body(...)):
+def post_history(payload: dict = Body(...)):
+    # sync so the write (BEGIN IMMEDIATE, up to busy_timeout when workers contend) waits in the
+    # threadpool instead of stalling every request on this worker's event loop
     if not isinstance(payload, dict):
         raise HTTPException(status_code=400, detail='invalid payload')
     saved = save_entry(payload)
@@ -115,21 +353,47 @@ async def post_history(payload: dict = Body(...)):
 
 
 @router.delete('/history')
-async def delete_history():
+def delete_history():
     clear_history()
     return {'status': 'cleared'}
 
 
 @router.post('/export')
-async def export_report(payload: dict = Body(...)):
-    # payload should be the analysis JSON object; generate a PDF and return as attachment
+async def export_report(request: Request, payload: dict = Body(...), fmt: str = Query('pdf', alias='format'),
+                        large: Optional[bool] = None, group: Optional[str] = None):
+    # payload should be the analysis JSON object; generate a PDF (default) and return as attachment
+    # ?format=sarif|jsonl|markdown streams a machine-readable export instead
+    # ?large=1 forces the chunked large-report layout (default: by comment count); ?group=severity groups issues
     if not isinstance(payload, dict):
         raise HTTPException(status_code=400, detail='invalid payload')
+    if fmt.strip().lower() != 'pdf':
+        fmt = _export_format(fmt)
+        return _export_response(fmt, iter_export(fmt, [payload]), 'code_review_report')
+    if group not in (None, '', 'severity'):
+        raise HTTPException(status_code=400, detail="group must be 'severity'")
+    group_by_severity = group == 'severity'
+    if large is None:
+        large = is_large_report(payload)
     try:
-        pdf_bytes = build_pdf_report(payload)
+        profile = start_profile(request, 'export')
+        headers = {'Content-Disposition': 'attachment; filename="code_review_report.pdf"'}
+        if profile is not None:
+            # profiled exports render inline (uncached) so the profiler sees the real work
+            with profiled(profile):
+                if large:
+                    path = write_report_file(payload, group_by_severity)
+                else:
+                    pdf_bytes = build_report_bytes(payload, group_by_severity)
+        elif large:
+            path = await render_pdf_file(payload, group_by_severity)
+        else:
+            pdf_bytes = await render_pdf(payload, group_by_severity)
+        headers.update(finish_profile(profile))
+        if large:
+            # large reports stream from a spooled temp file that is removed once sent
+            headers['Content-Length'] = str(os.path.getsize(path))
+            return StreamingResponse(iter_report_file(path), media_type='application/pdf', headers=headers)
         # return a StreamingResponse backed by the raw bytes
-        return StreamingResponse(iter([pdf_bytes]), media_type='application/pdf', headers={
-            'Content-Disposition': 'attachment; filename="code_review_report.pdf"'
-        })
+        return StreamingResponse(iter([pdf_bytes]), media_type='application/pdf', headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,45 @@
+"""Operational endpoints that live outside the versioned API (scraped by infrastructure, not the frontend)."""
+
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, Query
+from fastapi.responses import PlainTextResponse, FileResponse, JSONResponse
+from services.instrumentation import render_metrics
+from services.warmup import readiness
+from services.usage import usage_authorized, usage_report
+from services.profiling import PROFILING_ENABLED, profiling_requested, profile_path
+
+router = APIRouter()
+
+
+@router.get('/metrics', response_class=PlainTextResponse)
+async def metrics():
+    # Prometheus text exposition format 0.0.4
+    return PlainTextResponse(render_metrics(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@router.get('/ready')
+async def ready():
+    # 503 until the startup warmup (WARMUP_ON_STARTUP) has finished; /api/v1/health is liveness only
+    status = readiness()
+    return JSONResponse(status, status_code=200 if status['ready'] else 503)
+
+
+@router.get('/usage')
+def usage(request: Request, days: int = Query(7, ge=1, le=400), key_id: Optional[str] = None,
+          key_source: Optional[str] = None):
+    # LLM token usage per UTC day, key (hashed), key source and feature; sync so SQLite runs in the threadpool.
+    # Spend per key is not public: off unless USAGE_TOKEN is set, then X-Usage-Token must match
+    if not usage_authorized(request):
+        raise HTTPException(status_code=404, detail='not found')
+    return usage_report(days, key=key_id, key_source=key_source)
+
+
+@router.get('/profiles/{profile_id}')
+async def get_profile(request: Request, profile_id: str):
+    # same gate as taking a profile: server flag plus X-Profile (and X-Profile-Token when configured)
+    if not PROFILING_ENABLED or not profiling_requested(request):
+        raise HTTPException(status_code=404, detail='not found')
+    path = profile_path(profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail='not found')
+    return FileResponse(path, media_type='application/octet-stream', filename=profile_id)
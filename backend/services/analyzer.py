@@ -1,26 +1,120 @@
 from typing import Optional
 import json
 from .metrics import analyze_metrics
-from .gemini_client import get_summary, get_comments, get_tags, get_library_docs, QuotaExceededError
-from . import gemini_client
+from .languages import detect_language
+from .llm_errors import QuotaExceededError, BudgetExceededError
 from .validators import validate_comments, validate_tags, validate_summary, validate_docs
+from .instrumentation import timed, record_quota_error, timed_import, record_budget_exceeded
+from .usage import budget_exceeded, seconds_until_reset
+from .cancellation import check_cancelled
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def run_analysis(code: str, features: dict, mode: str = "local", api_key: Optional[str] = None, api_key_source: Optional[str] = None):
+# simple static mapping for common libraries / packages -> canonical docs
+DOC_URLS = {
+    'requests': 'https://docs.python-requests.org/',
+    'numpy': 'https://numpy.org/doc/',
+    'pandas': 'https://pandas.pydata.org/docs/',
+    'flask': 'https://flask.palletsprojects.com/en/latest/',
+    'django': 'https://docs.djangoproject.com/en/stable/',
+    'sqlalchemy': 'https://docs.sqlalchemy.org/',
+    'react': 'https://reactjs.org/docs/getting-started.html',
+    'express': 'https://expressjs.com/',
+    'lodash': 'https://lodash.com/docs/',
+    'axios': 'https://axios-http.com/docs/intro',
+    'matplotlib': 'https://matplotlib.org/stable/contents.html',
+    'bits/stdc++.h': 'https://en.cppreference.com/w/cpp/header/bits/stdc++.h',
+}
+
+
+def _llm():
+    # google-genai is slow to import; load the client only when a cloud analysis needs it
+    return timed_import('.gemini_client', __package__)
+
+
+def _make_link(name: str, url: str = None, snippet: str = None, source: str = 'heuristic', confidence: float = 0.6):
+    lid = (name or '')
+    return {
+        'id': lid,
+        'name': name,
+        'url': url or None,
+        'canonical_url': url or None,
+        'snippet': snippet or None,
+        'source': source,
+        'confidence': confidence
+    }
+
+
+def _build_docs_links(raw_docs: list) -> list:
+    """Attach probable documentation URLs to docs entries (LLM-provided, known mapping or search link)."""
+    docs_links = []
+    seen = set()
+    for d in raw_docs:
+        try:
+            name = None
+            url = None
+            snippet = None
+            if isinstance(d, dict):
+                name = d.get('name') or d.get('title') or d.get('library')
+                url = d.get('url')
+                snippet = d.get('snippet') or d.get('description')
+            else:
+                s = str(d)
+                snippet = s if len(s) < 200 else s[:200] + '...'
+                if '—' in s:
+                    name = s.split('—', 1)[0].strip()
+                elif ' - ' in s:
+                    name = s.split(' - ', 1)[0].strip()
+                else:
+                    # take first token as a guess
+                    name = s.split()[0].strip().strip('[],()')
+
+            if not name:
+                continue
+            key = name.lower()
+            if key in seen:
+                continue
+            seen.add(key)
+
+            if url:
+                docs_links.append(_make_link(name=name, url=url, snippet=snippet, source='llm', confidence=0.9))
+                continue
+
+            # if we have a known canonical mapping
+            if key in DOC_URLS:
+                docs_links.append(_make_link(name=name, url=DOC_URLS[key], snippet=snippet, source='known', confidence=0.95))
+                continue
+
+            # special handling: bits/stdc++.h or stdc++ variations
+            if 'bits/stdc' in key or 'stdc++' in key:
+                docs_links.append(_make_link(name='bits/stdc++.h', url=DOC_URLS.get('bits/stdc++.h'), snippet='GCC-specific convenience header', source='known', confidence=0.9))
+                continue
+
+            # fallback: provide a google search link as url
+            search_url = f"https://www.google.com/search?q={key.replace(' ', '+')}"
+            docs_links.append(_make_link(name=name, url=search_url, snippet=snippet, source='search', confidence=0.5))
+        except Exception:
+            continue
+    return docs_links
+
+
+def run_analysis(code: str, features: dict, mode: str = "local", api_key: Optional[str] = None, api_key_source: Optional[str] = None,
+                 filename: Optional[str] = None):
     """
-    Orchestrate analysis. Always runs local static metrics.
+    Orchestrate analysis. Always runs local static metrics (for the language of `filename`, see services/languages).
     If mode == "cloud" and api_key provided, use Gemini for summary/comments.
     Returns a dict; LLM errors are returned in 'llm_disabled' fields rather than raising.
     """
     results = {}
 
     # Always compute local metrics
+    check_cancelled("local_metrics")
     if features.get("metrics", True):
         try:
-            results["metrics"] = analyze_metrics(code)
+            with timed("local_metrics"):
+                results["metrics"] = analyze_metrics(code, filename)
         except Exception as e:
             logger.exception("Local metrics analysis failed")
             results["metrics_error"] = str(e)
@@ -31,13 +125,32 @@ def run_analysis(code: str, features: dict, mode: str = "local", api_key: Option
     if use_llm:
         llm_disabled_reason = None
         retry_after = None
+        # analyzer feature flag -> LLM feature (as routed and accounted in the gemini client)
+        llm_features = [name for flag, name in (("summary", "summary"), ("review", "comments"), ("tags", "tags"),
+                                                ("docs", "docs")) if features.get(flag, True)]
+        context = None
+        # decides which comment lines the prompt builder may drop (`#include` is code in C)
+        language = (results.get("metrics") or {}).get("language") or detect_language(filename, code)
 
         try:
+            # checked once per analysis: the one that crosses the budget still runs all its features
+            if llm_features and budget_exceeded(api_key, api_key_source):
+                record_budget_exceeded(api_key_source)
+                raise BudgetExceededError("Daily LLM token budget exceeded for this API key",
+                                          seconds_until_reset(), key_source=api_key_source)
+            # one client and one provider-side copy of the file for all feature calls; a cancelled
+            # run skips close() and leaves its cache to expire
+            if llm_features:
+                context = _llm().open_context(code, api_key=api_key, api_key_source=api_key_source, features=llm_features,
+                                              language=language)
+
             # SUMMARY
             if features.get("summary", True):
                 try:
                     logger.info("Calling LLM summary: api_key_provided=%s, api_key_source=%s", bool(api_key), api_key_source)
-                    summary_text = get_summary(code, api_key=api_key, api_key_source=api_key_source)
+                    check_cancelled("llm_summary")
+                    with timed("llm_summary"):
+                        summary_text = _llm().get_summary(code, api_key=api_key, api_key_source=api_key_source, context=context, language=language)
                     parsed = None
                     try:
                         if isinstance(summary_text, str) and (summary_text.strip().startswith("{") or summary_text.strip().startswith("[")):
@@ -63,7 +176,9 @@ def run_analysis(code: str, features: dict, mode: str = "local", api_key: Option
             if features.get("review", True):
                 try:
                     logger.info("Calling LLM comments: api_key_provided=%s, api_key_source=%s", bool(api_key), api_key_source)
-                    comments_text = get_comments(code, results.get("metrics", {}), api_key=api_key, api_key_source=api_key_source)
+                    check_cancelled("llm_comments")
+                    with timed("llm_comments"):
+                        comments_text = _llm().get_comments(code, results.get("metrics", {}), api_key=api_key, api_key_source=api_key_source, context=context, language=language)
                     parsed = None
                     try:
                         if isinstance(comments_text, str) and (comments_text.strip().startswith("[") or comments_text.strip().startswith("{")):
@@ -89,7 +204,9 @@ def run_analysis(code: str, features: dict, mode: str = "local", api_key: Option
             if features.get("tags", True):
                 try:
                     logger.info("Calling LLM tags: api_key_provided=%s, api_key_source=%s", bool(api_key), api_key_source)
-                    tags_text = get_tags(code, results.get("metrics", {}), api_key=api_key, api_key_source=api_key_source)
+                    check_cancelled("llm_tags")
+                    with timed("llm_tags"):
+                        tags_text = _llm().get_tags(code, results.get("metrics", {}), api_key=api_key, api_key_source=api_key_source, context=context, language=language)
                     parsed = None
                     try:
                         if isinstance(tags_text, str) and tags_text.strip().startswith("["):
@@ -113,7 +230,9 @@ def run_analysis(code: str, features: dict, mode: str = "local", api_key: Option
             if features.get("docs", True):
                 try:
                     logger.info("Calling LLM docs: api_key_provided=%s, api_key_source=%s", bool(api_key), api_key_source)
-                    docs_text = get_library_docs(code, api_key=api_key, api_key_source=api_key_source)
+                    check_cancelled("llm_docs")
+                    with timed("llm_docs"):
+                        docs_text = _llm().get_library_docs(code, api_key=api_key, api_key_source=api_key_source, context=context, language=language)
                     parsed = None
                     try:
                         if isinstance(docs_text, str) and (docs_text.strip().startswith("{") or docs_text.strip().startswith("[")):
@@ -141,11 +260,15 @@ def run_analysis(code: str, features: dict, mode: str = "local", api_key: Option
             key_src = getattr(exc, 'key_source', None)
             # annotate which key source triggered the quota
             results["llm_disabled_key_source"] = key_src
+            if not isinstance(exc, BudgetExceededError):
+                record_quota_error(key_src)
         except Exception as exc:
             # unknown exception bubbled up
             logger.exception("Unhandled exception during LLM calls")
             results["llm_error"] = str(exc)
             llm_disabled_reason = str(exc)
+        if context is not None:
+            context.close()
 
         if llm_disabled_reason:
             # mark in results and provide heuristic-only fallbacks for LLM-driven fields
@@ -191,90 +314,8 @@ def run_analysis(code: str, features: dict, mode: str = "local", api_key: Option
             results["docs"] = []
     # Post-process docs to attach probable documentation URLs for known libraries
     try:
-        docs_links = []
-        # simple static mapping for common libraries / packages -> canonical docs
-        DOC_URLS = {
-            'requests': 'https://docs.python-requests.org/',
-            'numpy': 'https://numpy.org/doc/',
-            'pandas': 'https://pandas.pydata.org/docs/',
-            'flask': 'https://flask.palletsprojects.com/en/latest/',
-            'django': 'https://docs.djangoproject.com/en/stable/',
-            'sqlalchemy': 'https://docs.sqlalchemy.org/',
-            'react': 'https://reactjs.org/docs/getting-started.html',
-            'express': 'https://expressjs.com/',
-            'lodash': 'https://lodash.com/docs/',
-            'axios': 'https://axios-http.com/docs/intro',
-            'matplotlib': 'https://matplotlib.org/stable/contents.html',
-            'bits/stdc++.h': 'https://en.cppreference.com/w/cpp/header/bits/stdc++.h',
-        }
-
-        seen = set()
-        raw_docs = results.get('docs') or []
-
-        def make_link(name: str, url: str = None, snippet: str = None, source: str = 'heuristic', confidence: float = 0.6):
-            lid = (name or '')
-            return {
-                'id': lid,
-                'name': name,
-                'url': url or None,
-                'canonical_url': url or None,
-                'snippet': snippet or None,
-                'source': source,
-                'confidence': confidence
-            }
-
-        for d in raw_docs:
-            try:
-                name = None
-                url = None
-                snippet = None
-                if isinstance(d, dict):
-                    name = d.get('name') or d.get('title') or d.get('library')
-                    url = d.get('url')
-                    snippet = d.get('snippet') or d.get('description')
-                else:
-                    s = str(d)
-                    snippet = s if len(s) < 200 else s[:200] + '...'
-                    if '—' in s:
-                        name = s.split('—', 1)[0].strip()
-                    elif ' - ' in s:
-                        name = s.split(' - ', 1)[0].strip()
-                    else:
-                        # take first token as a guess
-                        name = s.split()[0].strip().strip('[],()')
-
-                if not name:
-                    continue
-                key = name.lower()
-                if key in seen:
-                    continue
-                seen.add(key)
-
-                if url:
-                    docs_links.append(make_link(name=name, url=url, snippet=snippet, source='llm', confidence=0.9))
-                    continue
-
-                # if we have a known canonical mapping
-                if key in DOC_URLS:
-                    docs_links.append(make_link(name=name, url=DOC_URLS[key], snippet=snippet, source='known', confidence=0.95))
-                    continue
-
-                # special handling: bits/stdc++.h or stdc++ variations
-                if 'bits/stdc' in key or 'stdc++' in key:
-                    docs_links.append(make_link(name='bits/stdc++.h', url=DOC_URLS.get('bits/stdc++.h'), snippet='GCC-specific convenience header', source='known', confidence=0.9))
-                    continue
-
-                # fallback: provide a google search link as url
-                search_url = f"https://www.google.com/search?q={key.replace(' ', '+')}"
-                docs_links.append(make_link(name=name, url=search_url, snippet=snippet, source='search', confidence=0.5))
-            except Exception:
-                continue
-
-        # also dedupe by canonical_url/name
-        if docs_links:
-            results['docs_links'] = docs_links
-        else:
-            results['docs_links'] = []
+        with timed("docs_links"):
+            results['docs_links'] = _build_docs_links(results.get('docs') or [])
     except Exception:
         results.setdefault('docs_links', [])
     return results
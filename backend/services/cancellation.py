@@ -0,0 +1,154 @@
+"""Cooperative cancellation for analysis runs.
+
+The router gives each /analyze request a CancelToken and runs the analysis in a worker thread
+inside cancel_scope(token). The pipeline checks the token between stages (check_cancelled),
+the pylint subprocess is killed through an on_cancel callback, and LLM calls are waited on
+through CancelToken.call so a cancelled request stops waiting (and issues no further calls)
+instead of finishing work nobody will read.
+
+Tokens are cancelled when the client disconnects or when a newer request from the same
+session supersedes it (see register_session).
+"""
+
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# how often a blocked call re-checks its token
+POLL_SECONDS = 0.1
+
+# LLM calls run here so the calling thread can give up on them; an abandoned call still
+# occupies its worker until the SDK returns, so the pool is sized generously
+_CALL_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get("CANCELLABLE_CALL_WORKERS", "32")), thread_name_prefix="cancellable-call")
+
+
+class AnalysisCancelled(BaseException):
+    """Raised inside a cancelled run.
+
+    Derives from BaseException (like asyncio.CancelledError) so the pipeline's broad
+    `except Exception` fallbacks do not swallow it.
+    """
+
+    def __init__(self, reason: str = "cancelled", stage: Optional[str] = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.stage = stage
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for cb in callbacks:
+            try:
+                cb()
+            except Exception:
+                logger.warning("Cancel callback failed", exc_info=True)
+
+    def on_cancel(self, cb: Callable[[], None]) -> Callable[[], None]:
+        """Run cb when cancelled (immediately if already cancelled); returns an unregister function."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(cb)
+                registered = True
+            else:
+                registered = False
+        if not registered:
+            cb()
+
+        def unregister():
+            with self._lock:
+                if cb in self._callbacks:
+                    self._callbacks.remove(cb)
+        return unregister
+
+    def check(self, stage: Optional[str] = None):
+        if self._event.is_set():
+            raise AnalysisCancelled(self.reason or "cancelled", stage)
+
+    def wait(self, seconds: float) -> bool:
+        """Sleep up to seconds; returns True if cancelled meanwhile."""
+        return self._event.wait(seconds)
+
+    def call(self, fn: Callable, *args, stage: Optional[str] = None, **kwargs):
+        """Run a blocking call in the call pool, abandoning it if the token is cancelled."""
+        self.check(stage)
+        ctx = contextvars.copy_context()
+        future = _CALL_POOL.submit(ctx.run, fn, *args, **kwargs)
+        while True:
+            try:
+                return future.result(timeout=POLL_SECONDS)
+            except FutureTimeout:
+                if self._event.is_set():
+                    future.cancel()
+                    raise AnalysisCancelled(self.reason or "cancelled", stage)
+
+
+_current_token: contextvars.ContextVar = contextvars.ContextVar("code_review_cancel_token", default=None)
+
+
+@contextmanager
+def cancel_scope(token: Optional[CancelToken]):
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def current_token() -> Optional[CancelToken]:
+    return _current_token.get()
+
+
+def check_cancelled(stage: Optional[str] = None):
+    token = _current_token.get()
+    if token is not None:
+        token.check(stage)
+
+
+# session id -> (request id, token) of the newest in-flight analysis for that session
+_sessions: Dict[str, Tuple[Optional[str], CancelToken]] = {}
+_sessions_lock = threading.Lock()
+
+
+def register_session(session_id: str, request_id: Optional[str], token: CancelToken) -> Optional[str]:
+    """Make token the session's active run, cancelling the one it supersedes.
+
+    Returns the superseded request id (or None when nothing was running).
+    """
+    with _sessions_lock:
+        previous = _sessions.get(session_id)
+        _sessions[session_id] = (request_id, token)
+    if previous is None or previous[1] is token:
+        return None
+    prev_request_id, prev_token = previous
+    prev_token.cancel("superseded")
+    logger.info("Session %s: request %s superseded by %s", session_id, prev_request_id, request_id)
+    return prev_request_id or ''
+
+
+def release_session(session_id: str, token: CancelToken):
+    with _sessions_lock:
+        current = _sessions.get(session_id)
+        if current is not None and current[1] is token:
+            del _sessions[session_id]
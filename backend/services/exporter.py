@@ -1,8 +1,221 @@
-"""Exporter helpers (placeholder). This module was removed during cleanup.
+"""Machine-readable exports of analysis results: SARIF 2.1.0, JSON Lines and Markdown.
 
-If you rely on SARIF export or similar functionality, reintroduce the implementation
-or restore from version control. For now this file is intentionally empty to avoid
-accidental imports.
+Every exporter takes an iterable of analysis dicts and yields encoded chunks, one entry at a
+time, so a batch export of history (see history_store.iter_entries) never holds more than one
+payload in memory. Comments map onto SARIF as: category -> rule, severity -> level,
+line/column -> region.
 """
 
-__all__ = []
\ No newline at end of file
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from utils.responses import dumps
+
+TOOL_NAME = 'llm-code-review-assistant'
+TOOL_VERSION = '1.0'
+SARIF_SCHEMA = 'https://json.schemastore.org/sarif-2.1.0.json'
+DEFAULT_ARTIFACT = 'uploaded_file'
+
+SARIF_LEVELS = {'error': 'error', 'warning': 'warning', 'info': 'note'}
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    'sarif': ('application/sarif+json', 'sarif'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'markdown': ('text/markdown; charset=utf-8', 'md'),
+}
+FORMAT_ALIASES = {'md': 'markdown', 'ndjson': 'jsonl', 'json-lines': 'jsonl'}
+
+
+def normalize_format(fmt: Optional[str]) -> Optional[str]:
+    """Resolve a ?format= value to a key of EXPORT_FORMATS, or None if unsupported."""
+    fmt = (fmt or '').strip().lower()
+    fmt = FORMAT_ALIASES.get(fmt, fmt)
+    return fmt if fmt in EXPORT_FORMATS else None
+
+
+def _comments(entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [c for c in entry.get('comments') or [] if isinstance(c, dict)]
+
+
+def _severity(c: Dict[str, Any]) -> str:
+    sev = str(c.get('severity') or 'info').lower()
+    return sev if sev in SARIF_LEVELS else 'info'
+
+
+def _category(c: Dict[str, Any]) -> str:
+    return str(c.get('category') or 'Other')
+
+
+def _positive(value: Any) -> Optional[int]:
+    try:
+        v = int(value)
+    except (TypeError, ValueError):
+        return None
+    return v if v >= 1 else None
+
+
+def _file_name(entry: Dict[str, Any]) -> str:
+    name = entry.get('file_name') or entry.get('fileName') or entry.get('filename')
+    return str(name) if name else DEFAULT_ARTIFACT
+
+
+def _summary_text(entry: Dict[str, Any]) -> str:
+    summary = entry.get('summary')
+    if isinstance(summary, dict):
+        return str(summary.get('summary') or '')
+    return str(summary or '')
+
+
+# --- SARIF ---------------------------------------------------------------------------------
+
+def _rule_id(category: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '-', category.lower()).strip('-') or 'other'
+
+
+def _sarif_run(entry: Dict[str, Any]) -> Dict[str, Any]:
+    comments = _comments(entry)
+    uri = _file_name(entry)
+    rules: List[Dict[str, Any]] = []
+    rule_index: Dict[str, int] = {}
+    results = []
+    for c in comments:
+        category = _category(c)
+        rid = _rule_id(category)
+        if rid not in rule_index:
+            rule_index[rid] = len(rules)
+            rules.append({
+                'id': rid,
+                'name': category,
+                'shortDescription': {'text': f'{category} findings from LLM code review'},
+            })
+        region = {}
+        line = _positive(c.get('line'))
+        if line is not None:
+            region['startLine'] = line
+            column = _positive(c.get('column'))
+            if column is not None:
+                region['startColumn'] = column
+        physical: Dict[str, Any] = {'artifactLocation': {'uri': uri}}
+        if region:
+            physical['region'] = region
+        result = {
+            'ruleId': rid,
+            'ruleIndex': rule_index[rid],
+            'level': SARIF_LEVELS[_severity(c)],
+            'message': {'text': str(c.get('message') or '')},
+            'locations': [{'physicalLocation': physical}],
+            'properties': {'severity': _severity(c), 'category': category},
+        }
+        if c.get('suggestion'):
+            result['properties']['suggestion'] = str(c['suggestion'])
+        results.append(result)
+
+    run: Dict[str, Any] = {
+        'tool': {'driver': {'name': TOOL_NAME, 'version': TOOL_VERSION, 'rules': rules}},
+        'artifacts': [{'location': {'uri': uri}}],
+        'results': results,
+    }
+    properties = {k: entry[k] for k in ('id', 'timestamp', 'metrics', 'tags') if entry.get(k) is not None}
+    summary = _summary_text(entry)
+    if summary:
+        properties['summary'] = summary
+    if properties:
+        run['properties'] = properties
+    return run
+
+
+def iter_sarif(entries: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """One SARIF log with a run per analysis; runs are serialized as they are produced."""
+    yield b'{"$schema":"' + SARIF_SCHEMA.encode() + b'","version":"2.1.0","runs":['
+    first = True
+    for entry in entries:
+        yield (b'' if first else b',') + dumps(_sarif_run(entry))
+        first = False
+    yield b']}'
+
+
+# --- JSON Lines ----------------------------------------------------------------------------
+
+def iter_jsonl(entries: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """An 'analysis' record per entry followed by one 'comment' record per comment."""
+    for entry in entries:
+        file_name = _file_name(entry)
+        head = {
+            'type': 'analysis',
+            'id': entry.get('id'),
+            'timestamp': entry.get('timestamp'),
+            'file_name': file_name,
+            'summary': _summary_text(entry) or None,
+            'metrics': entry.get('metrics'),
+            'tags': entry.get('tags'),
+        }
+        lines = [dumps(head)]
+        for c in _comments(entry):
+            lines.append(dumps({
+                'type': 'comment',
+                'id': entry.get('id'),
+                'file_name': file_name,
+                'line': _positive(c.get('line')),
+                'column': _positive(c.get('column')),
+                'severity': _severity(c),
+                'category': _category(c),
+                'message': c.get('message') or '',
+                'suggestion': c.get('suggestion'),
+            }))
+        yield b'\n'.join(lines) + b'\n'
+
+
+# --- Markdown ------------------------------------------------------------------------------
+
+def _md_cell(value: Any) -> str:
+    return str(value if value is not None else '').replace('|', '\\|').replace('\r', '').replace('\n', '<br>')
+
+
+def _markdown_entry(entry: Dict[str, Any]) -> str:
+    out = [f"## {_md_cell(_file_name(entry))}"]
+    meta = [f"{k}: {entry[k]}" for k in ('id', 'timestamp') if entry.get(k) is not None]
+    if meta:
+        out.append('_' + ', '.join(meta) + '_')
+    summary = _summary_text(entry)
+    if summary:
+        out += ['', '### Summary', '', summary]
+        kps = entry['summary'].get('key_points') if isinstance(entry.get('summary'), dict) else None
+        for kp in kps or []:
+            out.append(f'- {kp}')
+
+    metrics = entry.get('metrics') if isinstance(entry.get('metrics'), dict) else {}
+    if metrics:
+        out += ['', '### Metrics', '', '| Metric | Value |', '| --- | --- |']
+        for k in sorted(metrics):
+            v = metrics[k]
+            out.append(f"| {_md_cell(k)} | {_md_cell(round(v, 2) if isinstance(v, float) else v)} |")
+
+    comments = _comments(entry)
+    out += ['', f'### Issues ({len(comments)})', '']
+    if comments:
+        out += ['| Line | Severity | Category | Message | Suggestion |', '| --- | --- | --- | --- | --- |']
+        for c in comments:
+            out.append('| {} | {} | {} | {} | {} |'.format(
+                _md_cell(c.get('line') or '-'), _severity(c), _md_cell(_category(c)),
+                _md_cell(c.get('message')), _md_cell(c.get('suggestion'))))
+    else:
+        out.append('No issues found.')
+    return '\n'.join(out) + '\n\n'
+
+
+def iter_markdown(entries: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    yield b'# Code Review Report\n\n'
+    for entry in entries:
+        yield _markdown_entry(entry).encode('utf-8')
+
+
+_EXPORTERS = {'sarif': iter_sarif, 'jsonl': iter_jsonl, 'markdown': iter_markdown}
+
+
+def iter_export(fmt: str, entries: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """Stream entries in the given (normalized) format."""
+    return _EXPORTERS[fmt](entries)
+
+
+__all__ = ['EXPORT_FORMATS', 'normalize_format', 'iter_export', 'iter_sarif', 'iter_jsonl', 'iter_markdown']
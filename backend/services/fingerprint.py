@@ -0,0 +1,116 @@
+"""Formatting-insensitive fingerprints of source code.
+
+Python input is parsed and the AST dumped without positions, so whitespace, comments, quote
+style and line wrapping do not change the fingerprint; docstrings can be ignored as well.
+Anything that does not parse as Python (or is known to be another language) falls back to a
+normalized token stream: strings kept, comments and whitespace dropped. `#` only starts a
+comment in languages that use it that way (services/languages.HASH_COMMENT_LANGUAGES);
+elsewhere it is code (JS/TS `#private` fields, Rust `#[attr]`, C `#include`, C# `#region`).
+
+Alongside the hash, each fingerprint carries anchors: the (line, column) of every AST node or
+token in a fixed traversal order. Two inputs with the same fingerprint have anchors that
+correspond one to one, which is how line-based results (review comments) are carried from
+one formatting of the code to another.
+"""
+
+import ast
+import hashlib
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.languages import HASH_COMMENT_LANGUAGES, PYTHON
+
+Anchor = Tuple[int, int]
+
+_STRING = r'''(?P<str>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)'''
+_C_COMMENTS = r'''(?P<block>/\*.*?\*/) | (?P<line>//[^\n]*)'''
+_TOKEN = r'''(?P<tok>\w+|[^\w\s])'''
+_TOKEN_RE = re.compile(' | '.join((_STRING, _C_COMMENTS, _TOKEN)), re.S | re.X)
+_HASH_TOKEN_RE = re.compile(' | '.join((_STRING, _C_COMMENTS, r'(?P<hash>\#[^\n]*)', _TOKEN)), re.S | re.X)
+
+
+def _strip_docstrings(tree: ast.AST):
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            body = node.body
+            if body and isinstance(body[0], ast.Expr) and isinstance(getattr(body[0], 'value', None), ast.Constant) \
+                    and isinstance(body[0].value.value, str):
+                node.body = body[1:]
+
+
+def _python_fingerprint(code: str, ignore_docstrings: bool) -> Optional[Tuple[str, List[Anchor]]]:
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+    if ignore_docstrings:
+        _strip_docstrings(tree)
+    dump = ast.dump(tree, annotate_fields=False, include_attributes=False)
+    anchors = [(n.lineno, n.col_offset) for n in ast.walk(tree) if hasattr(n, 'lineno')]
+    return 'py:' + hashlib.sha256(dump.encode('utf-8')).hexdigest(), anchors
+
+
+def _token_fingerprint(code: str, hash_comments: bool = False) -> Tuple[str, List[Anchor]]:
+    token_re = _HASH_TOKEN_RE if hash_comments else _TOKEN_RE
+    digest = hashlib.sha256()
+    anchors: List[Anchor] = []
+    line, line_start = 1, 0
+    pos = 0
+    for m in token_re.finditer(code):
+        # advance the line counter over everything consumed since the previous match
+        newlines = code.count('\n', pos, m.start())
+        if newlines:
+            line += newlines
+            line_start = code.rfind('\n', pos, m.start()) + 1
+        if m.lastgroup in ('str', 'tok'):
+            digest.update(m.group().encode('utf-8'))
+            digest.update(b'\x1f')
+            anchors.append((line, m.start() - line_start))
+        pos = m.start()
+    return 'tok:' + digest.hexdigest(), anchors
+
+
+def fingerprint(code: str, ignore_docstrings: bool = True, language: Optional[str] = None) -> Tuple[str, List[Anchor]]:
+    """Return (fingerprint, anchors); 'py:' fingerprints for Python, 'tok:' for everything else.
+
+    `language` (services/languages.detect_language) decides whether `#` starts a comment; None
+    means unknown: Python if it parses, otherwise `#` is kept as code.
+    """
+    if language in (None, PYTHON):
+        result = _python_fingerprint(code, ignore_docstrings)
+        if result is not None:
+            return result
+    return _token_fingerprint(code, hash_comments=language in HASH_COMMENT_LANGUAGES)
+
+
+def remap_comments(comments: List[Dict[str, Any]], old_anchors: List[Anchor],
+                   new_anchors: List[Anchor]) -> Optional[List[Dict[str, Any]]]:
+    """Move comments from the old to the new formatting of the same code.
+
+    A comment line maps through the first anchor that starts on it. Returns None if the anchor
+    lists do not correspond or any comment sits on a line without an anchor (the caller should
+    review again rather than guess).
+    """
+    if len(old_anchors) != len(new_anchors):
+        return None
+    first: Dict[int, int] = {}
+    for i, (line, _) in enumerate(old_anchors):
+        first.setdefault(line, i)
+    out = []
+    for c in comments:
+        line = c.get('line')
+        if not isinstance(line, int) or line < 1:
+            out.append(dict(c))
+            continue
+        idx = first.get(line)
+        if idx is None:
+            return None
+        new_line, new_col = new_anchors[idx]
+        moved = dict(c, line=new_line)
+        column = c.get('column')
+        if isinstance(column, int):
+            # keep the column's offset from the anchor; drop it if that lands before the line start
+            shifted = column - old_anchors[idx][1] + new_col
+            moved['column'] = shifted if shifted >= 0 else None
+        out.append(moved)
+    return out
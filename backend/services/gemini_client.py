@@ -4,19 +4,54 @@ import os
 import re
 import json
 import time
-from typing import Optional, Any, Tuple
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Optional, Any, Tuple, Sequence
 import google.genai as genai
 from google.genai import errors as genai_errors
+from google.genai import types as genai_types
 import logging
+from .instrumentation import instrumented, record_cache, record_prompt, record_hedge, record_hedge_waste
+from .llm_errors import QuotaExceededError
+from .cancellation import current_token, AnalysisCancelled, POLL_SECONDS
+from .prompt_builder import prepare, metrics_for, estimate_tokens
+from .usage import key_id, record_call
+from . import llm_replay
 
 logger = logging.getLogger(__name__)
 
+# chosen model per API key, so models.list() runs once per key instead of on every call
+MODEL_CACHE_SECONDS = float(os.environ.get("MODEL_CACHE_SECONDS", "3600"))
+_LAST_RESORT_MODEL = "text-bison@001"
+_model_cache: Dict[str, Tuple[str, float]] = {}
+_model_cache_lock = threading.Lock()
 
-class QuotaExceededError(Exception):
-    def __init__(self, message, retry_after=None, key_source: Optional[str] = None):
-        super().__init__(message)
-        self.retry_after = retry_after
-        self.key_source = key_source
+# per-feature model routing: summary, tags and docs use the "fast" tier, the review the
+# "strong" one. LLM_FAST_MODEL / LLM_STRONG_MODEL name a tier's models (comma-separated
+# preference list, like GOOGLE_GENAI_PREFERRED_MODEL) and LLM_MODEL_<FEATURE> overrides one
+# feature; anything unset falls back to GOOGLE_GENAI_PREFERRED_MODEL and the default candidates
+FEATURE_TIERS = {"summary": "fast", "tags": "fast", "docs": "fast", "comments": "strong"}
+
+# hedged requests: for the features in LLM_HEDGE_FEATURES (e.g. "summary,tags"), a second
+# identical request goes out if the first has not answered after LLM_HEDGE_DELAY_SECONDS; the
+# first to succeed is used and the other abandoned (its tokens are still billed and counted)
+HEDGE_FEATURES = {f.strip() for f in os.environ.get("LLM_HEDGE_FEATURES", "").split(",") if f.strip()}
+HEDGE_DELAY_SECONDS = float(os.environ.get("LLM_HEDGE_DELAY_SECONDS", "2.0"))
+_HEDGE_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get("LLM_HEDGE_WORKERS", "16")), thread_name_prefix="llm-hedge")
+
+# optional cap on concurrent model calls (anything with acquire/release as a context manager);
+# the bulk CLI installs a semaphore shared by its worker processes, see set_llm_limiter
+_llm_limiter = None
+
+# provider-side caching of the analysed file, shared by the feature prompts of one analysis
+CONTEXT_CACHE_ENABLED = os.environ.get("CONTEXT_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get("CONTEXT_CACHE_TTL_SECONDS", "600"))
+# the provider refuses smaller caches (and below it a cache would not pay for itself)
+CONTEXT_CACHE_MIN_TOKENS = int(os.environ.get("CONTEXT_CACHE_MIN_TOKENS", "1024"))
+CONTEXT_PREAMBLE = ("You are an experienced software engineer reviewing a single source file. "
+                    "The file is given below with each line prefixed by its line number and \"| \". "
+                    "Answer each request about it with JSON only, in exactly the format the request asks for.")
 
 def _make_client(api_key: Optional[str] = None, api_key_source: Optional[str] = None):
     """
@@ -37,23 +72,61 @@ def _make_client(api_key: Optional[str] = None, api_key_source: Optional[str] =
         logger.info("Creating genai client with default credentials (no explicit API key) (source=%s).", source)
 
     # avoid logging secrets; but record the source on the client for error reporting
-    if key:
-        client = genai.Client(api_key=key)
-    else:
-        client = genai.Client()
+    # (LLM_BACKEND=record|replay swaps in the record/replay client, see llm_replay)
+    client = llm_replay.wrap_client(lambda: genai.Client(api_key=key) if key else genai.Client())
     try:
         setattr(client, "_llm_key_source", source)
+        # identifies the key for the model cache without keeping the secret around
+        setattr(client, "_llm_key_id", key_id(key))
     except Exception:
         pass
     return client
 
-def _choose_model(client: genai.Client) -> str:
+def _feature_preference(feature: Optional[str]) -> Optional[str]:
+    """The configured model preference for a feature (None: the server-wide default)."""
+    if not feature:
+        return None
+    tier = FEATURE_TIERS.get(feature)
+    return (os.environ.get("LLM_MODEL_" + feature.upper())
+            or (os.environ.get(f"LLM_{tier.upper()}_MODEL") if tier else None)
+            or None)
+
+def _choose_model(client: genai.Client, feature: Optional[str] = None) -> str:
+    """Return the model for this client's key (and feature), resolving (and caching) it on first use."""
+    preferred = _feature_preference(feature)
+    client_key = getattr(client, "_llm_key_id", None)
+    cache_key = f"{client_key}|{preferred or ''}" if client_key else None
+    now = time.time()
+    if cache_key:
+        with _model_cache_lock:
+            cached = _model_cache.get(cache_key)
+        if cached and now - cached[1] < MODEL_CACHE_SECONDS:
+            return cached[0]
+    model = _resolve_model(client, preferred)
+    # the last-resort name is a guess after a failed listing; retry the listing next time
+    if cache_key and model != _LAST_RESORT_MODEL:
+        with _model_cache_lock:
+            _model_cache[cache_key] = (model, now)
+    return model
+
+def warm_model():
+    """Resolve the models for the server's own credentials ahead of the first request."""
+    if not os.environ.get("GOOGLE_GENAI_API_KEY"):
+        logger.info("No GOOGLE_GENAI_API_KEY configured; skipping model warmup")
+        return None
+    client = _make_client(api_key_source="server_env")
+    for feature in FEATURE_TIERS:
+        _choose_model(client, feature)
+    return _choose_model(client)
+
+@instrumented("model_select")
+def _resolve_model(client: genai.Client, preferred: Optional[str] = None) -> str:
     """
     Try to pick a model name that supports text generation. Fallback to sensible defaults.
     """
     try:
         # If the operator set a preferred model(s) via env, use them deterministically
-        preferred = os.environ.get("GOOGLE_GENAI_PREFERRED_MODEL")
+        preferred = preferred or os.environ.get("GOOGLE_GENAI_PREFERRED_MODEL")
         if preferred:
             # allow comma-separated list; prefer first entry
             pref_list = [p.strip() for p in preferred.split(",") if p.strip()]
@@ -105,8 +178,9 @@ def _choose_model(client: genai.Client) -> str:
     except Exception as e:
         logger.warning("Could not list models: %s", e)
     # last-resort fallback (may still fail if not available)
-    return "text-bison@001"
+    return _LAST_RESORT_MODEL
 
+@instrumented("json_extract")
 def _extract_json_from_text(text: str) -> Tuple[Optional[Any], Optional[str]]:
     """
     Try to extract JSON object/array from free text. Returns (parsed_obj, raw_json_text) or (None, None)
@@ -153,14 +227,105 @@ def _extract_json_from_text(text: str) -> Tuple[Optional[Any], Optional[str]]:
                 return None, m.group(1)
     return None, None
 
-def _call_model_with_retry(client: genai.Client, model_name: str, contents: str, retries: int = 2, delay: float = 0.5) -> str:
+def _record_usage(client, feature: Optional[str], contents: str, resp: Any, text: str, hedge_loser: bool = False):
+    """Report the call's token usage; estimated locally when the response carries no usage metadata."""
+    try:
+        meta = getattr(resp, "usage_metadata", None)
+        input_tokens = getattr(meta, "prompt_token_count", None)
+        if input_tokens is None:
+            input_tokens = estimate_tokens(contents if isinstance(contents, str) else str(contents))
+            cached_tokens = 0
+            output_tokens = estimate_tokens(text)
+        else:
+            cached_tokens = getattr(meta, "cached_content_token_count", None) or 0
+            # thinking tokens are billed as output
+            output_tokens = (getattr(meta, "candidates_token_count", None) or 0) + (getattr(meta, "thoughts_token_count", None) or 0)
+        record_call(feature, getattr(client, "_llm_key_id", None) or "default", getattr(client, "_llm_key_source", None),
+                    int(input_tokens), int(cached_tokens), int(output_tokens))
+        if hedge_loser:
+            record_hedge_waste(feature or "other", int(input_tokens) + int(output_tokens))
+    except Exception:
+        logger.warning("Could not record LLM usage", exc_info=True)
+
+def set_llm_limiter(limiter) -> None:
+    """Make every model call in this process hold `limiter` (e.g. a multiprocessing.Semaphore); None removes the cap."""
+    global _llm_limiter
+    _llm_limiter = limiter
+
+
+def _generate_content(client, **kwargs) -> Any:
+    limiter = _llm_limiter
+    if limiter is None:
+        return client.models.generate_content(**kwargs)
+    with limiter:
+        return client.models.generate_content(**kwargs)
+
+
+def _hedged_generate(client, model_name: str, contents: Any, config: Optional[Any], feature: str, token) -> Any:
+    """generate_content with a second request fired after HEDGE_DELAY_SECONDS; the first success wins."""
+    def submit():
+        ctx = contextvars.copy_context()
+        return _HEDGE_POOL.submit(ctx.run, _generate_content, client, model=model_name, contents=contents, config=config)
+
+    def count_loser(future):
+        # the abandoned request is still billed: count its tokens once it completes
+        def done(f):
+            if not f.cancelled() and f.exception() is None:
+                resp = f.result()
+                text = getattr(resp, "text", None) or ""
+                ctx.run(_record_usage, client, feature, contents, resp, text, True)
+        ctx = contextvars.copy_context()
+        future.add_done_callback(done)
+
+    primary = submit()
+    pending = {primary}
+    hedge = None
+    first_error = None
+    deadline = time.monotonic() + HEDGE_DELAY_SECONDS
+    while pending:
+        done, pending = wait(pending, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+        for f in done:
+            if f.exception() is None:
+                if hedge is not None:
+                    record_hedge(feature, "hedge_won" if f is hedge else "primary_won")
+                for loser in pending:
+                    if not loser.cancel():
+                        count_loser(loser)
+                return f.result()
+            first_error = first_error or f.exception()
+        if token is not None and token.cancelled:
+            for f in pending:
+                f.cancel()
+            raise AnalysisCancelled(token.reason or "cancelled", "llm")
+        # hedge only a slow request, not a failed one (that is the retry loop's job)
+        if hedge is None and primary in pending and time.monotonic() >= deadline:
+            hedge = submit()
+            pending.add(hedge)
+            record_hedge(feature, "sent")
+    raise first_error
+
+def _call_model_with_retry(client: genai.Client, model_name: str, contents: str, retries: int = 2, delay: float = 0.5,
+                           config: Optional[Any] = None, feature: Optional[str] = None) -> str:
     last_exc = None
+    # a cancelled analysis stops waiting on the call and skips the remaining retries
+    token = current_token()
     for attempt in range(retries):
         try:
-            resp = client.models.generate_content(model=model_name, contents=contents)
+            if feature in HEDGE_FEATURES:
+                if token is not None:
+                    token.check("llm")
+                resp = _hedged_generate(client, model_name, contents, config, feature, token)
+            elif token is not None:
+                resp = token.call(_generate_content, client, model=model_name, contents=contents, config=config, stage="llm")
+            else:
+                resp = _generate_content(client, model=model_name, contents=contents, config=config)
             text = getattr(resp, "text", None) or getattr(resp, "content", None) or str(resp)
+            _record_usage(client, feature, contents, resp, text)
             return text.strip()
         except Exception as e:
+            # a missing resource (e.g. an expired context cache) will not appear on retry
+            if isinstance(e, genai_errors.ClientError) and getattr(e, "code", None) == 404:
+                raise
             # Detect quota / resource-exhausted errors and fail fast so callers can fallback
             last_exc = e
             msg = str(e)
@@ -195,88 +360,200 @@ def _call_model_with_retry(client: genai.Client, model_name: str, contents: str,
                 raise QuotaExceededError(msg, retry_after, key_source=key_src)
 
             logger.warning("Model call attempt %d failed: %s", attempt+1, e)
-            time.sleep(delay)
+            if token is not None:
+                if token.wait(delay):
+                    token.check("llm")
+            else:
+                time.sleep(delay)
     logger.exception("All model attempts failed: %s", last_exc)
     raise last_exc
 
-def get_summary(code: str, api_key: Optional[str] = None, api_key_source: Optional[str] = None) -> str:
-    client = _make_client(api_key, api_key_source=api_key_source)
+class AnalysisContext:
+    """LLM state shared by the feature calls of one analysis.
+
+    One client for all calls, and the source file (compacted, line-numbered, with
+    CONTEXT_PREAMBLE as system instruction) cached provider-side once per model, so each
+    feature prompt carries only its own instructions and metrics. Falls back to inline prompts
+    when caching is disabled, the file is under CONTEXT_CACHE_MIN_TOKENS, fewer than two of the
+    analysis' features are routed to the model, or the provider refuses or has expired the cache.
+    """
+
+    def __init__(self, code: str, api_key: Optional[str] = None, api_key_source: Optional[str] = None,
+                 features: Sequence[str] = (), language: Optional[str] = None):
+        self.client = _make_client(api_key, api_key_source=api_key_source)
+        self.language = language
+        self.shared = prepare("context", code, language=language)
+        self.use_cache = CONTEXT_CACHE_ENABLED and self.shared.tokens >= CONTEXT_CACHE_MIN_TOKENS
+        # how many of this analysis' calls go to each model; a cache only pays off when shared
+        self._sharing: Dict[str, int] = {}
+        if self.use_cache:
+            for feature in features:
+                model_name = _choose_model(self.client, feature)
+                self._sharing[model_name] = self._sharing.get(model_name, 0) + 1
+        self._caches: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def cache_for(self, model_name: str) -> Optional[str]:
+        """Name of the cached file for model_name, creating it on first use; None to inline."""
+        if not self.use_cache or self._sharing.get(model_name, 0) < 2:
+            return None
+        with self._lock:
+            if model_name not in self._caches:
+                self._caches[model_name] = self._create_cache(model_name)
+            return self._caches[model_name]
+
+    @instrumented("llm_cache_create")
+    def _create_cache(self, model_name: str) -> Optional[str]:
+        config = genai_types.CreateCachedContentConfig(
+            system_instruction=CONTEXT_PREAMBLE,
+            contents=[genai_types.Content(role="user", parts=[genai_types.Part(text=f"Source file:\n```\n{self.shared.code}\n```")])],
+            ttl=f"{CONTEXT_CACHE_TTL_SECONDS}s",
+            display_name="code-review-analysis",
+        )
+        token = current_token()
+        try:
+            if token is not None:
+                cache = token.call(self.client.caches.create, model=model_name, config=config, stage="llm_cache")
+            else:
+                cache = self.client.caches.create(model=model_name, config=config)
+        except Exception as e:
+            logger.info("Context caching unavailable for %s, using inline prompts: %s", model_name, e)
+            return None
+        return getattr(cache, "name", None)
+
+    def drop_cache(self, model_name: str):
+        with self._lock:
+            self._caches[model_name] = None
+
+    def close(self):
+        """Delete the caches now rather than paying for storage until their TTL runs out."""
+        with self._lock:
+            names = [n for n in self._caches.values() if n]
+            self._caches = {}
+        for name in names:
+            try:
+                self.client.caches.delete(name=name)
+            except Exception as e:
+                logger.info("Could not delete context cache %s (it expires on its own): %s", name, e)
+
+
+def open_context(code: str, api_key: Optional[str] = None, api_key_source: Optional[str] = None,
+                 features: Sequence[str] = (), language: Optional[str] = None) -> Optional[AnalysisContext]:
+    """AnalysisContext for one analysis, or None (per-call clients and inline prompts) if it cannot be set up."""
     try:
-        model_name = _choose_model(client)
-        prompt = f"""You are a concise, technical assistant. Produce a code summary (max 200 words).
+        return AnalysisContext(code, api_key=api_key, api_key_source=api_key_source, features=features,
+                               language=language)
+    except Exception:
+        logger.exception("Could not set up a shared LLM context; using per-call prompts")
+        return None
+
+
+_SUMMARY_PROMPT = """You are a concise, technical assistant. Produce a code summary (max 200 words).
 Return ONLY a JSON object with keys: "summary" (string, concise) and "key_points" (array of short strings).
 Do not include any explanation outside the JSON.
-Code:
-```
+{code}"""
+
+_COMMENTS_PROMPT = """You are a code reviewer. Analyze the code and metrics and return ONLY a JSON array.
+Each item must be an object with: line (int|null), column (int|null), severity ('error'|'warning'|'info'), category (Performance|Readability|Security|Maintainability|Style|Other), message (string), suggestion (string|null).
+Each code line is prefixed with its line number and "| "; use that number for "line" and count "column" from after the prefix.
+Do not include additional text.
+{code}
+Metrics: {metrics}
+"""
+
+_TAGS_PROMPT = """Identify up to 6 tags for this code sample. Return ONLY a JSON array of strings, e.g. ["Performance","Security"].
 {code}
-```"""
-        raw = _call_model_with_retry(client, model_name, prompt)
+Metrics: {metrics}
+"""
+
+_DOCS_PROMPT = """Extract library dependencies and produce usage snippets where applicable.
+Return ONLY a JSON object: { "dependencies": [{"name":..., "version":null, "reason": "..."}, ...], "usage_notes": ["..."] }
+{code}"""
+
+_CACHED_CODE = "Code: the source file provided above."
+
+
+def _generate(feature: str, template: str, code: str, metrics: Optional[dict], api_key: Optional[str],
+              api_key_source: Optional[str], context: Optional[AnalysisContext], language: Optional[str] = None) -> str:
+    """Run one feature prompt, against the context's cached file when there is one, else with the code inline."""
+    client = context.client if context is not None else _make_client(api_key, api_key_source=api_key_source)
+    model_name = _choose_model(client, feature)
+    cache_name = context.cache_for(model_name) if context is not None else None
+    if cache_name:
+        record_cache("llm_context", True)
+        prompt = template.replace("{metrics}", metrics_for(feature, metrics) or "{}").replace("{code}", _CACHED_CODE)
+        record_prompt(feature, estimate_tokens(prompt), False)
+        try:
+            return _call_model_with_retry(client, model_name, prompt, feature=feature,
+                                          config=genai_types.GenerateContentConfig(cached_content=cache_name))
+        except genai_errors.ClientError as e:
+            if getattr(e, "code", None) not in (403, 404):
+                raise
+            logger.info("Context cache %s is gone (%s); falling back to inline prompts", cache_name, e)
+            context.drop_cache(model_name)
+    elif context is not None and context.use_cache:
+        record_cache("llm_context", False)
+    if language is None and context is not None:
+        language = context.language
+    prepared = prepare(feature, code, metrics, language=language)
+    prompt = template.replace("{metrics}", prepared.metrics or "{}").replace("{code}", f"Code:\n```\n{prepared.code}\n```")
+    return _call_model_with_retry(client, model_name, prompt, feature=feature)
+
+
+def get_summary(code: str, api_key: Optional[str] = None, api_key_source: Optional[str] = None,
+                context: Optional[AnalysisContext] = None, language: Optional[str] = None) -> str:
+    try:
+        raw = _generate("summary", _SUMMARY_PROMPT, code, None, api_key, api_key_source, context, language)
         parsed, raw_json = _extract_json_from_text(raw)
         if parsed and isinstance(parsed, dict) and "summary" in parsed:
             return json.dumps(parsed)  # return JSON string for downstream parsing
         # fallback: return raw text prefixed with error marker if not JSON
         return raw
+    except QuotaExceededError:
+        # the analyzer turns quota and budget errors into its local-only fallback
+        raise
     except Exception as e:
         logger.exception("LLM summary call failed")
         return f"__LLM_ERROR__: {str(e)}"
 
-def get_comments(code: str, metrics: dict, api_key: Optional[str] = None, api_key_source: Optional[str] = None) -> str:
-    client = _make_client(api_key, api_key_source=api_key_source)
-    prompt = f"""You are a code reviewer. Analyze the code and metrics and return ONLY a JSON array.
-Each item must be an object with: line (int|null), column (int|null), severity ('error'|'warning'|'info'), category (Performance|Readability|Security|Maintainability|Style|Other), message (string), suggestion (string|null).
-Do not include additional text.
-Code:
-```
-{code}
-```
-Metrics: {json.dumps(metrics)}
-"""
+def get_comments(code: str, metrics: dict, api_key: Optional[str] = None, api_key_source: Optional[str] = None,
+                 context: Optional[AnalysisContext] = None, language: Optional[str] = None) -> str:
     try:
-        model_name = _choose_model(client)
-        raw = _call_model_with_retry(client, model_name, prompt)
+        raw = _generate("comments", _COMMENTS_PROMPT, code, metrics, api_key, api_key_source, context, language)
         parsed, raw_json = _extract_json_from_text(raw)
         if parsed:
             return json.dumps(parsed)
         return raw
+    except QuotaExceededError:
+        raise
     except Exception as e:
         logger.exception("LLM comments call failed")
         return f"__LLM_ERROR__: {str(e)}"
 
-def get_tags(code: str, metrics: dict, api_key: Optional[str] = None, api_key_source: Optional[str] = None) -> str:
-    client = _make_client(api_key, api_key_source=api_key_source)
-    prompt = f"""Identify up to 6 tags for this code sample. Return ONLY a JSON array of strings, e.g. ["Performance","Security"].
-Code:
-```
-{code}
-```
-Metrics: {json.dumps(metrics)}
-"""
+def get_tags(code: str, metrics: dict, api_key: Optional[str] = None, api_key_source: Optional[str] = None,
+             context: Optional[AnalysisContext] = None, language: Optional[str] = None) -> str:
     try:
-        model_name = _choose_model(client)
-        raw = _call_model_with_retry(client, model_name, prompt)
+        raw = _generate("tags", _TAGS_PROMPT, code, metrics, api_key, api_key_source, context, language)
         parsed, raw_json = _extract_json_from_text(raw)
         if parsed:
             return json.dumps(parsed)
         return raw
+    except QuotaExceededError:
+        raise
     except Exception as e:
         logger.exception("LLM tags call failed")
         return f"__LLM_ERROR__: {str(e)}"
 
-def get_library_docs(code: str, api_key: Optional[str] = None, api_key_source: Optional[str] = None) -> str:
-    client = _make_client(api_key, api_key_source=api_key_source)
-    prompt = f"""Extract library dependencies and produce usage snippets where applicable.
-Return ONLY a JSON object: {{ "dependencies": [{{"name":..., "version":null, "reason": "..."}}, ...], "usage_notes": ["..."] }}
-Code:
-```
-{code}
-```"""
+def get_library_docs(code: str, api_key: Optional[str] = None, api_key_source: Optional[str] = None,
+                     context: Optional[AnalysisContext] = None, language: Optional[str] = None) -> str:
     try:
-        model_name = _choose_model(client)
-        raw = _call_model_with_retry(client, model_name, prompt)
+        raw = _generate("docs", _DOCS_PROMPT, code, None, api_key, api_key_source, context, language)
         parsed, raw_json = _extract_json_from_text(raw)
         if parsed:
             return json.dumps(parsed)
         return raw
+    except QuotaExceededError:
+        raise
     except Exception as e:
         logger.exception("LLM docs call failed")
         return f"__LLM_ERROR__: {str(e)}"
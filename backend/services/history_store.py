@@ -1,37 +1,657 @@
+"""History persistence backed by SQLite in WAL mode.
+
+Each entry is split into a compact index row (timestamp, file name, headline metrics,
+comment counts) and a separately stored compressed payload, so listing never reads or
+decodes full analyses; GET /history/{id} loads one payload on demand. Payloads are
+content-addressed by a canonical hash: re-submitting the same analysis only adds an index
+row and bumps the blob's occurrence count and last_seen time.
+
+Listing can be filtered by date range, file name, metric thresholds, tag, comment
+severity/category and full-text search (SQLite FTS5 when available); every filter is
+backed by an index so queries stay fast on large histories.
+
+Metric trends (averages and comment counts per hour/day/week, overall and per file) are
+kept as rollups updated on every insert, so /history/stats costs O(buckets).
+
+Each save is a single transaction (no read-modify-write of the whole history), listing uses
+keyset pagination on the primary key, and SQLite's file locking makes concurrent writers
+from several uvicorn workers safe. Retention is enforced on insert:
+HISTORY_MAX_ENTRIES (default 200, 0 = unlimited) and HISTORY_MAX_AGE_DAYS (default off).
+"""
+
+import datetime
 import json
 import os
-from typing import List, Dict, Any
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Iterator, List, Dict, Any, Optional, Tuple
+import logging
+from services.instrumentation import instrumented, timed
+from utils.hashing import canonical_hash, VOLATILE_KEYS
+
+try:
+    # optional: faster and smaller than zlib when installed
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+STORE_PATH = os.environ.get('HISTORY_DIR') or os.path.join(os.path.dirname(__file__), '..', 'data')
+DB_FILE = os.path.join(STORE_PATH, 'history.sqlite3')
+# pre-SQLite store; imported once on first open, then renamed
+LEGACY_HISTORY_FILE = os.path.join(STORE_PATH, 'history.json')
+
+MAX_ENTRIES = int(os.environ.get('HISTORY_MAX_ENTRIES', '200'))
+MAX_AGE_DAYS = float(os.environ.get('HISTORY_MAX_AGE_DAYS', '0'))
+
+# headline metrics copied into the index row
+INDEX_METRICS = ('cc_avg', 'mi_avg', 'pylint_score', 'naming_quality', 'lines')
+
+# schema migrations applied in order; PRAGMA user_version records how many have run
+_MIGRATIONS = []
+
+
+def _migration(fn):
+    _MIGRATIONS.append(fn)
+    return fn
+
+
+@_migration
+def _create_history_table(conn: sqlite3.Connection):
+    conn.execute('CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, payload TEXT NOT NULL)')
+
+
+@_migration
+def _split_index_and_payloads(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE history_index (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL NOT NULL,
+            file_name TEXT,
+            cc_avg REAL,
+            mi_avg REAL,
+            pylint_score REAL,
+            naming_quality REAL,
+            lines INTEGER,
+            error_count INTEGER NOT NULL DEFAULT 0,
+            warning_count INTEGER NOT NULL DEFAULT 0,
+            info_count INTEGER NOT NULL DEFAULT 0
+        )""")
+    conn.execute('CREATE INDEX history_index_created_at ON history_index(created_at)')
+    conn.execute('CREATE TABLE history_payloads (id INTEGER PRIMARY KEY, codec TEXT NOT NULL, data BLOB NOT NULL)')
+    v2_cols = ('file_name',) + INDEX_METRICS + ('error_count', 'warning_count', 'info_count')
+    rows = conn.execute('SELECT id, created_at, payload FROM history ORDER BY id').fetchall()
+    for r in rows:
+        try:
+            entry = json.loads(r['payload'])
+        except Exception:
+            continue
+        fields = _index_fields(entry)
+        conn.execute(
+            f"INSERT INTO history_index (id, created_at, {', '.join(v2_cols)}) VALUES (?, ?{', ?' * len(v2_cols)})",
+            [r['id'], r['created_at']] + [fields[c] for c in v2_cols])
+        codec, data = _compress(entry)
+        conn.execute('INSERT INTO history_payloads (id, codec, data) VALUES (?, ?, ?)', (r['id'], codec, data))
+    conn.execute('DROP TABLE history')
+
+
+@_migration
+def _dedupe_payloads_by_hash(conn: sqlite3.Connection):
+    conn.execute('ALTER TABLE history_index ADD COLUMN payload_hash TEXT')
+    conn.execute("""
+        CREATE TABLE history_blobs (
+            hash TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            data BLOB NOT NULL,
+            first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL,
+            occurrences INTEGER NOT NULL DEFAULT 1
+        ) WITHOUT ROWID""")
+    conn.execute('CREATE INDEX history_index_payload_hash ON history_index(payload_hash)')
+    rows = conn.execute(
+        'SELECT p.id, p.codec, p.data, i.created_at FROM history_payloads p JOIN history_index i ON i.id = p.id ORDER BY p.id').fetchall()
+    for r in rows:
+        try:
+            entry = _decompress(r['codec'], r['data'])
+        except Exception:
+            continue
+        _store_blob(conn, entry, r['created_at'])
+        conn.execute('UPDATE history_index SET payload_hash = ? WHERE id = ?', (canonical_hash(entry), r['id']))
+    conn.execute('DELETE FROM history_index WHERE payload_hash IS NULL')
+    conn.execute('DROP TABLE history_payloads')
+
+
+@_migration
+def _add_search_indexes(conn: sqlite3.Connection):
+    conn.execute('CREATE TABLE history_blob_tags (tag TEXT NOT NULL, hash TEXT NOT NULL, PRIMARY KEY (tag, hash)) WITHOUT ROWID')
+    conn.execute('CREATE INDEX history_blob_tags_hash ON history_blob_tags(hash)')
+    conn.execute("""
+        CREATE TABLE history_blob_facets (
+            severity TEXT NOT NULL,
+            category TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            PRIMARY KEY (severity, category, hash)
+        ) WITHOUT ROWID""")
+    conn.execute('CREATE INDEX history_blob_facets_category ON history_blob_facets(category, hash)')
+    conn.execute('CREATE INDEX history_blob_facets_hash ON history_blob_facets(hash)')
+    # fts rowid per blob so pruning can delete by rowid instead of scanning the UNINDEXED hash column
+    conn.execute('CREATE TABLE history_fts_rows (hash TEXT PRIMARY KEY, fts_rowid INTEGER NOT NULL) WITHOUT ROWID')
+    try:
+        conn.execute('CREATE VIRTUAL TABLE history_fts USING fts5(hash UNINDEXED, body)')
+    except sqlite3.OperationalError:
+        # sqlite built without FTS5: keep the text and fall back to LIKE scans
+        logger.warning("SQLite FTS5 unavailable; history text search will use LIKE")
+        conn.execute('CREATE TABLE history_fts (hash TEXT PRIMARY KEY, body TEXT)')
+    for col in ('file_name',) + INDEX_METRICS:
+        conn.execute(f'CREATE INDEX history_index_{col} ON history_index({col})')
+    for r in conn.execute('SELECT hash, codec, data FROM history_blobs').fetchall():
+        try:
+            entry = _decompress(r['codec'], r['data'])
+        except Exception:
+            continue
+        _index_blob_content(conn, r['hash'], entry)
+
+
+@_migration
+def _add_metric_rollups(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE history_rollups (
+            granularity TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            bucket_start REAL NOT NULL,
+            entries INTEGER NOT NULL DEFAULT 0,
+            cc_avg_sum REAL NOT NULL DEFAULT 0, cc_avg_n INTEGER NOT NULL DEFAULT 0,
+            mi_avg_sum REAL NOT NULL DEFAULT 0, mi_avg_n INTEGER NOT NULL DEFAULT 0,
+            pylint_score_sum REAL NOT NULL DEFAULT 0, pylint_score_n INTEGER NOT NULL DEFAULT 0,
+            naming_quality_sum REAL NOT NULL DEFAULT 0, naming_quality_n INTEGER NOT NULL DEFAULT 0,
+            error_count INTEGER NOT NULL DEFAULT 0,
+            warning_count INTEGER NOT NULL DEFAULT 0,
+            info_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, file_name, bucket_start)
+        ) WITHOUT ROWID""")
+    for r in conn.execute('SELECT * FROM history_index ORDER BY id').fetchall():
+        _update_rollups(conn, r['created_at'], {k: r[k] for k in r.keys()})
+
 
-STORE_PATH = os.path.join(os.path.dirname(__file__), '..', 'data')
-HISTORY_FILE = os.path.join(STORE_PATH, 'history.json')
+# sqlite3 connections must not be shared across threads; FastAPI may run handlers in a threadpool
+_local = threading.local()
 
-os.makedirs(STORE_PATH, exist_ok=True)
 
-def _read_all() -> List[Dict[str, Any]]:
-    if not os.path.exists(HISTORY_FILE):
-        return []
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        return conn
+    os.makedirs(STORE_PATH, exist_ok=True)
+    # autocommit mode; writes use explicit BEGIN IMMEDIATE so writers queue on the db lock
+    conn = sqlite3.connect(DB_FILE, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    _migrate(conn)
+    _migrate_legacy(conn)
+    _local.conn = conn
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection):
+    if conn.execute('PRAGMA user_version').fetchone()[0] >= len(_MIGRATIONS):
+        return
+    conn.execute('BEGIN IMMEDIATE')
     try:
-        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for step in _MIGRATIONS[version:]:
+            logger.info("Applying history schema migration %s", step.__name__)
+            step(conn)
+        conn.execute(f'PRAGMA user_version = {len(_MIGRATIONS)}')
+        conn.execute('COMMIT')
     except Exception:
-        return []
+        conn.execute('ROLLBACK')
+        raise
+
+
+def _entry_time(entry: Dict[str, Any], default: float) -> float:
+    """Epoch seconds of an entry's own 'timestamp' (ISO-8601 as the frontend sends it, or epoch
+    seconds/milliseconds); `default` when it is missing or unreadable. Naive times are UTC."""
+    value = entry.get('timestamp')
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value / 1000.0 if value > 1e11 else float(value)
+    if isinstance(value, str) and value.strip():
+        try:
+            dt = datetime.datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+        except ValueError:
+            return default
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=datetime.timezone.utc)
+        return dt.timestamp()
+    return default
+
+
+def _migrate_legacy(conn: sqlite3.Connection):
+    if not os.path.exists(LEGACY_HISTORY_FILE):
+        return
+    try:
+        with open(LEGACY_HISTORY_FILE, 'r', encoding='utf-8') as f:
+            items = json.load(f)
+    except Exception:
+        logger.warning("Could not read legacy history file %s; leaving it in place", LEGACY_HISTORY_FILE)
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # another worker may have migrated while we were reading
+        if os.path.exists(LEGACY_HISTORY_FILE):
+            now = time.time()
+            # legacy file is newest-first; insert oldest first so ids keep insertion order
+            entries = [item for item in reversed(items or []) if isinstance(item, dict)]
+            for entry in entries:
+                _insert(conn, entry, _entry_time(entry, now))
+            os.replace(LEGACY_HISTORY_FILE, LEGACY_HISTORY_FILE + '.migrated')
+            logger.info("Migrated %d legacy history entries into %s", len(entries), DB_FILE)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def _compress(entry: Dict[str, Any]) -> Tuple[str, bytes]:
+    raw = json.dumps(entry, separators=(',', ':'), default=str).encode('utf-8')
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=6).compress(raw)
+    return 'zlib', zlib.compress(raw, 6)
+
+
+def _decompress(codec: str, data: bytes) -> Dict[str, Any]:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('history payload is zstd-compressed but zstandard is not installed')
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == 'zlib':
+        raw = zlib.decompress(data)
+    else:
+        raw = data
+    return json.loads(raw)
+
+
+def _index_fields(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract the cheap-to-list columns from a full analysis payload."""
+    metrics = entry.get('metrics') if isinstance(entry.get('metrics'), dict) else {}
+    fields = {}
+    for k in INDEX_METRICS:
+        v = metrics.get(k)
+        fields[k] = v if isinstance(v, (int, float)) and not isinstance(v, bool) else None
+    counts = {'error': 0, 'warning': 0, 'info': 0}
+    for c in entry.get('comments') or []:
+        if isinstance(c, dict):
+            sev = str(c.get('severity') or 'info').lower()
+            counts[sev if sev in counts else 'info'] += 1
+    fields['error_count'] = counts['error']
+    fields['warning_count'] = counts['warning']
+    fields['info_count'] = counts['info']
+    name = entry.get('file_name') or entry.get('fileName') or entry.get('filename')
+    fields['file_name'] = str(name) if name else None
+    return fields
+
+
+def _store_blob(conn: sqlite3.Connection, entry: Dict[str, Any], seen_at: float) -> Tuple[str, bool]:
+    """Store the payload once per canonical hash; repeats only bump occurrences/last_seen.
+
+    Returns (hash, created) where created is True for a first sighting.
+    """
+    digest = canonical_hash(entry)
+    cur = conn.execute(
+        'UPDATE history_blobs SET occurrences = occurrences + 1, last_seen = MAX(last_seen, ?) WHERE hash = ?',
+        (seen_at, digest))
+    if cur.rowcount == 0:
+        # only first sightings pay for serialization + compression
+        stored = {k: v for k, v in entry.items() if k not in VOLATILE_KEYS}
+        codec, data = _compress(stored)
+        conn.execute(
+            'INSERT INTO history_blobs (hash, codec, data, first_seen, last_seen, occurrences) VALUES (?, ?, ?, ?, ?, 1)',
+            (digest, codec, data, seen_at, seen_at))
+        return digest, True
+    return digest, False
+
+
+def _searchable_text(entry: Dict[str, Any]) -> str:
+    parts = []
+    summary = entry.get('summary')
+    if isinstance(summary, dict):
+        parts.append(str(summary.get('summary') or ''))
+        parts.extend(str(k) for k in (summary.get('key_points') or []))
+    elif summary:
+        parts.append(str(summary))
+    for c in entry.get('comments') or []:
+        if isinstance(c, dict):
+            parts.append(str(c.get('message') or ''))
+            if c.get('suggestion'):
+                parts.append(str(c.get('suggestion')))
+    return '\n'.join(p for p in parts if p)
+
+
+def _index_blob_content(conn: sqlite3.Connection, digest: str, entry: Dict[str, Any]):
+    """Secondary indexes (tags, severity/category facets, full text) for a newly stored payload."""
+    tags = set(str(t).strip().lower() for t in (entry.get('tags') or []) if t is not None and str(t).strip())
+    conn.executemany('INSERT OR IGNORE INTO history_blob_tags (tag, hash) VALUES (?, ?)', [(t, digest) for t in tags])
+    facets = set()
+    for c in entry.get('comments') or []:
+        if isinstance(c, dict):
+            sev = str(c.get('severity') or 'info').lower()
+            facets.add((sev, str(c.get('category') or 'Other').lower()))
+    conn.executemany('INSERT OR IGNORE INTO history_blob_facets (severity, category, hash) VALUES (?, ?, ?)',
+                     [(sev, cat, digest) for sev, cat in facets])
+    text = _searchable_text(entry)
+    if text:
+        cur = conn.execute('INSERT INTO history_fts (hash, body) VALUES (?, ?)', (digest, text))
+        conn.execute('INSERT OR REPLACE INTO history_fts_rows (hash, fts_rowid) VALUES (?, ?)', (digest, cur.lastrowid))
+
+
+def _drop_blob(conn: sqlite3.Connection, digest: str):
+    row = conn.execute('SELECT fts_rowid FROM history_fts_rows WHERE hash = ?', (digest,)).fetchone()
+    if row is not None:
+        conn.execute('DELETE FROM history_fts WHERE rowid = ?', (row['fts_rowid'],))
+        conn.execute('DELETE FROM history_fts_rows WHERE hash = ?', (digest,))
+    for table in ('history_blobs', 'history_blob_tags', 'history_blob_facets'):
+        conn.execute(f'DELETE FROM {table} WHERE hash = ?', (digest,))
+
+
+def _insert(conn: sqlite3.Connection, entry: Dict[str, Any], created_at: float) -> int:
+    fields = _index_fields(entry)
+    digest, created = _store_blob(conn, entry, created_at)
+    if created:
+        _index_blob_content(conn, digest, entry)
+    _update_rollups(conn, created_at, fields)
+    fields['payload_hash'] = digest
+    cols = ['created_at'] + list(fields.keys())
+    values = [created_at] + list(fields.values())
+    cur = conn.execute(
+        f"INSERT INTO history_index ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})", values)
+    return cur.lastrowid
+
+
+def _delete_where(conn: sqlite3.Connection, where: str, params: tuple):
+    counts = conn.execute(
+        f'SELECT payload_hash, COUNT(*) FROM history_index WHERE {where} GROUP BY payload_hash', params).fetchall()
+    conn.execute(f'DELETE FROM history_index WHERE {where}', params)
+    # drop blobs no longer referenced by any index row (uses the payload_hash index); the rest
+    # keep occurrences equal to the rows still pointing at them
+    for h, n in counts:
+        if conn.execute('SELECT 1 FROM history_index WHERE payload_hash = ? LIMIT 1', (h,)).fetchone() is None:
+            _drop_blob(conn, h)
+        else:
+            conn.execute('UPDATE history_blobs SET occurrences = MAX(occurrences - ?, 1) WHERE hash = ?', (n, h))
+
+
+def _prune(conn: sqlite3.Connection):
+    if MAX_ENTRIES > 0:
+        # everything at or below the (MAX_ENTRIES+1)-th newest id goes; walks the primary key only
+        row = conn.execute('SELECT id FROM history_index ORDER BY id DESC LIMIT 1 OFFSET ?', (MAX_ENTRIES,)).fetchone()
+        if row is not None:
+            _delete_where(conn, 'id <= ?', (row['id'],))
+    if MAX_AGE_DAYS > 0:
+        _delete_where(conn, 'created_at < ?', (time.time() - MAX_AGE_DAYS * 86400,))
+
+
+def _row_to_summary(r: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        'id': r['id'],
+        'created_at': r['created_at'],
+        'file_name': r['file_name'],
+        'metrics': {k: r[k] for k in INDEX_METRICS},
+        'comment_counts': {'error': r['error_count'], 'warning': r['warning_count'], 'info': r['info_count']},
+        'content_hash': r['payload_hash'],
+        'occurrences': r['occurrences'],
+        'first_seen': r['first_seen'],
+        'last_seen': r['last_seen'],
+    }
+
+
+_INDEX_SELECT = ('SELECT i.*, b.occurrences, b.first_seen, b.last_seen FROM history_index i '
+                 'JOIN history_blobs b ON b.hash = i.payload_hash')
+
+
+# trend rollups maintained on insert; retention pruning deliberately leaves them intact
+ROLLUP_GRANULARITIES = {'hour': 3600, 'day': 86400, 'week': 7 * 86400}
+ROLLUP_METRICS = ('cc_avg', 'mi_avg', 'pylint_score', 'naming_quality')
+# 1970-01-05 was a Monday; weeks are aligned to it (UTC)
+_WEEK_OFFSET = 4 * 86400
+
+
+def _bucket_start(ts: float, granularity: str) -> float:
+    size = ROLLUP_GRANULARITIES[granularity]
+    offset = _WEEK_OFFSET if granularity == 'week' else 0
+    return ((ts - offset) // size) * size + offset
+
+
+def _update_rollups(conn: sqlite3.Connection, created_at: float, fields: Dict[str, Any]):
+    """Fold one entry into every (granularity, file) bucket; O(granularities) upserts."""
+    metric_cols = []
+    metric_vals = []
+    for m in ROLLUP_METRICS:
+        v = fields.get(m)
+        metric_cols.extend([f'{m}_sum', f'{m}_n'])
+        metric_vals.extend([float(v) if v is not None else 0.0, 1 if v is not None else 0])
+    counts = [int(fields.get('error_count') or 0), int(fields.get('warning_count') or 0), int(fields.get('info_count') or 0)]
+    cols = metric_cols + ['error_count', 'warning_count', 'info_count']
+    updates = ', '.join(f'{c} = {c} + excluded.{c}' for c in cols)
+    sql = (f"INSERT INTO history_rollups (granularity, file_name, bucket_start, entries, {', '.join(cols)}) "
+           f"VALUES (?, ?, ?, 1{', ?' * len(cols)}) "
+           f"ON CONFLICT (granularity, file_name, bucket_start) DO UPDATE SET entries = entries + 1, {updates}")
+    files = [''] + ([fields['file_name']] if fields.get('file_name') else [])
+    rows = []
+    for g in ROLLUP_GRANULARITIES:
+        start = _bucket_start(created_at, g)
+        for f in files:
+            rows.append([g, f, start] + metric_vals + counts)
+    conn.executemany(sql, rows)
+
+
+# filter keys accepted by list_history_index / list_history_page (see routers/analyze.get_history)
+FILTER_KEYS = ('since', 'until', 'file_name', 'tag', 'severity', 'category', 'q') + tuple(
+    f'{m}_{bound}' for m in INDEX_METRICS for bound in ('min', 'max'))
+
+
+def _fts_enabled(conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'history_fts'").fetchone()
+    return bool(row and 'fts5' in (row['sql'] or '').lower())
+
+
+def _fts_query(text: str) -> str:
+    # quote every term so user input cannot inject FTS operators; terms are ANDed
+    terms = [t.replace('"', '""') for t in text.split() if t.strip()]
+    return ' '.join(f'"{t}"' for t in terms)
+
+
+def _filter_clause(conn: sqlite3.Connection, filters: Optional[Dict[str, Any]]) -> Tuple[List[str], List[Any]]:
+    where: List[str] = []
+    params: List[Any] = []
+    if not filters:
+        return where, params
+    if filters.get('since') is not None:
+        where.append('i.created_at >= ?')
+        params.append(float(filters['since']))
+    if filters.get('until') is not None:
+        where.append('i.created_at < ?')
+        params.append(float(filters['until']))
+    if filters.get('file_name'):
+        where.append('i.file_name = ?')
+        params.append(filters['file_name'])
+    for m in INDEX_METRICS:
+        if filters.get(f'{m}_min') is not None:
+            where.append(f'i.{m} >= ?')
+            params.append(float(filters[f'{m}_min']))
+        if filters.get(f'{m}_max') is not None:
+            where.append(f'i.{m} <= ?')
+            params.append(float(filters[f'{m}_max']))
+    if filters.get('tag'):
+        where.append('i.payload_hash IN (SELECT hash FROM history_blob_tags WHERE tag = ?)')
+        params.append(str(filters['tag']).strip().lower())
+    if filters.get('severity') or filters.get('category'):
+        facet = []
+        if filters.get('severity'):
+            facet.append('severity = ?')
+            params.append(str(filters['severity']).lower())
+        if filters.get('category'):
+            facet.append('category = ?')
+            params.append(str(filters['category']).lower())
+        where.append(f"i.payload_hash IN (SELECT hash FROM history_blob_facets WHERE {' AND '.join(facet)})")
+    if filters.get('q') and str(filters['q']).strip():
+        if _fts_enabled(conn):
+            where.append('i.payload_hash IN (SELECT hash FROM history_fts WHERE history_fts MATCH ?)')
+            params.append(_fts_query(str(filters['q'])))
+        else:
+            where.append("i.payload_hash IN (SELECT hash FROM history_fts WHERE body LIKE ? ESCAPE '\\')")
+            q = str(filters['q']).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(f'%{q}%')
+    return where, params
+
+
+def _page(conn: sqlite3.Connection, limit: int, before_id: Optional[int],
+          filters: Optional[Dict[str, Any]] = None) -> Tuple[List[sqlite3.Row], Optional[int]]:
+    limit = max(0, int(limit))
+    where, params = _filter_clause(conn, filters)
+    if before_id is not None:
+        where.append('i.id < ?')
+        params.append(before_id)
+    sql = _INDEX_SELECT
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    rows = conn.execute(f'{sql} ORDER BY i.id DESC LIMIT ?', params + [limit + 1]).fetchall()
+    next_before = rows[limit - 1]['id'] if len(rows) > limit and limit > 0 else None
+    return rows[:limit], next_before
+
+
+@instrumented("history_io")
+def list_history_index(limit: int = 50, before_id: Optional[int] = None,
+                       filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Return (index summaries newest-first, cursor for the next page or None); payloads are not read."""
+    rows, next_before = _page(_connect(), limit, before_id, filters)
+    return [_row_to_summary(r) for r in rows], next_before
+
+
+@instrumented("history_io")
+def list_history_page(limit: int = 50, before_id: Optional[int] = None,
+                      filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Return (full payloads newest-first, cursor for the next page or None)."""
+    conn = _connect()
+    rows, next_before = _page(conn, limit, before_id, filters)
+    items = []
+    for r in rows:
+        entry = _load_payload(conn, r)
+        if entry is not None:
+            items.append(entry)
+    return items, next_before
 
-def _write_all(items: List[Dict[str, Any]]):
-    with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(items, f, indent=2, default=str)
 
 def list_history(limit: int = 50) -> List[Dict[str, Any]]:
-    items = _read_all()
-    return items[:limit]
+    items, _ = list_history_page(limit)
+    return items
 
-def save_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
-    items = _read_all()
-    items.insert(0, entry)
-    # keep up to 200 entries
-    items = items[:200]
-    _write_all(items)
+
+def iter_entries(filters: Optional[Dict[str, Any]] = None, before_id: Optional[int] = None,
+                 limit: Optional[int] = None, page_size: int = 50) -> Iterator[Dict[str, Any]]:
+    """Lazily yield full payloads newest-first (with id and file_name), one index page at a time.
+
+    Safe to consume from different threads between items (as StreamingResponse does): each page
+    is fetched completely and every payload read takes the current thread's connection.
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        with timed("history_io"):
+            rows, before_id = _page(_connect(), size, before_id, filters)
+        for r in rows:
+            with timed("history_io"):
+                entry = _load_payload(_connect(), r)
+            if entry is None:
+                continue
+            entry['id'] = r['id']
+            if r['file_name'] and not entry.get('file_name'):
+                entry['file_name'] = r['file_name']
+            yield entry
+        if remaining is not None:
+            remaining -= len(rows)
+        if before_id is None:
+            return
+
+
+def _load_payload(conn: sqlite3.Connection, index_row: sqlite3.Row) -> Optional[Dict[str, Any]]:
+    row = conn.execute('SELECT codec, data FROM history_blobs WHERE hash = ?', (index_row['payload_hash'],)).fetchone()
+    if row is None:
+        return None
+    try:
+        entry = _decompress(row['codec'], row['data'])
+    except Exception:
+        logger.warning("Could not decode history payload %s", index_row['id'], exc_info=True)
+        return None
+    # blobs are shared between submissions; the submission time comes from the index row
+    entry['timestamp'] = datetime.datetime.fromtimestamp(index_row['created_at'], datetime.timezone.utc).isoformat()
     return entry
 
+
+@instrumented("history_io")
+def get_entry(entry_id: int) -> Optional[Dict[str, Any]]:
+    conn = _connect()
+    row = conn.execute('SELECT id, created_at, payload_hash FROM history_index WHERE id = ?', (entry_id,)).fetchone()
+    if row is None:
+        return None
+    return _load_payload(conn, row)
+
+
+@instrumented("history_io")
+def history_stats(granularity: str = 'day', file_name: Optional[str] = None,
+                  since: Optional[float] = None, until: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Trend buckets (oldest first) from the incrementally maintained rollups; never reads entries."""
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(ROLLUP_GRANULARITIES)}")
+    where = ['granularity = ?', 'file_name = ?']
+    params: List[Any] = [granularity, file_name or '']
+    if since is not None:
+        where.append('bucket_start >= ?')
+        params.append(_bucket_start(since, granularity))
+    if until is not None:
+        where.append('bucket_start < ?')
+        params.append(until)
+    rows = _connect().execute(
+        f"SELECT * FROM history_rollups WHERE {' AND '.join(where)} ORDER BY bucket_start", params).fetchall()
+    out = []
+    for r in rows:
+        out.append({
+            'bucket_start': r['bucket_start'],
+            'entries': r['entries'],
+            'metrics': {m: (round(r[f'{m}_sum'] / r[f'{m}_n'], 3) if r[f'{m}_n'] else None) for m in ROLLUP_METRICS},
+            'comment_counts': {'error': r['error_count'], 'warning': r['warning_count'], 'info': r['info_count']},
+        })
+    return out
+
+
+@instrumented("history_io")
+def save_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    conn = _connect()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        entry_id = _insert(conn, entry, time.time())
+        _prune(conn)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    # echo the entry back with its id so clients can fetch it via GET /history/{id}
+    return dict(entry, id=entry_id)
+
+
+@instrumented("history_io")
 def clear_history():
-    _write_all([])
+    conn = _connect()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for table in ('history_blobs', 'history_blob_tags', 'history_blob_facets', 'history_fts',
+                      'history_fts_rows', 'history_rollups', 'history_index'):
+            conn.execute(f'DELETE FROM {table}')
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
     return []
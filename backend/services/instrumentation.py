@@ -0,0 +1,353 @@
+"""In-process counters and latency histograms, rendered in the Prometheus text format.
+
+Metrics are per process: with several uvicorn workers each one exposes its own /metrics,
+which is how Prometheus expects multi-process targets to be scraped.
+Recording is a lock, a dict lookup and (for histograms) a bisect, so it is cheap enough
+to wrap every pipeline stage.
+"""
+
+import bisect
+import contextvars
+import functools
+import importlib
+import importlib.util
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# seconds; covers sub-millisecond JSON work up to slow multi-second LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def samples(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, v in sorted(self.samples().items()):
+            out.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}")
+        return out
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[key] = series
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Tuple[List[int], float, int]]:
+        with self._lock:
+            return {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, n) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = 'le="' + _format_value(bound) + '"'
+                out.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            out.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            out.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {n}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        m = Counter(name, documentation, labelnames)
+        self._metrics.append(m)
+        return m
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        m = Gauge(name, documentation, labelnames)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        m = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(m)
+        return m
+
+    def render(self) -> str:
+        _update_cache_ratios()
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "code_review_stage_seconds", "Latency of analysis pipeline stages in seconds.", ("stage",))
+STAGE_ERRORS = REGISTRY.counter(
+    "code_review_stage_errors_total", "Pipeline stages that raised an exception.", ("stage",))
+QUOTA_ERRORS = REGISTRY.counter(
+    "code_review_llm_quota_errors_total", "LLM quota / RESOURCE_EXHAUSTED errors by API key source.", ("key_source",))
+CACHE_LOOKUPS = REGISTRY.counter(
+    "code_review_cache_lookups_total", "Cache lookups by cache name and result (hit|miss).", ("cache", "result"))
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    "code_review_cache_hit_ratio", "Fraction of lookups served from cache since process start.", ("cache",))
+CANCELLED = REGISTRY.counter(
+    "code_review_cancelled_total", "Analyses abandoned mid-run, by reason and the stage that was cut short.", ("reason", "stage"))
+IMPORT_SECONDS = REGISTRY.gauge(
+    "code_review_import_seconds", "Wall time of the first import of startup-critical or lazily loaded modules.", ("module",))
+WARMUP_SECONDS = REGISTRY.gauge(
+    "code_review_warmup_seconds", "Duration of each startup warmup step.", ("step",))
+PROMPT_TOKENS = REGISTRY.histogram(
+    "code_review_prompt_tokens", "Locally estimated input tokens per LLM prompt, by feature.", ("feature",),
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000))
+PROMPT_TRUNCATED = REGISTRY.counter(
+    "code_review_prompt_truncated_total", "Prompts whose code was cut to fit the feature's token budget.", ("feature",))
+LLM_TOKENS = REGISTRY.counter(
+    "code_review_llm_tokens_total", "LLM tokens by feature, API key source and kind (input|cached|output); input includes cached.",
+    ("feature", "key_source", "kind"))
+LLM_HEDGES = REGISTRY.counter(
+    "code_review_llm_hedges_total", "Hedged LLM requests: second requests sent, and which request won.", ("feature", "outcome"))
+LLM_HEDGE_WASTED_TOKENS = REGISTRY.counter(
+    "code_review_llm_hedge_wasted_tokens_total", "Tokens billed for abandoned hedged requests (input + output).", ("feature",))
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    "code_review_event_loop_lag_seconds", "How late the event-loop monitor woke up; sustained lag means blocking work on the loop.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+LLM_BUDGET_EXCEEDED = REGISTRY.counter(
+    "code_review_llm_budget_exceeded_total", "Analyses run locally because the key's daily token budget was used up.", ("key_source",))
+
+
+def _update_cache_ratios():
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), v in CACHE_LOOKUPS.samples().items():
+        t = totals.setdefault(cache, [0.0, 0.0])
+        t[0 if result == "hit" else 1] += v
+    for cache, (hits, misses) in totals.items():
+        if hits + misses:
+            CACHE_HIT_RATIO.set(hits / (hits + misses), cache=cache)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_quota_error(key_source):
+    QUOTA_ERRORS.inc(key_source=key_source or "unknown")
+
+
+def record_cancelled(reason: str, stage: Optional[str]):
+    CANCELLED.inc(reason=reason, stage=stage or "unknown")
+
+
+def record_llm_tokens(feature: str, key_source: str, input_tokens: int, cached_tokens: int, output_tokens: int):
+    LLM_TOKENS.inc(input_tokens, feature=feature, key_source=key_source, kind="input")
+    if cached_tokens:
+        LLM_TOKENS.inc(cached_tokens, feature=feature, key_source=key_source, kind="cached")
+    LLM_TOKENS.inc(output_tokens, feature=feature, key_source=key_source, kind="output")
+
+
+def record_hedge(feature: str, outcome: str):
+    LLM_HEDGES.inc(feature=feature, outcome=outcome)
+
+
+def record_hedge_waste(feature: str, tokens: int):
+    LLM_HEDGE_WASTED_TOKENS.inc(tokens, feature=feature)
+
+
+def record_loop_lag(seconds: float):
+    EVENT_LOOP_LAG.observe(seconds)
+
+
+def record_budget_exceeded(key_source: Optional[str]):
+    LLM_BUDGET_EXCEEDED.inc(key_source=key_source or "unknown")
+
+
+def record_prompt(feature: str, tokens: int, truncated: bool):
+    PROMPT_TOKENS.observe(tokens, feature=feature)
+    if truncated:
+        PROMPT_TRUNCATED.inc(feature=feature)
+
+
+class RequestTimings:
+    """Spans recorded by timed() while a request is being handled (see collect_timings)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        # (stage, offset_seconds, duration_seconds) in completion order; nested stages overlap their parent
+        self.spans: List[Tuple[str, float, float]] = []
+
+    def add(self, stage: str, start: float, seconds: float):
+        self.spans.append((stage, start - self.started, seconds))
+
+    def totals_ms(self) -> Dict[str, float]:
+        out: Dict[str, float] = {}
+        for stage, _, seconds in self.spans:
+            out[stage] = out.get(stage, 0.0) + seconds * 1000.0
+        if self.finished is not None:
+            out["total"] = (self.finished - self.started) * 1000.0
+        return {k: round(v, 3) for k, v in out.items()}
+
+    def server_timing(self) -> str:
+        # Server-Timing metric names are tokens; stage names already are
+        return ", ".join(f"{stage};dur={ms}" for stage, ms in self.totals_ms().items())
+
+
+_current_timings: contextvars.ContextVar = contextvars.ContextVar("code_review_timings", default=None)
+
+
+@contextmanager
+def collect_timings():
+    """Collect spans for every timed() stage run in this context (including threads that copy it)."""
+    timings = RequestTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        timings.finished = time.perf_counter()
+        _current_timings.reset(token)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current_timings.get()
+
+
+def observe_stage(stage: str, seconds: float, start: Optional[float] = None):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage, start if start is not None else time.perf_counter() - seconds, seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    """Time a block as a pipeline stage; exceptions are counted and re-raised."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        # BaseExceptions (cancellation, interrupts) are not stage failures
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - start, start)
+
+
+# optional JSON-lines trace log for offline aggregation; one line per traced request
+TRACE_LOG_PATH = os.environ.get("ANALYSIS_TRACE_LOG")
+_trace_lock = threading.Lock()
+
+
+def write_trace(endpoint: str, timings: RequestTimings, **fields):
+    if not TRACE_LOG_PATH:
+        return
+    record = {"ts": time.time(), "endpoint": endpoint}
+    record.update(fields)
+    record["spans"] = [
+        {"stage": stage, "offset_ms": round(offset * 1000.0, 3), "dur_ms": round(seconds * 1000.0, 3)}
+        for stage, offset, seconds in timings.spans
+    ]
+    line = json.dumps(record, default=str)
+    try:
+        with _trace_lock, open(TRACE_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except Exception:
+        logger.warning("Could not write trace log to %s", TRACE_LOG_PATH, exc_info=True)
+
+
+def instrumented(stage: str):
+    """Decorator form of timed() for functions that are a stage on their own."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_import(name: str, package: Optional[str] = None):
+    """Import a module on first use, recording how long the first import took."""
+    module = sys.modules.get(importlib.util.resolve_name(name, package))
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(name, package)
+    IMPORT_SECONDS.set(time.perf_counter() - start, module=module.__name__)
+    return module
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,82 @@
+"""Source language detection from the file name and, failing that, the content.
+
+Local metrics depend on it: pylint and radon only run on Python; brace languages (C, C++,
+Java, C#, JS/TS, Go, Rust, ...) get the tokenizer metrics in services/metrics; anything else
+only gets its line count.
+"""
+
+import ast
+import os
+import re
+from typing import Optional
+
+PYTHON = "python"
+
+EXTENSIONS = {
+    ".py": PYTHON, ".pyw": PYTHON, ".pyi": PYTHON,
+    ".c": "c", ".h": "c",
+    ".cc": "cpp", ".cpp": "cpp", ".cxx": "cpp", ".c++": "cpp", ".hh": "cpp", ".hpp": "cpp", ".hxx": "cpp",
+    ".ino": "cpp",
+    ".java": "java", ".cs": "csharp", ".go": "go", ".rs": "rust", ".kt": "kotlin", ".kts": "kotlin",
+    ".swift": "swift", ".php": "php", ".scala": "scala", ".dart": "dart",
+    ".js": "javascript", ".jsx": "javascript", ".mjs": "javascript", ".cjs": "javascript",
+    ".ts": "typescript", ".tsx": "typescript", ".mts": "typescript", ".cts": "typescript",
+    ".rb": "ruby", ".sh": "shell", ".bash": "shell", ".sql": "sql",
+    ".html": "html", ".htm": "html", ".css": "css", ".scss": "css", ".json": "json", ".xml": "xml",
+    ".yaml": "yaml", ".yml": "yaml", ".md": "markdown",
+}
+
+# languages with C-style comments, strings and braces: one tokenizer pass gives their metrics
+BRACE_LANGUAGES = frozenset({"c", "cpp", "java", "csharp", "go", "rust", "kotlin", "swift", "php", "scala", "dart",
+                             "javascript", "typescript"})
+
+# languages where "#" starts a comment (elsewhere it is code: #include, #[attr], #private, #region)
+HASH_COMMENT_LANGUAGES = frozenset({PYTHON, "shell", "ruby", "yaml"})
+
+_SHEBANG_RE = re.compile(r"^#!.*\b(python[\d.]*|node|deno|bun|bash|sh)\b")
+_INCLUDE_RE = re.compile(r'^\s*#\s*include\s*[<"]', re.M)
+_CPP_RE = re.compile(r"\bstd::|\bnamespace\s+\w+|\btemplate\s*<|\bclass\s+\w+|\bcout\b|\busing\s+namespace\b")
+_TS_RE = re.compile(r"\binterface\s+\w+\s*\{|\btype\s+\w+\s*=|:\s*(?:string|number|boolean|any|void)\b|\bexport\s+type\b")
+_JS_RE = re.compile(r"\bfunction\s*\w*\s*\(|\b(?:const|let|var)\s+\w+\s*=|=>|\brequire\s*\(|\bconsole\.\w+\(|"
+                    r"^\s*(?:import|export)\b.*\bfrom\s+['\"]", re.M)
+_JAVA_RE = re.compile(r"^\s*package\s+[\w.]+\s*;|\bpublic\s+(?:static\s+)?(?:final\s+)?(?:class|void|interface)\b", re.M)
+
+
+def detect_language(filename: Optional[str], code: str) -> str:
+    """Language name for the upload: by extension when it has a known one, else by content.
+
+    Without a file name, content that parses as Python (or has no recognisable signs of another
+    language) is Python, as every upload was before languages were told apart.
+    """
+    if filename:
+        language = EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+        if language:
+            return language
+    language = _from_content(code)
+    if language:
+        return language
+    return PYTHON if not filename else "text"
+
+
+def _from_content(code: str) -> Optional[str]:
+    head = code.lstrip()[:4096]
+    m = _SHEBANG_RE.match(head)
+    if m:
+        interpreter = m.group(1)
+        if interpreter.startswith("python"):
+            return PYTHON
+        return "shell" if interpreter in ("bash", "sh") else "javascript"
+    if _INCLUDE_RE.search(head):
+        return "cpp" if _CPP_RE.search(code) else "c"
+    try:
+        ast.parse(code)
+        return PYTHON
+    except (SyntaxError, ValueError):
+        pass
+    if _JAVA_RE.search(head):
+        return "java"
+    if _TS_RE.search(head):
+        return "typescript"
+    if _JS_RE.search(head):
+        return "javascript"
+    return None
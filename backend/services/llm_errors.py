@@ -0,0 +1,14 @@
+# LLM error types, kept free of the google-genai import so callers can catch them without loading the SDK
+
+from typing import Optional
+
+
+class QuotaExceededError(Exception):
+    def __init__(self, message, retry_after=None, key_source: Optional[str] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.key_source = key_source
+
+
+class BudgetExceededError(QuotaExceededError):
+    """The key's daily token budget (services/usage.py) is used up; handled like a provider quota error."""
@@ -0,0 +1,291 @@
+"""Record/replay backend for the LLM client, for offline tests and benchmarks.
+
+LLM_BACKEND selects what gemini_client._make_client returns:
+
+- live (default): the real google-genai client;
+- record: the real client, with every generate_content response also written to
+  LLM_CASSETTE_DIR;
+- replay: no network at all. Responses come from the cassettes; a request that was never
+  recorded gets a small valid stub answer per feature (LLM_REPLAY_ON_MISS=stub, the
+  default), or fails (error).
+
+Cassettes are keyed by the effective model input (cache system instruction + cached contents +
+prompt), not by model name, so a recording made with context caching does not replay for
+the inline prompts and vice versa.
+
+The replay client also simulates provider-side context caching (caches.create/get/delete with
+TTL expiry and a minimum size, LLM_REPLAY_CACHE=0 to make creation fail), reports usage
+metadata like the real API (cached tokens included), and can add latency
+(LLM_REPLAY_LATENCY_MS) or fail a fraction of calls with a provider quota error
+(LLM_REPLAY_QUOTA_RATE, seeded by LLM_REPLAY_SEED) so cache, fallback and load behaviour can be
+exercised offline.
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Tuple
+import logging
+
+from services.prompt_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "live").lower()
+LLM_CASSETTE_DIR = os.environ.get("LLM_CASSETTE_DIR") or os.path.join(os.path.dirname(__file__), "..", "data", "llm_cassettes")
+REPLAY_ON_MISS = os.environ.get("LLM_REPLAY_ON_MISS", "stub").lower()
+REPLAY_CACHE = os.environ.get("LLM_REPLAY_CACHE", "1").lower() not in ("0", "false", "no")
+REPLAY_CACHE_MIN_TOKENS = int(os.environ.get("LLM_REPLAY_CACHE_MIN_TOKENS", "0"))
+REPLAY_LATENCY_MS = float(os.environ.get("LLM_REPLAY_LATENCY_MS", "0"))
+REPLAY_QUOTA_RATE = float(os.environ.get("LLM_REPLAY_QUOTA_RATE", "0"))
+_quota_rng = random.Random(int(os.environ.get("LLM_REPLAY_SEED", "0")))
+REPLAY_MODELS = [m.strip() for m in os.environ.get("LLM_REPLAY_MODELS", "models/gemini-2.5-flash").split(",") if m.strip()]
+
+# stub answers for unrecorded requests, picked by a marker in the prompt
+_STUBS = (
+    ('"key_points"', {"summary": "Replayed summary.", "key_points": []}),
+    ("code reviewer", [{"line": 1, "column": None, "severity": "info", "category": "Other",
+                        "message": "Replayed review comment.", "suggestion": None}]),
+    ("tags for this code", ["Maintainability"]),
+    ('"dependencies"', {"dependencies": [], "usage_notes": []}),
+)
+
+# process-wide counters, for tests and benchmarks
+STATS: Dict[str, int] = {"calls": 0, "recorded": 0, "replayed": 0, "stubbed": 0, "quota_errors": 0,
+                         "cache_creates": 0, "cache_hits": 0, "cache_deletes": 0}
+_stats_lock = threading.Lock()
+
+
+class ReplayMissError(RuntimeError):
+    pass
+
+
+def _count(name: str, n: int = 1):
+    with _stats_lock:
+        STATS[name] += n
+
+
+def reset_stats():
+    with _stats_lock:
+        for k in STATS:
+            STATS[k] = 0
+
+
+def _text(contents: Any) -> str:
+    """Flatten str / Content / list-of-parts contents to plain text."""
+    if contents is None:
+        return ""
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(_text(c) for c in contents)
+    parts = getattr(contents, "parts", None)
+    if parts is not None:
+        return "\n".join(_text(p) for p in parts)
+    text = getattr(contents, "text", None)
+    return text if isinstance(text, str) else str(contents)
+
+
+def _key(system: str, cached: str, prompt: str) -> str:
+    digest = hashlib.sha256()
+    for part in (system, cached, prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def _cassette_path(key: str) -> str:
+    return os.path.join(LLM_CASSETTE_DIR, key + ".json")
+
+
+def _usage(prompt_tokens: int, cached_tokens: int, output: str) -> SimpleNamespace:
+    candidates = estimate_tokens(output)
+    return SimpleNamespace(prompt_token_count=prompt_tokens, cached_content_token_count=cached_tokens or None,
+                           candidates_token_count=candidates, total_token_count=prompt_tokens + candidates)
+
+
+def _stub(prompt: str) -> str:
+    for marker, answer in _STUBS:
+        if marker in prompt:
+            return json.dumps(answer)
+    return "{}"
+
+
+def _not_found(what: str):
+    from google.genai import errors as genai_errors
+    return genai_errors.ClientError(404, {"error": {"code": 404, "message": f"{what} not found", "status": "NOT_FOUND"}})
+
+
+def _ttl_seconds(config) -> float:
+    ttl = getattr(config, "ttl", None) or "3600s"
+    try:
+        return float(str(ttl).rstrip("s"))
+    except ValueError:
+        return 3600.0
+
+
+class _ReplayCaches:
+    """Simulated provider-side context caches."""
+
+    def __init__(self):
+        self._items: Dict[str, Tuple[str, str, float]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def create(self, *, model: str, config=None):
+        if not REPLAY_CACHE:
+            from google.genai import errors as genai_errors
+            raise genai_errors.ClientError(400, {"error": {"code": 400, "message": "Context caching is not supported",
+                                                          "status": "FAILED_PRECONDITION"}})
+        system = _text(getattr(config, "system_instruction", None))
+        contents = _text(getattr(config, "contents", None))
+        if estimate_tokens(system + contents) < REPLAY_CACHE_MIN_TOKENS:
+            from google.genai import errors as genai_errors
+            raise genai_errors.ClientError(400, {"error": {"code": 400, "message": "Cached content is too small",
+                                                          "status": "INVALID_ARGUMENT"}})
+        name = f"cachedContents/replay-{next(self._ids)}"
+        with self._lock:
+            self._items[name] = (system, contents, time.time() + _ttl_seconds(config))
+        _count("cache_creates")
+        return SimpleNamespace(name=name, model=model)
+
+    def resolve(self, name: str) -> Tuple[str, str]:
+        with self._lock:
+            item = self._items.get(name)
+            if item is not None and item[2] < time.time():
+                del self._items[name]
+                item = None
+        if item is None:
+            raise _not_found(f"CachedContent {name}")
+        return item[0], item[1]
+
+    def get(self, *, name: str, config=None):
+        self.resolve(name)
+        return SimpleNamespace(name=name)
+
+    def delete(self, *, name: str, config=None):
+        with self._lock:
+            existed = self._items.pop(name, None) is not None
+        if not existed:
+            raise _not_found(f"CachedContent {name}")
+        _count("cache_deletes")
+
+
+class _ReplayModels:
+    def __init__(self, caches: _ReplayCaches):
+        self._caches = caches
+
+    def list(self, *args, **kwargs):
+        return [SimpleNamespace(name=name) for name in REPLAY_MODELS]
+
+    def generate_content(self, *, model: str, contents: Any, config=None):
+        _count("calls")
+        if REPLAY_LATENCY_MS > 0:
+            time.sleep(REPLAY_LATENCY_MS / 1000.0)
+        if REPLAY_QUOTA_RATE > 0:
+            with _stats_lock:
+                exhausted = _quota_rng.random() < REPLAY_QUOTA_RATE
+            if exhausted:
+                _count("quota_errors")
+                from google.genai import errors as genai_errors
+                raise genai_errors.ClientError(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED",
+                                                              "message": "Quota exceeded (replay). Please retry in 30s."}})
+        system, cached = "", ""
+        cache_name = getattr(config, "cached_content", None)
+        if cache_name:
+            system, cached = self._caches.resolve(cache_name)
+            _count("cache_hits")
+        prompt = _text(contents)
+        cached_tokens = estimate_tokens(system + cached)
+        prompt_tokens = cached_tokens + estimate_tokens(prompt)
+        key = _key(system, cached, prompt)
+        try:
+            with open(_cassette_path(key), "r", encoding="utf-8") as f:
+                text = json.load(f)["text"]
+            _count("replayed")
+        except FileNotFoundError:
+            if REPLAY_ON_MISS != "stub":
+                raise ReplayMissError(f"No recorded LLM response for request {key[:16]}")
+            text = _stub(prompt)
+            _count("stubbed")
+        return SimpleNamespace(text=text, usage_metadata=_usage(prompt_tokens, cached_tokens, text))
+
+
+# caches belong to the (simulated) provider, not to a client instance
+_REPLAY_CACHES = _ReplayCaches()
+
+
+class ReplayClient:
+    """Stand-in for google.genai.Client serving recorded (or stub) responses."""
+
+    def __init__(self):
+        self.caches = _REPLAY_CACHES
+        self.models = _ReplayModels(self.caches)
+
+
+class _RecordingCaches:
+    def __init__(self, caches, seen: Dict[str, Tuple[str, str]]):
+        self._caches = caches
+        self._seen = seen
+
+    def create(self, *, model: str, config=None):
+        cache = self._caches.create(model=model, config=config)
+        self._seen[cache.name] = (_text(getattr(config, "system_instruction", None)),
+                                  _text(getattr(config, "contents", None)))
+        return cache
+
+    def __getattr__(self, name):
+        return getattr(self._caches, name)
+
+
+class _RecordingModels:
+    def __init__(self, models, seen: Dict[str, Tuple[str, str]]):
+        self._models = models
+        self._seen = seen
+
+    def generate_content(self, *, model: str, contents: Any, config=None):
+        resp = self._models.generate_content(model=model, contents=contents, config=config)
+        system, cached = self._seen.get(getattr(config, "cached_content", None) or "", ("", ""))
+        text = getattr(resp, "text", None)
+        if isinstance(text, str):
+            key = _key(system, cached, _text(contents))
+            try:
+                os.makedirs(LLM_CASSETTE_DIR, exist_ok=True)
+                tmp = _cassette_path(key) + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({"model": model, "text": text}, f)
+                os.replace(tmp, _cassette_path(key))
+                _count("recorded")
+            except OSError:
+                logger.warning("Could not record LLM response", exc_info=True)
+        return resp
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class RecordingClient:
+    """Wraps a real client, writing every text response to the cassette directory."""
+
+    def __init__(self, client):
+        self._client = client
+        seen: Dict[str, Tuple[str, str]] = {}
+        self.caches = _RecordingCaches(client.caches, seen)
+        self.models = _RecordingModels(client.models, seen)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def wrap_client(make_live) -> Any:
+    """Client for the configured backend; make_live() builds the real one when needed."""
+    if LLM_BACKEND == "replay":
+        return ReplayClient()
+    if LLM_BACKEND == "record":
+        return RecordingClient(make_live())
+    return make_live()
@@ -0,0 +1,49 @@
+"""Event-loop lag monitor.
+
+A background task sleeps EVENT_LOOP_MONITOR_INTERVAL seconds at a time and records how much
+later than asked it woke up. Anything that blocks the loop (sync work in an async handler, a
+slow JSON encode) shows up as lag in the code_review_event_loop_lag_seconds histogram, which
+tools/loadtest.py reads back from /metrics. EVENT_LOOP_MONITOR=0 turns it off.
+"""
+
+import asyncio
+import os
+from typing import Optional
+import logging
+
+from services.instrumentation import record_loop_lag
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOOP_MONITOR = os.environ.get("EVENT_LOOP_MONITOR", "1").lower() not in ("0", "false", "no")
+EVENT_LOOP_MONITOR_INTERVAL = float(os.environ.get("EVENT_LOOP_MONITOR_INTERVAL", "0.1"))
+# lag above this is also logged, with the blocked time
+EVENT_LOOP_LAG_WARN_SECONDS = float(os.environ.get("EVENT_LOOP_LAG_WARN_SECONDS", "0.5"))
+
+
+async def _monitor(interval: float):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - started - interval, 0.0)
+        record_loop_lag(lag)
+        if lag >= EVENT_LOOP_LAG_WARN_SECONDS:
+            logger.warning("Event loop blocked for %.3fs", lag)
+
+
+def start_loop_monitor() -> Optional[asyncio.Task]:
+    """Start the monitor on the running loop (call from the app lifespan)."""
+    if not EVENT_LOOP_MONITOR:
+        return None
+    return asyncio.get_running_loop().create_task(_monitor(EVENT_LOOP_MONITOR_INTERVAL), name="event-loop-monitor")
+
+
+async def stop_loop_monitor(task: Optional[asyncio.Task]):
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
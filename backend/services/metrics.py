@@ -1,11 +1,19 @@
-# Local static analysis (radon, pylint, AST)
+# Local static analysis (radon, pylint, AST for Python; a single tokenizer pass for brace languages)
 
+import os
+import re
+import math
 import subprocess
+import sys
 import tempfile
 import ast
-from typing import Dict, Any
-from radon.complexity import cc_visit
-from radon.metrics import mi_visit
+from typing import Dict, Any, List, Optional, Pattern
+from .instrumentation import timed, timed_import
+from .cancellation import current_token, check_cancelled
+from .languages import detect_language, PYTHON, BRACE_LANGUAGES
+
+PYLINT_TIMEOUT = float(os.environ.get("PYLINT_TIMEOUT_SECONDS", "60"))
+_PYLINT_SCORE_RE = re.compile(r"rated at (-?\d+(?:\.\d+)?)/10")
 
 def _analyze_python_names(code: str):
     try:
@@ -31,21 +39,80 @@ def _analyze_python_names(code: str):
     naming_quality = good_names / max(len(name_lengths), 1)
     return {"avg_name_len": avg_len, "naming_quality": round(naming_quality, 3), "func_count": func_count, "class_count": class_count}
 
-def analyze_metrics(code: str) -> Dict[str, Any]:
+def _pylint_score(code: str) -> float:
+    """Run pylint in a subprocess that is killed if the analysis is cancelled (or times out)."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".py") as tmp:
+        tmp.write(code.encode())
+    token = current_token()
+    try:
+        proc = subprocess.Popen([sys.executable, "-m", "pylint", tmp.name, "-sn", "--score=y"],
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        unregister = token.on_cancel(proc.kill) if token is not None else None
+        try:
+            output, _ = proc.communicate(timeout=PYLINT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            return 0.0
+        finally:
+            if unregister is not None:
+                unregister()
+    finally:
+        os.unlink(tmp.name)
+    check_cancelled("pylint")
+    # "Your code has been rated at 7.50/10 (previous run: ...)"
+    m = _PYLINT_SCORE_RE.search(output or "")
+    return float(m.group(1)) if m else 0.0
+
+
+def warm_pylint():
+    """Run pylint once so its first real run does not pay for cold imports and bytecode compilation."""
+    timed_import("radon.complexity")
+    timed_import("radon.metrics")
+    with timed("pylint_warmup"):
+        _pylint_score("x = 1\n")
+
+
+def analyze_metrics(code: str, filename: Optional[str] = None) -> Dict[str, Any]:
     """
     Return metrics: cc_avg, mi_avg, pylint_score, naming_quality, execution_time_estimate_ms,
-    oop_compliance, coding_standards, lines, func_count, class_count
+    oop_compliance, coding_standards, lines, func_count, class_count, language.
+
+    pylint and radon only run on Python (see services/languages). Brace languages get the same
+    metrics from one tokenizer pass, without pylint_score / coding_standards but with
+    max_nesting_depth; other text only gets its line count.
     """
+    language = detect_language(filename, code)
+    if language == PYTHON:
+        metrics = _python_metrics(code)
+    elif language in BRACE_LANGUAGES:
+        check_cancelled("local_metrics")
+        with timed("token_metrics"):
+            metrics = _brace_metrics(code, language)
+    else:
+        metrics = {"lines": code.count("\n") + 1}
+    metrics["language"] = language
+    return metrics
+
+
+def _python_metrics(code: str) -> Dict[str, Any]:
+    cc_visit = timed_import("radon.complexity").cc_visit
+    mi_visit = timed_import("radon.metrics").mi_visit
+
+    check_cancelled("local_metrics")
+
     # Cyclomatic complexity
     try:
-        complexity = cc_visit(code)
+        with timed("radon_cc"):
+            complexity = cc_visit(code)
         avg_cc = sum([c.complexity for c in complexity]) / max(len(complexity), 1)
     except Exception:
         avg_cc = 0.0
 
     # Maintainability Index
     try:
-        mi_scores = mi_visit(code, True)
+        with timed("radon_mi"):
+            mi_scores = mi_visit(code, True)
         if isinstance(mi_scores, dict):
             avg_mi = sum(mi_scores.values()) / max(len(mi_scores), 1)
         else:
@@ -55,14 +122,8 @@ def analyze_metrics(code: str) -> Dict[str, Any]:
 
     # Pylint score (best-effort)
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".py") as tmp:
-            tmp.write(code.encode())
-            tmp.flush()
-            pylint_output = subprocess.getoutput(f"pylint {tmp.name} -sn --score=y")
-        try:
-            pylint_score = float(pylint_output.split()[-1])
-        except Exception:
-            pylint_score = 0.0
+        with timed("pylint"):
+            pylint_score = _pylint_score(code)
     except Exception:
         pylint_score = 0.0
 
@@ -100,3 +161,224 @@ def analyze_metrics(code: str) -> Dict[str, Any]:
         "func_count": name_info.get("func_count", 0),
         "class_count": name_info.get("class_count", 0),
     }
+
+
+# --- brace languages: C, C++, Java, C#, JS/TS, Go, Rust, ... -----------------------------------
+
+_BRANCH_KEYWORDS = frozenset({"if", "for", "foreach", "while", "case", "catch", "when", "guard"})
+_BRANCH_OPERATORS = frozenset({"&&", "||", "??", "?"})
+# keywords that introduce a function whose body is the next "{"
+_FUNCTION_KEYWORDS = frozenset({"function", "fn", "func", "fun", "def"})
+_CLASS_KEYWORDS = frozenset({"class", "struct"})
+_CONTAINER_KEYWORDS = frozenset({"interface", "enum", "namespace", "impl", "trait", "object", "extension",
+                                 "protocol", "union", "module", "extern"})
+_KEYWORDS = _BRANCH_KEYWORDS | _FUNCTION_KEYWORDS | _CLASS_KEYWORDS | _CONTAINER_KEYWORDS | frozenset({
+    "else", "do", "switch", "try", "finally", "return", "break", "continue", "throw", "throws", "new", "delete",
+    "sizeof", "typeof", "instanceof", "in", "of", "await", "async", "yield", "static", "const", "let", "var",
+    "public", "private", "protected", "internal", "final", "abstract", "virtual", "override", "inline", "void",
+    "import", "export", "package", "using", "default", "goto", "match", "loop", "select", "go", "defer",
+    "synchronized", "lock", "with", "is", "as", "extends", "implements", "where", "mut", "pub", "self", "this",
+    "super", "true", "false", "null", "nullptr", "nil", "None", "undefined", "operator", "template", "typename",
+})
+_MODIFIERS = frozenset({"static", "public", "private", "protected", "internal", "pub", "async", "override", "virtual",
+                        "inline", "final", "abstract", "const", "void", "synchronized", "export", "default"})
+# statements whose "(...) {" opens a block, not a function body
+_STATEMENT_KEYWORDS = _KEYWORDS - _MODIFIERS
+_REGEX_PRECEDERS = frozenset({"(", ",", "=", ":", "[", "!", "&", "|", "?", "{", "}", ";", "+", "-", "*", "%",
+                              "<", ">", "~", "^", "&&", "||", "??", "=>", "return", "typeof", "case", "in",
+                              "of", "delete", "void", "throw", "new", "yield", "await", None})
+
+_token_patterns: Dict[str, Pattern] = {}
+
+
+def _token_pattern(language: str) -> Pattern:
+    pattern = _token_patterns.get(language)
+    if pattern is None:
+        parts = [r"(?P<nl>\n)", r"(?P<ws>[ \t\r\f\v]+)", r"(?P<lcomment>//[^\n]*)", r"(?P<bcomment>/\*.*?(?:\*/|\Z))"]
+        if language == "rust":
+            parts.append(r"(?P<lifetime>'[A-Za-z_]\w*(?!['\w]))")
+        # '#' lines: a comment in PHP, preprocessor directives / attributes / regions elsewhere
+        parts.append(r"(?P<comment>#[^\n]*)" if language == "php" else r"(?P<directive>#[^\n]*)")
+        parts += [
+            r'(?P<string>"(?:\\.|[^"\\\n])*"?|\'(?:\\.|[^\'\\\n])*\'?|`(?:\\.|[^`\\])*`?)',
+            r"(?P<number>\d[\w.]*)",
+            r"(?P<ident>[A-Za-z_$@][\w$]*)",
+            r"(?P<op>&&|\|\||\?\?|=>|->|::|[^\s\w])",
+        ]
+        pattern = _token_patterns[language] = re.compile("|".join(parts), re.S)
+    return pattern
+
+
+_BRACE_NEXT_RE = re.compile(r"\s*\{")
+_JS_REGEX_RE = re.compile(r"/(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[a-z]*")
+
+
+class _Frame:
+    __slots__ = ("kind", "branches", "has_method", "depth")
+
+    def __init__(self, kind: str):
+        self.kind = kind  # function, class, container or block
+        self.branches = 0
+        self.has_method = False
+        self.depth = 0  # nested blocks open inside a function
+
+
+def _brace_metrics(code: str, language: str) -> Dict[str, Any]:
+    """Metrics for a brace language from one tokenizer pass (comments and strings are skipped).
+
+    Functions are keyword-introduced ("function", "fn", "func", ...), JS/TS arrows, or a name
+    followed by "(...)" and a "{" body; each scores 1 + its branch keywords and short-circuit
+    operators, like radon's cyclomatic complexity. Maintainability uses radon's formula on the
+    Halstead volume of the token stream.
+    """
+    pattern = _token_pattern(language)
+    js = language in ("javascript", "typescript")
+    line = 1
+    code_lines: set = set()
+    comment_lines: set = set()
+    operators: Dict[str, int] = {}
+    operands: Dict[str, int] = {}
+    names: List[int] = []
+    stack: List[_Frame] = []
+    functions: List[_Frame] = []
+    classes: List[_Frame] = []
+    module = _Frame("module")
+    max_depth = 0
+    stmt: List[str] = []  # significant tokens since the last ";", "{" or "}"
+    paren = 0
+    arrow_bodyless = 0
+    prev: Optional[str] = None
+    pos, end = 0, len(code)
+
+    def innermost_function() -> _Frame:
+        for frame in reversed(stack):
+            if frame.kind == "function":
+                return frame
+        return module
+
+    def opened_kind() -> str:
+        """What the "{" about to open belongs to, from the tokens of its statement."""
+        if stmt and stmt[-1] == "=>":
+            return "function"
+        if any(t in _FUNCTION_KEYWORDS for t in stmt):
+            return "function"
+        if "=" not in stmt:
+            head = stmt[:stmt.index("(")] if "(" in stmt else stmt
+            if any(t in _CLASS_KEYWORDS for t in head):
+                return "class"
+            if any(t in _CONTAINER_KEYWORDS for t in head):
+                return "container"
+        # name(...) {  -- but not if (...) {, new Foo() {, or a call with an object literal argument
+        if paren == 0 and "(" in stmt and stmt[0] not in _STATEMENT_KEYWORDS and "new" not in stmt:
+            i = stmt.index("(")
+            name = stmt[i - 1] if i else ""
+            if name and name not in _KEYWORDS and (name[0].isalpha() or name[0] in "_$~"):
+                return "function"
+        return "block"
+
+    while pos < end:
+        m = pattern.match(code, pos)
+        if m is None:  # unreachable: the op group matches any other character
+            pos += 1
+            continue
+        kind, text = m.lastgroup, m.group()
+        if js and text == "/" and kind == "op" and prev in _REGEX_PRECEDERS:
+            rm = _JS_REGEX_RE.match(code, pos)
+            if rm is not None:
+                kind, text = "string", rm.group()
+        pos += len(text)
+        if kind == "nl":
+            line += 1
+            continue
+        if kind == "ws":
+            continue
+        newlines = text.count("\n")
+        if kind in ("lcomment", "bcomment", "comment"):
+            comment_lines.update(range(line, line + newlines + 1))
+            line += newlines
+            continue
+        code_lines.update(range(line, line + newlines + 1))
+        line += newlines
+        if kind == "directive":
+            continue
+
+        if kind == "ident" and text not in _KEYWORDS:
+            operands[text] = operands.get(text, 0) + 1
+            names.append(len(text.lstrip("@$")))
+        elif kind in ("string", "number", "lifetime"):
+            operands[text] = operands.get(text, 0) + 1
+        else:
+            operators[text] = operators.get(text, 0) + 1
+
+        if text in _BRANCH_KEYWORDS and kind == "ident" or text in _BRANCH_OPERATORS:
+            if not (text == "?" and code[pos:pos + 1] in (".", ":", ")", ">", "?", "=", ";", ",")):
+                innermost_function().branches += 1
+
+        if text == "{":
+            frame = _Frame(opened_kind())
+            if frame.kind == "function":
+                owner = stack[-1] if stack else None
+                if owner is not None and owner.kind == "class":
+                    owner.has_method = True
+                functions.append(frame)
+            elif frame.kind == "class":
+                classes.append(frame)
+            elif frame.kind == "block":
+                current = innermost_function()
+                if current is not module:
+                    current.depth += 1
+                    max_depth = max(max_depth, current.depth)
+            stack.append(frame)
+            stmt, paren = [], 0
+        elif text == "}":
+            if stack:
+                frame = stack.pop()
+                if frame.kind == "block":
+                    current = innermost_function()
+                    if current is not module:
+                        current.depth -= 1
+            stmt, paren = [], 0
+        elif text == ";":
+            stmt, paren = [], 0
+        else:
+            if text == "=>" and js and _BRACE_NEXT_RE.match(code, pos) is None:
+                arrow_bodyless += 1
+            if text in ("(", "["):
+                paren += 1
+            elif text in (")", "]"):
+                paren = max(paren - 1, 0)
+            stmt.append(text)
+        prev = text
+
+    total_functions = len(functions) + arrow_bodyless
+    if functions:
+        complexities = [1 + f.branches for f in functions] + [1] * arrow_bodyless
+        avg_cc = sum(complexities) / len(complexities)
+        total_cc = sum(complexities) + module.branches
+    else:
+        avg_cc = total_cc = (1 + module.branches) if code_lines else 0
+
+    n1, n2 = len(operators), len(operands)
+    length = sum(operators.values()) + sum(operands.values())
+    volume = length * math.log2(n1 + n2) if n1 + n2 > 1 else 0.0
+    sloc = len(code_lines)
+    comments_percent = len(comment_lines) * 100.0 / sloc if sloc else 0.0
+    mi_compute = timed_import("radon.metrics").mi_compute
+    avg_mi = mi_compute(volume, total_cc, sloc, comments_percent) if code_lines else 0.0
+
+    naming_quality = sum(1 for n in names if n >= 3) / max(len(names), 1)
+    oop_score = sum(1 for c in classes if c.has_method) / len(classes) if classes else 0.0
+    lines = code.count("\n") + 1
+    execution_time_estimate_ms = max(1.0, (lines / 100.0) * (avg_cc + 1.0) * 10.0)
+
+    return {
+        "cc_avg": round(avg_cc, 3),
+        "mi_avg": round(avg_mi, 3),
+        "naming_quality": round(naming_quality, 3),
+        "execution_time_estimate_ms": round(execution_time_estimate_ms, 2),
+        "oop_compliance": round(oop_score, 3),
+        "lines": lines,
+        "func_count": total_functions,
+        "class_count": len(classes),
+        "max_nesting_depth": max_depth,
+    }
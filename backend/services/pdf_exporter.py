@@ -6,20 +6,75 @@ from reportlab.lib.units import inch
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from io import BytesIO
-from typing import Any, Dict
+from typing import Any, BinaryIO, Dict, List, Optional, Union
+from xml.sax.saxutils import escape
 import datetime
+import os
+from services.instrumentation import instrumented
+from services.pdf_jobs import is_large_report
 
 
-# Register a common font (fallback to built-in if file not available)
-try:
-    pdfmetrics.registerFont(TTFont('Inter', 'Inter-Regular.ttf'))
-    base_font = 'Inter'
-except Exception:
-    base_font = 'Helvetica'
+# font registration reads and parses the TTF, so it happens on first use rather than at import
+_BASE_FONT = None
+
+
+def _base_font() -> str:
+    """Register a common font (fallback to built-in if file not available)."""
+    global _BASE_FONT
+    if _BASE_FONT is None:
+        try:
+            pdfmetrics.registerFont(TTFont('Inter', 'Inter-Regular.ttf'))
+            _BASE_FONT = 'Inter'
+        except Exception:
+            _BASE_FONT = 'Helvetica'
+    return _BASE_FONT
+
+
+# styles are immutable once built; build them once per process (see warm_pdf_styles)
+_STYLES = None
+
+SEVERITY_COLORS = {'error': colors.HexColor('#FEE2E2'), 'warning': colors.HexColor('#FEF3C7'), 'info': colors.HexColor('#DBEAFE')}
+METRICS_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#F3F4F6')),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 8),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+])
+ISSUES_TABLE_BASE = [('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey), ('VALIGN', (0, 0), (-1, -1), 'TOP'), ('LEFTPADDING', (0, 0), (-1, -1), 6)]
+ISSUES_COL_WIDTHS = [0.8 * inch, 1.0 * inch, 1.4 * inch, 3.0 * inch, 2.0 * inch]
+SEVERITY_ORDER = ('error', 'warning', 'info')
+
+# large-report mode (see pdf_jobs.is_large_report) lays the issues table out in bounded chunks
+TABLE_CHUNK_ROWS = int(os.environ.get('PDF_TABLE_CHUNK_ROWS', '100'))
+
+
+def _get_styles() -> Dict[str, ParagraphStyle]:
+    global _STYLES
+    if _STYLES is None:
+        base_font = _base_font()
+        styles = getSampleStyleSheet()
+        normal = styles['Normal']
+        normal.fontName = base_font
+        _STYLES = {
+            'normal': normal,
+            'title': ParagraphStyle('title', parent=styles['Title'], fontName=base_font),
+            'h2': ParagraphStyle('h2', parent=styles['Heading2'], fontName=base_font),
+            'h3': ParagraphStyle('h3', parent=styles['Heading3'], fontName=base_font),
+            'italic': ParagraphStyle('italic', parent=styles['Italic'], fontName=base_font),
+            'small': ParagraphStyle('small', parent=styles['Normal'], fontName=base_font, fontSize=9),
+        }
+    return _STYLES
+
+
+def warm_pdf_styles():
+    """Build the shared stylesheet up front (process-pool initializer / startup warmup)."""
+    _get_styles()
 
 
 def _header_footer(canvas, doc):
     canvas.saveState()
+    base_font = _base_font()
     w, h = letter
     # header
     canvas.setFont(base_font, 12)
@@ -31,25 +86,90 @@ def _header_footer(canvas, doc):
     canvas.restoreState()
 
 
-def build_pdf_report(analysis: Dict[str, Any]) -> bytes:
-    """Build a polished PDF report from analysis dict and return bytes."""
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=40, leftMargin=40, topMargin=72, bottomMargin=54)
-    styles = getSampleStyleSheet()
-    normal = styles['Normal']
-    normal.fontName = base_font
-    title_style = ParagraphStyle('title', parent=styles['Title'], fontName=base_font)
-    h2 = ParagraphStyle('h2', parent=styles['Heading2'], fontName=base_font)
-    italic = ParagraphStyle('italic', parent=styles['Italic'], fontName=base_font)
-    small = ParagraphStyle('small', parent=styles['Normal'], fontName=base_font, fontSize=9)
+def _issues_header(small) -> list:
+    return [Paragraph('<b>Line</b>', small), Paragraph('<b>Severity</b>', small), Paragraph('<b>Category</b>', small), Paragraph('<b>Message</b>', small), Paragraph('<b>Suggestion</b>', small)]
+
+
+def _issue_row(c: Dict[str, Any], small) -> list:
+    line = c.get('line') or '-'
+    sev = (c.get('severity') or 'info').lower()
+    cat = escape(str(c.get('category') or ''))
+    msg = escape(str(c.get('message') or ''))
+    sugg = escape(str(c.get('suggestion') or ''))
+    # line and severity never wrap, so plain strings skip the Paragraph layout cost
+    return [str(line), sev.title(), Paragraph(cat, small), Paragraph(msg, small), Paragraph(sugg, small)]
+
+
+def _issues_tables(comments: List[Dict[str, Any]], small, chunk_rows: Optional[int]) -> list:
+    """Issue tables with a repeating header; chunk_rows bounds the rows per Table (None = one table)."""
+    step = chunk_rows or len(comments)
+    tables = []
+    for start in range(0, len(comments), step):
+        chunk = comments[start:start + step]
+        data = [_issues_header(small)] + [_issue_row(c, small) for c in chunk]
+        # color severities by row where applicable
+        row_styles = list(ISSUES_TABLE_BASE)
+        row_styles.append(('FONTNAME', (0, 1), (1, -1), _base_font()))
+        row_styles.append(('FONTSIZE', (0, 1), (1, -1), small.fontSize))
+        for i, c in enumerate(chunk, start=1):
+            sev = (c.get('severity') or 'info').lower()
+            color = SEVERITY_COLORS.get(sev, colors.white)
+            row_styles.append(('BACKGROUND', (1, i), (1, i), color))
+        t = Table(data, colWidths=ISSUES_COL_WIDTHS, repeatRows=1)
+        t.setStyle(TableStyle(row_styles))
+        tables.append(t)
+    return tables
+
+
+def _severity_groups(comments: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    groups: Dict[str, List[Dict[str, Any]]] = {sev: [] for sev in SEVERITY_ORDER}
+    for c in comments:
+        groups.setdefault((c.get('severity') or 'info').lower(), []).append(c)
+    return {sev: items for sev, items in groups.items() if items}
+
+
+def _severity_summary(groups: Dict[str, List[Dict[str, Any]]], small, normal) -> Table:
+    data = [[Paragraph('<b>Severity</b>', small), Paragraph('<b>Count</b>', small)]]
+    for sev, items in groups.items():
+        data.append([Paragraph(sev.title(), normal), Paragraph(str(len(items)), normal)])
+    t = Table(data, colWidths=[3.5 * inch, 2.5 * inch])
+    t.setStyle(METRICS_TABLE_STYLE)
+    return t
+
+
+def _analysis_time(analysis: Dict[str, Any]) -> Optional[str]:
+    """The payload's own timestamp (ISO-8601 or epoch s/ms) as 'YYYY-MM-DD HH:MM UTC', or None."""
+    ts = analysis.get('timestamp')
+    try:
+        if isinstance(ts, (int, float)) and not isinstance(ts, bool):
+            dt = datetime.datetime.fromtimestamp(ts / 1000 if ts > 1e11 else ts, tz=datetime.timezone.utc)
+        elif isinstance(ts, str) and ts.strip():
+            dt = datetime.datetime.fromisoformat(ts.strip().replace('Z', '+00:00'))
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=datetime.timezone.utc)
+        else:
+            return None
+    except (ValueError, OverflowError, OSError):
+        return None
+    return dt.astimezone(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M UTC')
+
+
+def _build_story(analysis: Dict[str, Any], large: bool, group_by_severity: bool) -> list:
+    styles = _get_styles()
+    normal = styles['normal']
+    title_style = styles['title']
+    h2 = styles['h2']
+    small = styles['small']
 
     story = []
 
     # Title block
     story.append(Paragraph('Code Review Report', title_style))
-    meta_ts = datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')
+    # stamped from the payload rather than the clock: a cached render may be served much later
+    meta_ts = _analysis_time(analysis)
     story.append(Spacer(1, 6))
-    story.append(Paragraph(f'Report generated: {meta_ts}', small))
+    if meta_ts:
+        story.append(Paragraph(f'Analysis run: {meta_ts}', small))
     story.append(Spacer(1, 12))
 
     # Summary
@@ -78,13 +198,7 @@ def build_pdf_report(analysis: Dict[str, Any]) -> bytes:
             v = metrics.get(k)
             data.append([Paragraph(str(k).replace('_', ' ').title(), normal), Paragraph(str(round(v, 2)) if isinstance(v, (int, float)) else str(v), normal)])
         t = Table(data, colWidths=[3.5 * inch, 2.5 * inch])
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#F3F4F6')),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 8),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-        ]))
+        t.setStyle(METRICS_TABLE_STYLE)
         story.append(t)
     else:
         story.append(Paragraph('No metrics available.', normal))
@@ -94,26 +208,18 @@ def build_pdf_report(analysis: Dict[str, Any]) -> bytes:
     story.append(Paragraph('Issues', h2))
     story.append(Spacer(1, 6))
     comments = analysis.get('comments') or []
-    if comments:
-        data = [[Paragraph('<b>Line</b>', small), Paragraph('<b>Severity</b>', small), Paragraph('<b>Category</b>', small), Paragraph('<b>Message</b>', small), Paragraph('<b>Suggestion</b>', small)]]
-        sev_color = {'error': colors.HexColor('#FEE2E2'), 'warning': colors.HexColor('#FEF3C7'), 'info': colors.HexColor('#DBEAFE')}
-        for c in comments:
-            line = c.get('line') or '-'
-            sev = (c.get('severity') or 'info').lower()
-            cat = c.get('category') or ''
-            msg = c.get('message') or ''
-            sugg = c.get('suggestion') or ''
-            data.append([Paragraph(str(line), small), Paragraph(sev.title(), small), Paragraph(cat, small), Paragraph(msg, small), Paragraph(sugg, small)])
-        t = Table(data, colWidths=[0.8 * inch, 1.0 * inch, 1.4 * inch, 3.0 * inch, 2.0 * inch])
-        # color severities by row where applicable
-        row_styles = [('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey), ('VALIGN', (0, 0), (-1, -1), 'TOP'), ('LEFTPADDING', (0,0), (-1,-1), 6)]
-        # apply background for severity column cells
-        for i, c in enumerate(comments, start=1):
-            sev = (c.get('severity') or 'info').lower()
-            color = sev_color.get(sev, colors.white)
-            row_styles.append(('BACKGROUND', (1, i), (1, i), color))
-        t.setStyle(TableStyle(row_styles))
-        story.append(t)
+    # splitting one huge Table re-measures every remaining row per page; bounded chunks keep it linear
+    chunk_rows = TABLE_CHUNK_ROWS if large else None
+    if comments and group_by_severity:
+        groups = _severity_groups(comments)
+        story.append(_severity_summary(groups, small, normal))
+        for sev, items in groups.items():
+            story.append(Spacer(1, 12))
+            story.append(Paragraph(f'{sev.title()} ({len(items)})', styles['h3']))
+            story.append(Spacer(1, 6))
+            story.extend(_issues_tables(items, small, chunk_rows))
+    elif comments:
+        story.extend(_issues_tables(comments, small, chunk_rows))
     else:
         story.append(Paragraph('No issues found.', normal))
     story.append(Spacer(1, 12))
@@ -136,9 +242,27 @@ def build_pdf_report(analysis: Dict[str, Any]) -> bytes:
             story.append(Spacer(1, 6))
     else:
         story.append(Paragraph('No library documentation links found.', normal))
+    return story
+
 
-    # build
+@instrumented("pdf_build")
+def write_pdf_report(analysis: Dict[str, Any], out: Union[str, BinaryIO], large: Optional[bool] = None,
+                     group_by_severity: bool = False):
+    """Render the report into a file path or binary file object.
+
+    large=None picks large-report mode (chunked issue tables) from the comment count.
+    """
+    if large is None:
+        large = is_large_report(analysis)
+    doc = SimpleDocTemplate(out, pagesize=letter, rightMargin=40, leftMargin=40, topMargin=72, bottomMargin=54)
+    story = _build_story(analysis, large, group_by_severity)
     doc.build(story, onFirstPage=_header_footer, onLaterPages=_header_footer)
+
+
+def build_pdf_report(analysis: Dict[str, Any], large: Optional[bool] = None, group_by_severity: bool = False) -> bytes:
+    """Build a polished PDF report from analysis dict and return bytes."""
+    buffer = BytesIO()
+    write_pdf_report(analysis, buffer, large=large, group_by_severity=group_by_severity)
     pdf = buffer.getvalue()
     buffer.close()
     return pdf
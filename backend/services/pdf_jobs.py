@@ -0,0 +1,197 @@
+"""Off-loop PDF generation with a content-addressed result cache.
+
+reportlab layout is CPU-bound and holds the GIL, so reports are rendered in a small process
+pool (PDF_WORKERS, default 2; 0 renders in a thread instead). Finished PDFs are cached by the
+canonical hash of the analysis payload (timestamp included: the report prints it) in a
+byte-bounded LRU (PDF_CACHE_MAX_BYTES), and concurrent exports of the same payload share one render. Large reports are not cached: they are
+written to a temp file under PDF_SPOOL_DIR and streamed from there (see render_pdf_file).
+"""
+
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, Optional
+import logging
+
+from starlette.concurrency import run_in_threadpool
+
+from services.instrumentation import record_cache, timed, timed_import
+from utils.hashing import canonical_hash, VOLATILE_KEYS
+
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', '2'))
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+PDF_SPOOL_DIR = os.environ.get('PDF_SPOOL_DIR') or None  # None: the system temp dir
+# past this many comments reports use the chunked large-report layout and are streamed from disk
+LARGE_REPORT_COMMENTS = int(os.environ.get('PDF_LARGE_REPORT_COMMENTS', '500'))
+STREAM_CHUNK_SIZE = 64 * 1024
+# the report prints the payload timestamp, so unlike other content hashes the PDF key keeps it
+_PDF_VOLATILE_KEYS = tuple(k for k in VOLATILE_KEYS if k != 'timestamp')
+
+
+class PdfCache:
+    """LRU of rendered PDFs bounded by total size in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            pdf = self._items.get(key)
+            if pdf is not None:
+                self._items.move_to_end(key)
+            return pdf
+
+    def put(self, key: str, pdf: bytes):
+        if len(pdf) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._items[key] = pdf
+            self._size += len(pdf)
+            while self._size > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+
+def is_large_report(analysis: Dict[str, Any]) -> bool:
+    return len(analysis.get('comments') or []) > LARGE_REPORT_COMMENTS
+
+
+def _exporter():
+    # reportlab is only needed once something is rendered (in the pool workers by default)
+    return timed_import('services.pdf_exporter')
+
+
+def warm_pdf_styles():
+    _exporter().warm_pdf_styles()
+
+
+_cache = PdfCache(PDF_CACHE_MAX_BYTES)
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+# payload hash -> future of an in-progress render (single-flight per event loop)
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if PDF_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=warm_pdf_styles)
+        return _pool
+
+
+def start_pdf_pool():
+    """Spawn the worker pool (or, with PDF_WORKERS=0, build the local stylesheet) ahead of the first export."""
+    pool = _get_pool()
+    if pool is None:
+        warm_pdf_styles()
+        return
+    # one warm task per worker forces them all to spawn (and run the initializer) now
+    for f in [pool.submit(warm_pdf_styles) for _ in range(PDF_WORKERS)]:
+        f.result()
+
+
+def shutdown_pdf_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+async def _run(fn, *args):
+    pool = _get_pool()
+    if pool is None:
+        return await run_in_threadpool(fn, *args)
+    loop = asyncio.get_running_loop()
+    # the worker's own pdf_build timing stays in the worker process; record it here instead
+    with timed("pdf_build"):
+        return await loop.run_in_executor(pool, fn, *args)
+
+
+def build_report_bytes(payload: Dict[str, Any], group_by_severity: bool = False) -> bytes:
+    """Render a standard-layout report in the calling process."""
+    return _exporter().build_pdf_report(payload, large=False, group_by_severity=group_by_severity)
+
+
+def write_report_file(payload: Dict[str, Any], group_by_severity: bool = False) -> str:
+    """Render a large-mode report into a new temp file and return its path (the caller removes it)."""
+    fd, path = tempfile.mkstemp(prefix='code-review-', suffix='.pdf', dir=PDF_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            _exporter().write_pdf_report(payload, f, large=True, group_by_severity=group_by_severity)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+def iter_report_file(path: str) -> Iterator[bytes]:
+    """Stream a rendered report in chunks and delete it afterwards (also when the client goes away)."""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            logger.warning("Could not remove spooled report %s", path)
+
+
+async def render_pdf_file(payload: Dict[str, Any], group_by_severity: bool = False) -> str:
+    """Render a large report off the event loop; returns the temp file path for iter_report_file."""
+    return await _run(write_report_file, payload, group_by_severity)
+
+
+async def render_pdf(payload: Dict[str, Any], group_by_severity: bool = False) -> bytes:
+    """Return the PDF for an analysis payload, from cache when an identical payload was exported before."""
+    key = canonical_hash(payload, _PDF_VOLATILE_KEYS) + (':severity' if group_by_severity else '')
+    pdf = _cache.get(key)
+    record_cache('pdf', pdf is not None)
+    if pdf is not None:
+        return pdf
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        pdf = await _run(build_report_bytes, payload, group_by_severity)
+        _cache.put(key, pdf)
+        future.set_result(pdf)
+        return pdf
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # mark the exception as retrieved when nobody else was waiting on it
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(key, None)
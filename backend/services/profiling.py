@@ -0,0 +1,192 @@
+"""Operator-only, per-request profiling.
+
+A request opts in with `X-Profile: pstats` (deterministic, cProfile) or `X-Profile: collapsed`
+(sampling, flamegraph-ready collapsed stacks). It is honoured only when the server sets
+ENABLE_REQUEST_PROFILING=1 and, if PROFILE_TOKEN is set, the request carries a matching
+`X-Profile-Token`. Profiles are written to PROFILE_DIR and the hottest functions from
+`services/` are summarized in response headers.
+"""
+
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.environ.get("ENABLE_REQUEST_PROFILING", "").lower() in ("1", "true", "yes")
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")
+PROFILE_DIR = os.environ.get("PROFILE_DIR") or os.path.join(os.path.dirname(__file__), '..', 'data', 'profiles')
+SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "2")) / 1000.0
+PROFILE_MODES = ("pstats", "collapsed")
+
+# only frames from our own services package are reported as hot spots (minus the measuring code itself)
+_SERVICES_MARKER = os.sep + "services" + os.sep
+_SKIP_MODULES = ("profiling", "instrumentation")
+
+
+def profiling_requested(request) -> Optional[str]:
+    """Return the requested profile mode, or None if profiling is off or not authorized."""
+    if not PROFILING_ENABLED or request is None:
+        return None
+    mode = (request.headers.get("x-profile") or "").strip().lower()
+    if not mode:
+        return None
+    if mode in ("1", "true", "yes"):
+        mode = "pstats"
+    if mode not in PROFILE_MODES:
+        return None
+    if PROFILE_TOKEN:
+        supplied = request.headers.get("x-profile-token") or ""
+        if not hmac.compare_digest(supplied, PROFILE_TOKEN):
+            logger.warning("Rejected profiling request with missing/invalid token")
+            return None
+    return mode
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """Resolve a stored profile id to a path inside PROFILE_DIR (None if invalid or missing)."""
+    name = os.path.basename(profile_id)
+    if name != profile_id or not name.endswith(tuple("." + m for m in PROFILE_MODES)):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.exists(path) else None
+
+
+class _StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval and counts collapsed stacks."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+                frame = frame.f_back
+            names.reverse()
+            self.stacks[";".join(names)] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfile:
+    """Profile of one request; use .running() around the synchronous work to capture."""
+
+    def __init__(self, endpoint: str, mode: str):
+        self.endpoint = endpoint
+        self.mode = mode
+        self.profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{endpoint}-{uuid.uuid4().hex[:8]}.{mode}"
+        self.hotspots: List[Tuple[str, float]] = []
+        self._profiler: Optional[cProfile.Profile] = None
+        self._stacks: Counter = Counter()
+
+    @contextmanager
+    def running(self):
+        # both profilers only observe the calling thread, so enter this where the work runs
+        if self.mode == "pstats":
+            self._profiler = self._profiler or cProfile.Profile()
+            self._profiler.enable()
+            try:
+                yield self
+            finally:
+                self._profiler.disable()
+        else:
+            sampler = _StackSampler(threading.get_ident(), SAMPLE_INTERVAL)
+            sampler.start()
+            try:
+                yield self
+            finally:
+                sampler.stop()
+                self._stacks.update(sampler.stacks)
+
+    def save(self) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, self.profile_id)
+        if self.mode == "pstats":
+            if self._profiler is None:
+                self._profiler = cProfile.Profile()
+            self._profiler.dump_stats(path)
+            self.hotspots = self._pstats_hotspots()
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.hotspots = self._sampled_hotspots()
+        logger.info("Stored %s profile %s; services hot spots: %s", self.endpoint, path, self.hotspots)
+        return path
+
+    def _pstats_hotspots(self, top: int = 5) -> List[Tuple[str, float]]:
+        stats = pstats.Stats(self._profiler, stream=io.StringIO())
+        rows: Dict[str, float] = {}
+        for (filename, _, funcname), (_, _, _, cumtime, _) in stats.stats.items():
+            module = os.path.splitext(os.path.basename(filename))[0]
+            if _SERVICES_MARKER in filename and module not in _SKIP_MODULES:
+                key = f"{module}.{funcname}"
+                rows[key] = max(rows.get(key, 0.0), cumtime * 1000.0)
+        return sorted(rows.items(), key=lambda kv: kv[1], reverse=True)[:top]
+
+    def _sampled_hotspots(self, top: int = 5) -> List[Tuple[str, float]]:
+        inclusive: Counter = Counter()
+        for stack, count in self._stacks.items():
+            frames = set(f[len("services."):] for f in stack.split(";") if f.startswith("services."))
+            for f in frames:
+                if f.split(":", 1)[0] not in _SKIP_MODULES:
+                    inclusive[f.replace(":", ".")] += count
+        return [(name, n * SAMPLE_INTERVAL * 1000.0) for name, n in inclusive.most_common(top)]
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "X-Profile-Id": self.profile_id,
+            "X-Profile-Hotspots": ", ".join(f"{name};dur={ms:.1f}" for name, ms in self.hotspots),
+        }
+
+
+def start_profile(request, endpoint: str) -> Optional[RequestProfile]:
+    """Return a RequestProfile when the request asked (and is allowed) to be profiled, else None."""
+    mode = profiling_requested(request)
+    if mode is None:
+        return None
+    return RequestProfile(endpoint, mode)
+
+
+def finish_profile(profile: Optional[RequestProfile]) -> Dict[str, str]:
+    """Store the profile and return response headers describing it ({} when not profiling)."""
+    if profile is None:
+        return {}
+    try:
+        profile.save()
+        return profile.headers()
+    except Exception:
+        logger.exception("Could not store request profile")
+        return {}
+
+
+@contextmanager
+def profiled(profile: Optional[RequestProfile]):
+    """Run a block under the given profile, or plainly when profile is None."""
+    if profile is None:
+        yield
+        return
+    with profile.running():
+        yield
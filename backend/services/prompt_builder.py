@@ -0,0 +1,231 @@
+"""Compact code and metrics for the LLM prompts, within a per-feature token budget.
+
+Each feature's prompt gets the source prepared here instead of verbatim:
+
+- docstrings are shortened to their first line (PROMPT_DOCSTRINGS=shorten, the default),
+  dropped (strip) or left alone (keep); runs of blank lines collapse to one
+  (PROMPT_COLLAPSE_BLANK_LINES);
+- the review prompt gets every line prefixed with its line number in the original file, so
+  comment anchors stay accurate even though lines were removed;
+- only the metrics a feature uses are included.
+
+Tokens are estimated locally (about CHARS_PER_TOKEN characters per token, close enough for
+code). When code and metrics exceed the feature's budget (PROMPT_BUDGET_<FEATURE>, 0 for no
+limit), docstrings and comment-only lines are dropped first (`#` lines only in languages where
+`#` starts a comment, `//` lines only in brace languages, see services/languages); if that is not enough the middle
+of the file is cut, keeping its imports and def/class lines as an outline and a marker
+saying which lines were omitted.
+"""
+
+import ast
+import json
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+import logging
+
+from services.instrumentation import record_prompt
+from services.languages import BRACE_LANGUAGES, HASH_COMMENT_LANGUAGES, PYTHON
+
+logger = logging.getLogger(__name__)
+
+PROMPT_DOCSTRINGS = os.environ.get("PROMPT_DOCSTRINGS", "shorten").lower()
+COLLAPSE_BLANK_LINES = os.environ.get("PROMPT_COLLAPSE_BLANK_LINES", "1").lower() not in ("0", "false", "no")
+CHARS_PER_TOKEN = float(os.environ.get("PROMPT_CHARS_PER_TOKEN", "4"))
+
+# "context" is the file cached once per analysis and shared by all features (see gemini_client)
+_DEFAULT_BUDGETS = {"summary": 6000, "comments": 12000, "tags": 3000, "docs": 4000, "context": 12000}
+BUDGETS = {f: int(os.environ.get("PROMPT_BUDGET_" + f.upper(), str(b))) for f, b in _DEFAULT_BUDGETS.items()}
+
+# metrics each prompt actually uses; summary and docs get none
+FEATURE_METRICS = {
+    "comments": ("cc_avg", "mi_avg", "pylint_score", "naming_quality", "lines"),
+    "tags": ("cc_avg", "mi_avg", "oop_compliance", "func_count", "class_count", "lines"),
+}
+LINE_NUMBERED = ("comments", "context")
+
+# share of the code budget for the head of the file and for the outline of a cut middle;
+# the tail gets the rest
+_HEAD_SHARE = 0.6
+_OUTLINE_SHARE = 0.1
+# room for the two omission markers
+_MARKER_CHARS = 120
+_HASH_COMMENT_RE = re.compile(r"^\s*#")
+_SLASH_COMMENT_RE = re.compile(r"^\s*//")
+_OUTLINE_RE = re.compile(r"^\s*(import\s|from\s+\S+\s+import\s|(async\s+)?def\s|class\s|@)")
+
+Entry = Tuple[int, str]
+
+
+class PreparedCode:
+    """Code and metrics text ready to drop into a prompt."""
+
+    def __init__(self, code: str, metrics: str, tokens: int, truncated: bool, omitted_lines: int):
+        self.code = code
+        self.metrics = metrics
+        self.tokens = tokens
+        self.truncated = truncated
+        self.omitted_lines = omitted_lines
+
+
+def estimate_tokens(text: str) -> int:
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+
+def metrics_for(feature: str, metrics: Optional[Dict[str, Any]]) -> str:
+    """Compact JSON of the metrics the feature's prompt uses ("" when it uses none)."""
+    keys = FEATURE_METRICS.get(feature, ())
+    if not keys or not metrics:
+        return ""
+    return json.dumps({k: metrics[k] for k in keys if k in metrics}, separators=(",", ":"))
+
+
+def _docstrings(code: str) -> List[Tuple[int, int, str, bool]]:
+    """(first line, last line, first line of text, only statement in its body) per docstring."""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return []
+    found = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            body = node.body
+            if body and isinstance(body[0], ast.Expr) and isinstance(getattr(body[0], "value", None), ast.Constant) \
+                    and isinstance(body[0].value.value, str):
+                doc = body[0]
+                text = doc.value.value.strip()
+                first = text.split("\n", 1)[0].strip() if text else ""
+                found.append((doc.lineno, doc.end_lineno or doc.lineno, first, len(body) == 1))
+    return found
+
+
+def _apply_docstrings(entries: List[Entry], code: str, mode: str) -> List[Entry]:
+    if mode not in ("shorten", "strip"):
+        return entries
+    replaced: Dict[int, Optional[str]] = {}
+    for start, end, first, only in _docstrings(code):
+        for n in range(start, end + 1):
+            replaced[n] = None
+        indent = re.match(r"\s*", entries[start - 1][1]).group()
+        if mode == "shorten" and first:
+            replaced[start] = indent + '"""' + first.replace('"""', "'''") + '"""'
+        elif only:
+            # keep the body syntactically non-empty
+            replaced[start] = indent + "..."
+    if not replaced:
+        return entries
+    out = []
+    for n, text in entries:
+        if n in replaced:
+            if replaced[n] is not None:
+                out.append((n, replaced[n]))
+        else:
+            out.append((n, text))
+    return out
+
+
+def _collapse_blanks(entries: List[Entry]) -> List[Entry]:
+    out: List[Entry] = []
+    for n, text in entries:
+        if not text.strip() and out and not out[-1][1].strip():
+            continue
+        out.append((n, text))
+    return out
+
+
+def _render(entries: List[Entry], numbered: bool) -> str:
+    if numbered:
+        return "\n".join(f"{n}| {text}" if n else text for n, text in entries)
+    return "\n".join(text for _, text in entries)
+
+
+def _cut_middle(entries: List[Entry], numbered: bool, max_chars: int) -> Tuple[List[Entry], int]:
+    """Keep a head and a tail within max_chars, outlining what is cut; returns (entries, omitted lines)."""
+    def size(entry: Entry) -> int:
+        return len(_render([entry], numbered)) + 1
+
+    head_budget = int(max_chars * _HEAD_SHARE)
+    head: List[Entry] = []
+    used = 0
+    for entry in entries:
+        if used + size(entry) > head_budget:
+            break
+        head.append(entry)
+        used += size(entry)
+    rest = entries[len(head):]
+
+    tail_budget = max_chars - used - int(max_chars * _OUTLINE_SHARE) - _MARKER_CHARS
+    tail: List[Entry] = []
+    for entry in reversed(rest):
+        if size(entry) > tail_budget:
+            break
+        tail.insert(0, entry)
+        tail_budget -= size(entry)
+    middle = rest[:len(rest) - len(tail)]
+    if not middle or not (head or tail):
+        # nothing to cut, or lines too long to keep whole: the caller cuts characters instead
+        return entries, 0
+
+    outline_budget = int(max_chars * _OUTLINE_SHARE)
+    outline: List[Entry] = []
+    for entry in middle:
+        if _OUTLINE_RE.match(entry[1]) and size(entry) <= outline_budget:
+            outline.append(entry)
+            outline_budget -= size(entry)
+    omitted = len(middle) - len(outline)
+    first, last = middle[0][0], middle[-1][0]
+    marker = (0, f"... lines {first}-{last} shortened: {omitted} lines omitted"
+                 + (", outline kept" if outline else "") + " ...")
+    return head + [marker] + outline + [(0, "... end of omitted section ...")] + tail, omitted
+
+
+def _comment_line_re(language: Optional[str]) -> Optional[Pattern]:
+    # None is Python, as for fingerprints; elsewhere "#" is code (#include, #define, #[derive])
+    if language is None or language == PYTHON or language in HASH_COMMENT_LANGUAGES:
+        return _HASH_COMMENT_RE
+    if language in BRACE_LANGUAGES:
+        return _SLASH_COMMENT_RE
+    return None
+
+
+def prepare(feature: str, code: str, metrics: Optional[Dict[str, Any]] = None,
+            language: Optional[str] = None) -> PreparedCode:
+    """Compact code (and the feature's metrics) for the feature's prompt, within its token budget.
+
+    `language` (services/languages.detect_language) decides which comment-only lines may be
+    dropped when over budget; None is treated as Python.
+    """
+    numbered = feature in LINE_NUMBERED
+    metrics_text = metrics_for(feature, metrics)
+    budget = BUDGETS.get(feature, 0)
+
+    original = [(n, text.rstrip()) for n, text in enumerate(code.split("\n"), 1)]
+    entries = _apply_docstrings(original, code, PROMPT_DOCSTRINGS)
+    if COLLAPSE_BLANK_LINES:
+        entries = _collapse_blanks(entries)
+    rendered = _render(entries, numbered)
+    omitted = 0
+    truncated = False
+
+    max_chars = int(budget * CHARS_PER_TOKEN) - len(metrics_text)
+    if budget > 0 and len(rendered) > max_chars:
+        # first give up docstrings and comment-only lines, then the middle of the file
+        comment_re = _comment_line_re(language)
+        entries = _collapse_blanks([e for e in _apply_docstrings(original, code, "strip")
+                                    if comment_re is None or not comment_re.match(e[1])])
+        rendered = _render(entries, numbered)
+        if len(rendered) > max_chars:
+            entries, omitted = _cut_middle(entries, numbered, max(max_chars, 0))
+            rendered = _render(entries, numbered)
+            truncated = omitted > 0
+            if len(rendered) > max_chars:
+                # a few very long lines: hard cut
+                rendered = rendered[:max(max_chars, 0)] + "\n... truncated ..."
+                truncated = True
+
+    tokens = estimate_tokens(rendered) + estimate_tokens(metrics_text)
+    record_prompt(feature, tokens, truncated)
+    if truncated:
+        logger.info("Prompt for %s truncated to ~%d tokens (budget %d, %d lines omitted)", feature, tokens, budget, omitted)
+    return PreparedCode(rendered, metrics_text, tokens, truncated, omitted)
@@ -0,0 +1,193 @@
+"""Persistent cache of analysis results, keyed by exact content and by code fingerprint.
+
+Lookups for an upload go:
+
+1. exact: sha256 of the content bytes (plus mode and features) -> the stored result as is;
+2. fingerprint (services/fingerprint.py): same code modulo formatting, comments and, with
+   RESULT_CACHE_IGNORE_DOCSTRINGS (default on), docstrings. Summary, tags and docs are reused.
+   Local metrics are recomputed because they depend on formatting. Review comments are reused
+   only when every comment line can be remapped through the fingerprint anchors; otherwise the
+   review alone runs again;
+3. miss: full analysis, stored under both keys.
+
+Only LLM-backed runs go through the cache (local analysis is cheap and fully determined by the
+metrics), and only complete results are stored (no LLM errors, quota fallbacks or validation problems).
+The cache is a SQLite file next to the history store (RESULT_CACHE_PATH), shared by all
+workers; entries expire after RESULT_CACHE_TTL_SECONDS and the least recently used are
+trimmed past RESULT_CACHE_MAX_ENTRIES. RESULT_CACHE_ENABLED=0 turns it off.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from services.analyzer import run_analysis
+from services.fingerprint import fingerprint, remap_comments
+from services.languages import detect_language, PYTHON
+from services.instrumentation import timed, record_cache
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+RESULT_CACHE_PATH = os.environ.get('RESULT_CACHE_PATH') or os.path.join(
+    os.environ.get('HISTORY_DIR') or os.path.join(os.path.dirname(__file__), '..', 'data'), 'result_cache.sqlite3')
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get('RESULT_CACHE_TTL_SECONDS', str(7 * 86400)))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', '5000'))
+IGNORE_DOCSTRINGS = os.environ.get('RESULT_CACHE_IGNORE_DOCSTRINGS', '1').lower() not in ('0', 'false', 'no')
+
+# result keys that describe a failed or degraded run; such results are never cached
+_DEGRADED_KEYS = ('metrics_error', 'summary_error', 'comments_error', 'tags_error', 'docs_error',
+                  'summary_validation_errors', 'comments_validation_errors', 'tags_validation_errors',
+                  'docs_validation_errors', 'llm_disabled', 'llm_error')
+# reused as is on a fingerprint hit
+_REUSABLE_KEYS = ('summary', 'tags', 'docs', 'docs_links')
+_REVIEW_ONLY = {'metrics': False, 'summary': False, 'review': True, 'tags': False, 'docs': False}
+
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        return conn
+    os.makedirs(os.path.dirname(os.path.abspath(RESULT_CACHE_PATH)), exist_ok=True)
+    conn = sqlite3.connect(RESULT_CACHE_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS analysis_results (
+            content_key TEXT PRIMARY KEY,
+            fingerprint_key TEXT NOT NULL,
+            anchors BLOB NOT NULL,
+            data BLOB NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        ) WITHOUT ROWID""")
+    conn.execute('CREATE INDEX IF NOT EXISTS analysis_results_fingerprint ON analysis_results(fingerprint_key, last_used)')
+    conn.execute('CREATE INDEX IF NOT EXISTS analysis_results_last_used ON analysis_results(last_used)')
+    _local.conn = conn
+    return conn
+
+
+def _scope(mode: str, features: Dict[str, Any], language: str) -> str:
+    # results depend on the mode, the requested features and the language (local metrics), never on who asked
+    scope = mode + '|' + json.dumps(features or {}, sort_keys=True, separators=(',', ':'))
+    return scope if language == PYTHON else scope + '|' + language
+
+
+def _key(scope: str, value: str) -> str:
+    return hashlib.sha256((scope + '\x00' + value).encode('utf-8')).hexdigest()
+
+
+def _pack(obj: Any) -> bytes:
+    return zlib.compress(json.dumps(obj, separators=(',', ':'), default=str).encode('utf-8'), 6)
+
+
+def _unpack(data: bytes) -> Any:
+    return json.loads(zlib.decompress(data))
+
+
+def _cacheable(results: Dict[str, Any]) -> bool:
+    return not any(results.get(k) for k in _DEGRADED_KEYS)
+
+
+def _get(content_key: str, fingerprint_key: str) -> Tuple[Optional[str], Optional[sqlite3.Row]]:
+    """Return ('exact'|'fingerprint'|None, row)."""
+    conn = _connect()
+    cutoff = time.time() - RESULT_CACHE_TTL_SECONDS
+    row = conn.execute('SELECT * FROM analysis_results WHERE content_key = ? AND created_at >= ?',
+                       (content_key, cutoff)).fetchone()
+    if row is not None:
+        return 'exact', row
+    row = conn.execute('SELECT * FROM analysis_results WHERE fingerprint_key = ? AND created_at >= ? '
+                       'ORDER BY last_used DESC LIMIT 1', (fingerprint_key, cutoff)).fetchone()
+    return ('fingerprint', row) if row is not None else (None, None)
+
+
+def _touch(content_key: str):
+    _connect().execute('UPDATE analysis_results SET last_used = ? WHERE content_key = ?', (time.time(), content_key))
+
+
+def _put(content_key: str, fingerprint_key: str, anchors: List[Tuple[int, int]], results: Dict[str, Any]):
+    conn = _connect()
+    now = time.time()
+    stored = {k: v for k, v in results.items() if k != 'timings'}
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('INSERT OR REPLACE INTO analysis_results (content_key, fingerprint_key, anchors, data, created_at, last_used) '
+                     'VALUES (?, ?, ?, ?, ?, ?)', (content_key, fingerprint_key, _pack(anchors), _pack(stored), now, now))
+        conn.execute('DELETE FROM analysis_results WHERE created_at < ?', (now - RESULT_CACHE_TTL_SECONDS,))
+        if RESULT_CACHE_MAX_ENTRIES > 0:
+            conn.execute('DELETE FROM analysis_results WHERE content_key IN (SELECT content_key FROM analysis_results '
+                         'ORDER BY last_used DESC LIMIT -1 OFFSET ?)', (RESULT_CACHE_MAX_ENTRIES,))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def _from_fingerprint(row: sqlite3.Row, code: str, anchors, features: Dict[str, Any], mode: str,
+                      api_key: Optional[str], api_key_source: Optional[str], filename: Optional[str]) -> Dict[str, Any]:
+    cached = _unpack(row['data'])
+    # metrics depend on formatting (pylint, maintainability index), so recompute them locally
+    results = run_analysis(code, {'metrics': features.get('metrics', True), 'summary': False, 'review': False,
+                                  'tags': False, 'docs': False}, 'local', filename=filename)
+    for key in _REUSABLE_KEYS:
+        if key in cached:
+            results[key] = cached[key]
+    if 'comments' in cached:
+        comments = remap_comments(cached['comments'], [tuple(a) for a in _unpack(row['anchors'])], anchors)
+        record_cache('result_comments', comments is not None)
+        if comments is None:
+            review = run_analysis(code, _REVIEW_ONLY, mode, api_key=api_key, api_key_source=api_key_source)
+            for key, value in review.items():
+                if key.startswith(('comments', 'llm_')):
+                    results[key] = value
+        else:
+            results['comments'] = comments
+    return results
+
+
+def cached_analysis(code: str, features: Dict[str, Any], mode: str = 'local', api_key: Optional[str] = None,
+                    api_key_source: Optional[str] = None, filename: Optional[str] = None) -> Dict[str, Any]:
+    """run_analysis with the exact/fingerprint result cache in front of it (LLM-backed runs only)."""
+    use_llm = (mode == 'cloud') and bool(api_key)
+    if not RESULT_CACHE_ENABLED or not use_llm:
+        return run_analysis(code, features, mode, api_key=api_key, api_key_source=api_key_source, filename=filename)
+    language = detect_language(filename, code)
+    scope = _scope(mode, features, language)
+    with timed('result_cache'):
+        fp, anchors = fingerprint(code, ignore_docstrings=IGNORE_DOCSTRINGS, language=language)
+        content_key = _key(scope, hashlib.sha256(code.encode('utf-8')).hexdigest())
+        fingerprint_key = _key(scope, fp)
+        try:
+            kind, row = _get(content_key, fingerprint_key)
+        except sqlite3.Error:
+            logger.warning("Result cache lookup failed", exc_info=True)
+            kind, row = None, None
+    record_cache('result', kind == 'exact')
+    if kind == 'exact':
+        _touch(content_key)
+        return _unpack(row['data'])
+    record_cache('result_fingerprint', kind == 'fingerprint')
+    if kind == 'fingerprint':
+        results = _from_fingerprint(row, code, anchors, features, mode, api_key, api_key_source, filename)
+    else:
+        results = run_analysis(code, features, mode, api_key=api_key, api_key_source=api_key_source, filename=filename)
+    if _cacheable(results):
+        try:
+            _put(content_key, fingerprint_key, anchors, results)
+        except sqlite3.Error:
+            logger.warning("Could not store analysis result in cache", exc_info=True)
+    return results
+
+
+def clear_result_cache():
+    _connect().execute('DELETE FROM analysis_results')
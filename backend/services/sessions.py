@@ -0,0 +1,319 @@
+"""Editor analysis sessions with incremental re-review.
+
+A client that sends a session_id with /analyze gets its last content and results kept here
+(in memory, per process, LRU + TTL). On the next submission the new content is diffed against
+the previous version:
+
+- comments on unchanged lines are kept, with line numbers remapped through the diff;
+- comments on deleted or modified lines are dropped;
+- only the functions containing modified lines (or the changed hunks plus a little context,
+  outside functions / for non-Python code) are sent to the LLM for a fresh review, all of them
+  in a single request;
+- summary and tags are reused, docs are re-requested only when the imports changed;
+- local metrics are always recomputed for the whole file (they are cheap and file-global).
+
+A session belongs to the API key that opened it (stored as its key_id hash); a submission with
+another key is rejected rather than diffed against, or allowed to overwrite, someone else's code.
+
+When the edit touches too much of the file (or too many separate places), the previous run was not a full LLM run, or the
+mode/features differ, a normal full analysis runs instead.
+"""
+
+import ast
+import difflib
+import os
+import re
+import textwrap
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+import logging
+
+from services.analyzer import run_analysis
+from services.result_cache import cached_analysis
+from services.instrumentation import timed, record_cache
+from services.usage import key_id
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL_SECONDS = float(os.environ.get("ANALYSIS_SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX = int(os.environ.get("ANALYSIS_SESSION_MAX", "1000"))
+# above this fraction of re-reviewed lines a full pass is cheaper and gives a better summary
+INCREMENTAL_MAX_RATIO = float(os.environ.get("INCREMENTAL_MAX_RATIO", "0.6"))
+# edits scattered over more separate ranges than this get a full pass instead
+INCREMENTAL_MAX_SPANS = int(os.environ.get("INCREMENTAL_MAX_SPANS", "8"))
+# changed lines outside a function are reviewed with this many lines of context around the hunk
+HUNK_CONTEXT_LINES = 3
+# functions longer than this are reviewed hunk-wise instead of whole
+MAX_FUNCTION_LINES = 200
+
+# only the review runs per snippet; everything else is reused or recomputed file-wide
+_REVIEW_ONLY = {"metrics": False, "summary": False, "review": True, "tags": False, "docs": False}
+_IMPORT_RE = re.compile(r"^\s*(import|from)\s+\S")
+
+
+class SessionKeyMismatch(Exception):
+    """The session was opened with a different API key (or none); its content and results are not shared."""
+
+
+class AnalysisSession:
+    def __init__(self, session_id: str, file_name: Optional[str], content: str, results: Dict[str, Any],
+                 mode: str, features: Dict[str, Any], owner: str = "default"):
+        self.session_id = session_id
+        # key_id() of the API key that opened the session
+        self.owner = owner
+        self.file_name = file_name
+        self.content = content
+        self.results = results
+        self.mode = mode
+        self.features = features
+        self.version = 1
+        self.touched = time.time()
+
+
+class SessionStore:
+    """In-memory LRU of sessions with idle expiry."""
+
+    def __init__(self, max_sessions: int, ttl: float):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._items: "OrderedDict[str, AnalysisSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._items:
+            key, oldest = next(iter(self._items.items()))
+            if now - oldest.touched <= self.ttl:
+                break
+            del self._items[key]
+
+    def get(self, session_id: str) -> Optional[AnalysisSession]:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session = self._items.get(session_id)
+            if session is not None:
+                session.touched = now
+                self._items.move_to_end(session_id)
+            return session
+
+    def put(self, session: AnalysisSession):
+        with self._lock:
+            session.touched = time.time()
+            self._items[session.session_id] = session
+            self._items.move_to_end(session.session_id)
+            while len(self._items) > self.max_sessions:
+                self._items.popitem(last=False)
+
+    def drop(self, session_id: str):
+        with self._lock:
+            self._items.pop(session_id, None)
+
+
+SESSIONS = SessionStore(SESSION_MAX, SESSION_TTL_SECONDS)
+
+
+def _diff_lines(old_lines: List[str], new_lines: List[str]) -> Tuple[Dict[int, int], Set[int]]:
+    """Return (old line -> new line for unchanged lines, new lines that were added or modified), 1-based."""
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    mapping: Dict[int, int] = {}
+    changed: Set[int] = set()
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for k in range(i2 - i1):
+                mapping[i1 + k + 1] = j1 + k + 1
+        elif tag in ("replace", "insert"):
+            changed.update(range(j1 + 1, j2 + 1))
+        else:
+            # a pure deletion modifies whatever surrounds it
+            changed.update(n for n in (j1, j1 + 1) if 1 <= n <= len(new_lines))
+    return mapping, changed
+
+
+def _function_spans(code: str) -> Optional[List[Tuple[int, int]]]:
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+    spans = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            spans.append((start, node.end_lineno or node.lineno))
+    return spans
+
+
+def _review_spans(code: str, changed: Set[int], line_count: int) -> List[Tuple[int, int]]:
+    """Smallest enclosing function per changed line, else the line with context; merged and sorted."""
+    functions = _function_spans(code) or []
+    spans = []
+    for line in changed:
+        enclosing = [s for s in functions if s[0] <= line <= s[1] and s[1] - s[0] < MAX_FUNCTION_LINES]
+        if enclosing:
+            spans.append(min(enclosing, key=lambda s: s[1] - s[0]))
+        else:
+            spans.append((max(1, line - HUNK_CONTEXT_LINES), min(line_count, line + HUNK_CONTEXT_LINES)))
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _imports(lines: List[str]) -> Set[str]:
+    return {l.strip() for l in lines if _IMPORT_RE.match(l)}
+
+
+def _review_batch(lines: List[str], spans: List[Tuple[int, int]], mode: str, api_key, api_key_source,
+                  filename: Optional[str] = None) -> Dict[str, Any]:
+    """Review every span in one LLM request: the dedented spans joined by blank lines, comments mapped back."""
+    snippet: List[str] = []
+    # snippet line (0-based) -> (file line, indent removed from it)
+    origin: List[Tuple[int, int]] = []
+    for start, end in spans:
+        if snippet:
+            snippet.append("")
+            origin.append((start, 0))
+        raw = "\n".join(lines[start - 1:end])
+        dedented = textwrap.dedent(raw)
+        indent = len(raw.split("\n", 1)[0]) - len(dedented.split("\n", 1)[0])
+        for offset, text in enumerate(dedented.split("\n")):
+            snippet.append(text)
+            origin.append((start + offset, indent))
+    # the file name, not the snippet, tells the language (a span rarely has the #include)
+    results = run_analysis("\n".join(snippet), _REVIEW_ONLY, mode, api_key=api_key, api_key_source=api_key_source,
+                           filename=filename)
+    comments = []
+    for c in results.get("comments") or []:
+        c = dict(c)
+        line = c.get("line")
+        # snippet-relative -> file lines; unplaceable comments anchor at the start of the first span
+        file_line, indent = origin[line - 1] if isinstance(line, int) and 1 <= line <= len(origin) else (spans[0][0], 0)
+        c["line"] = file_line
+        if isinstance(c.get("column"), int) and c["column"] > 0:
+            c["column"] += indent
+        comments.append(c)
+    results["comments"] = comments
+    return results
+
+
+def _can_reuse(session: Optional[AnalysisSession], mode: str, features: Dict[str, Any], use_llm: bool) -> bool:
+    if session is None or not use_llm:
+        return False
+    previous = session.results
+    return (session.mode == mode and session.features == features and features.get("review", True)
+            and previous.get("comments") is not None and not previous.get("llm_disabled"))
+
+
+def _incremental(session: AnalysisSession, code: str, features: Dict[str, Any], mode: str,
+                 api_key: Optional[str], api_key_source: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Re-review only what changed since the session's last version; None when a full pass is better."""
+    old_lines = session.content.split("\n")
+    new_lines = code.split("\n")
+    with timed("incremental_diff"):
+        mapping, changed = _diff_lines(old_lines, new_lines)
+        spans = _review_spans(code, changed, len(new_lines))
+    reviewed = sum(e - s + 1 for s, e in spans)
+    if reviewed > INCREMENTAL_MAX_RATIO * len(new_lines) or len(spans) > INCREMENTAL_MAX_SPANS:
+        return None
+
+    previous = session.results
+    # metrics are file-global; recompute them (no LLM) rather than patching
+    results = run_analysis(code, {"metrics": features.get("metrics", True), "summary": False, "review": False,
+                                  "tags": False, "docs": False}, "local", filename=session.file_name)
+    for key in ("summary", "summary_validation_errors", "summary_error", "tags", "tags_validation_errors", "tags_error"):
+        if key in previous:
+            results[key] = previous[key]
+
+    def in_reviewed(line):
+        return any(s <= line <= e for s, e in spans)
+
+    kept = []
+    for c in previous.get("comments") or []:
+        line = c.get("line")
+        if not isinstance(line, int) or line < 1:
+            kept.append(c)
+            continue
+        new_line = mapping.get(line)
+        if new_line is None or in_reviewed(new_line):
+            continue
+        kept.append(dict(c, line=new_line))
+
+    fresh = []
+    if spans:
+        partial = _review_batch(new_lines, spans, mode, api_key, api_key_source, session.file_name)
+        fresh = partial["comments"]
+        for key in ("comments_validation_errors", "comments_error", "llm_disabled", "llm_disabled_reason",
+                    "llm_retry_after_seconds", "llm_disabled_key_source", "llm_error"):
+            if partial.get(key) is not None:
+                results[key] = partial[key]
+    results["comments"] = sorted(kept + fresh, key=lambda c: (c.get("line") or 0))
+
+    if features.get("docs", True):
+        if _imports(old_lines) != _imports(new_lines):
+            docs_run = run_analysis(code, {"metrics": False, "summary": False, "review": False, "tags": False,
+                                           "docs": True}, mode, api_key=api_key, api_key_source=api_key_source,
+                                 filename=session.file_name)
+            for key in ("docs", "docs_links", "docs_validation_errors", "docs_error"):
+                if key in docs_run:
+                    results[key] = docs_run[key]
+        else:
+            for key in ("docs", "docs_links", "docs_validation_errors", "docs_error"):
+                if key in previous:
+                    results[key] = previous[key]
+
+    results["incremental"] = {
+        "base_version": session.version,
+        "changed_lines": len(changed),
+        "reviewed_ranges": [[s, e] for s, e in spans],
+        "reviewed_lines": reviewed,
+        "comments_kept": len(kept),
+        "comments_new": len(fresh),
+    }
+    return results
+
+
+def check_session_key(session_id: str, api_key: Optional[str]):
+    """Raise SessionKeyMismatch when a live session with this id belongs to another API key."""
+    session = SESSIONS.get(session_id)
+    if session is not None and session.owner != key_id(api_key):
+        raise SessionKeyMismatch(session_id)
+
+
+def analyze_in_session(session_id: str, file_name: Optional[str], code: str, features: Dict[str, Any],
+                       mode: str = "local", api_key: Optional[str] = None, api_key_source: Optional[str] = None,
+                       incremental: bool = True) -> Dict[str, Any]:
+    """run_analysis for an editor session: incremental against the session's last version when possible.
+
+    Raises SessionKeyMismatch when the session was opened with another API key.
+    """
+    owner = key_id(api_key)
+    session = SESSIONS.get(session_id)
+    if session is not None and session.owner != owner:
+        raise SessionKeyMismatch(session_id)
+    if session is not None and session.file_name != file_name:
+        session = None
+    use_llm = (mode == "cloud") and bool(api_key)
+    results = None
+    if incremental and _can_reuse(session, mode, features, use_llm):
+        if session.content == code:
+            results = dict(session.results, incremental={"base_version": session.version, "changed_lines": 0,
+                                                         "reviewed_ranges": [], "reviewed_lines": 0,
+                                                         "comments_kept": len(session.results.get("comments") or []),
+                                                         "comments_new": 0})
+        else:
+            results = _incremental(session, code, features, mode, api_key, api_key_source)
+    record_cache("session", results is not None)
+    if results is None:
+        results = cached_analysis(code, features, mode, api_key=api_key, api_key_source=api_key_source,
+                                  filename=file_name)
+
+    stored = {k: v for k, v in results.items() if k not in ("incremental", "timings")}
+    updated = AnalysisSession(session_id, file_name, code, stored, mode, features, owner)
+    if session is not None:
+        updated.version = session.version + 1
+    SESSIONS.put(updated)
+    return results
@@ -0,0 +1,248 @@
+"""LLM token accounting per call, feature, API key and day, with per-key daily budgets.
+
+gemini_client reports the usage metadata of every model call here (record_call). Each call
+is added to:
+
+- the collector of the current request (collect_usage), which the router returns as
+  `llm_usage`;
+- the Prometheus counters in services/instrumentation;
+- daily aggregates in SQLite (USAGE_DB_PATH), per UTC day, key, key source and feature,
+  served by GET /usage.
+
+Keys are identified by a short hash (key_id), never stored in clear.
+
+LLM_DAILY_TOKEN_BUDGET caps the tokens (input + output) a single key may use per UTC day
+(0: no cap). LLM_DAILY_TOKEN_BUDGETS overrides it per key source, e.g.
+"form:200000,header:200000,server_env:0". A key over its budget gets local-only analysis,
+like a provider quota error, until the day rolls over. The budget is checked once, before an
+analysis' feature calls, so the analysis that crosses it still completes: a key can end the
+day over its budget by up to one analysis' worth of tokens (summary, review, tags and docs).
+
+GET /usage lists spend per key, key source and feature, so it is only served with
+USAGE_TOKEN set and a matching `X-Usage-Token` header; without USAGE_TOKEN it is off (404).
+
+Cost is estimated from LLM_PRICE_INPUT_PER_MTOK, LLM_PRICE_CACHED_PER_MTOK and
+LLM_PRICE_OUTPUT_PER_MTOK (USD per million tokens; 0 when unset).
+"""
+
+import contextvars
+import datetime
+import hashlib
+import hmac
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+import logging
+
+from services.instrumentation import record_llm_tokens
+
+logger = logging.getLogger(__name__)
+
+USAGE_DB_PATH = os.environ.get('USAGE_DB_PATH') or os.path.join(
+    os.environ.get('HISTORY_DIR') or os.path.join(os.path.dirname(__file__), '..', 'data'), 'usage.sqlite3')
+USAGE_RETENTION_DAYS = int(os.environ.get('USAGE_RETENTION_DAYS', '400'))
+DAILY_TOKEN_BUDGET = int(os.environ.get('LLM_DAILY_TOKEN_BUDGET', '0'))
+USAGE_TOKEN = os.environ.get('USAGE_TOKEN')
+PRICE_INPUT_PER_MTOK = float(os.environ.get('LLM_PRICE_INPUT_PER_MTOK', '0'))
+PRICE_CACHED_PER_MTOK = float(os.environ.get('LLM_PRICE_CACHED_PER_MTOK', '0'))
+PRICE_OUTPUT_PER_MTOK = float(os.environ.get('LLM_PRICE_OUTPUT_PER_MTOK', '0'))
+
+
+def _parse_budgets(value: str) -> Dict[str, int]:
+    budgets = {}
+    for item in value.split(','):
+        source, _, amount = item.partition(':')
+        if source.strip() and amount.strip():
+            try:
+                budgets[source.strip()] = int(amount)
+            except ValueError:
+                logger.warning("Ignoring invalid LLM_DAILY_TOKEN_BUDGETS entry %r", item)
+    return budgets
+
+
+SOURCE_BUDGETS = _parse_budgets(os.environ.get('LLM_DAILY_TOKEN_BUDGETS', ''))
+
+_FIELDS = ('calls', 'input_tokens', 'cached_tokens', 'output_tokens')
+
+_local = threading.local()
+
+
+def key_id(api_key: Optional[str]) -> str:
+    """Stable, non-secret identifier of an API key."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16] if api_key else 'default'
+
+
+def _today() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+
+
+def estimate_cost(input_tokens: int, cached_tokens: int, output_tokens: int) -> float:
+    uncached = max(input_tokens - cached_tokens, 0)
+    return round((uncached * PRICE_INPUT_PER_MTOK + cached_tokens * PRICE_CACHED_PER_MTOK
+                  + output_tokens * PRICE_OUTPUT_PER_MTOK) / 1e6, 6)
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        return conn
+    os.makedirs(os.path.dirname(os.path.abspath(USAGE_DB_PATH)), exist_ok=True)
+    conn = sqlite3.connect(USAGE_DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS llm_usage (
+            day TEXT NOT NULL,
+            key_id TEXT NOT NULL,
+            key_source TEXT NOT NULL,
+            feature TEXT NOT NULL,
+            calls INTEGER NOT NULL DEFAULT 0,
+            input_tokens INTEGER NOT NULL DEFAULT 0,
+            cached_tokens INTEGER NOT NULL DEFAULT 0,
+            output_tokens INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, key_id, key_source, feature)
+        ) WITHOUT ROWID""")
+    cutoff = (datetime.datetime.now(datetime.timezone.utc).date()
+              - datetime.timedelta(days=USAGE_RETENTION_DAYS)).isoformat()
+    conn.execute('DELETE FROM llm_usage WHERE day < ?', (cutoff,))
+    _local.conn = conn
+    return conn
+
+
+class UsageCollector:
+    """Token usage of the LLM calls made while handling one request."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.features: Dict[str, Dict[str, int]] = {}
+
+    def add(self, feature: str, input_tokens: int, cached_tokens: int, output_tokens: int):
+        with self._lock:
+            f = self.features.setdefault(feature, dict.fromkeys(_FIELDS, 0))
+            f['calls'] += 1
+            f['input_tokens'] += input_tokens
+            f['cached_tokens'] += cached_tokens
+            f['output_tokens'] += output_tokens
+
+    @property
+    def calls(self) -> int:
+        return sum(f['calls'] for f in self.features.values())
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            features = {name: dict(f) for name, f in self.features.items()}
+        total = {k: sum(f[k] for f in features.values()) for k in _FIELDS}
+        for f in list(features.values()) + [total]:
+            f['estimated_cost_usd'] = estimate_cost(f['input_tokens'], f['cached_tokens'], f['output_tokens'])
+        return {'features': features, 'total': total}
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar('code_review_llm_usage', default=None)
+
+
+@contextmanager
+def collect_usage():
+    """Collect the usage of every LLM call made in this context (including threads that copy it)."""
+    collector = UsageCollector()
+    token = _current.set(collector)
+    try:
+        yield collector
+    finally:
+        _current.reset(token)
+
+
+def record_call(feature: Optional[str], key: str, key_source: Optional[str], input_tokens: int,
+                cached_tokens: int, output_tokens: int):
+    feature = feature or 'other'
+    key_source = key_source or 'unknown'
+    record_llm_tokens(feature, key_source, input_tokens, cached_tokens, output_tokens)
+    collector = _current.get()
+    if collector is not None:
+        collector.add(feature, input_tokens, cached_tokens, output_tokens)
+    try:
+        _connect().execute(
+            'INSERT INTO llm_usage (day, key_id, key_source, feature, calls, input_tokens, cached_tokens, output_tokens) '
+            'VALUES (?, ?, ?, ?, 1, ?, ?, ?) ON CONFLICT (day, key_id, key_source, feature) DO UPDATE SET '
+            'calls = calls + 1, input_tokens = input_tokens + excluded.input_tokens, '
+            'cached_tokens = cached_tokens + excluded.cached_tokens, output_tokens = output_tokens + excluded.output_tokens',
+            (_today(), key, key_source, feature, input_tokens, cached_tokens, output_tokens))
+    except sqlite3.Error:
+        logger.warning("Could not record LLM usage", exc_info=True)
+
+
+def daily_budget(key_source: Optional[str]) -> int:
+    return SOURCE_BUDGETS.get(key_source or '', DAILY_TOKEN_BUDGET)
+
+
+def tokens_used_today(key: str) -> int:
+    row = _connect().execute('SELECT COALESCE(SUM(input_tokens + output_tokens), 0) FROM llm_usage '
+                             'WHERE day = ? AND key_id = ?', (_today(), key)).fetchone()
+    return int(row[0])
+
+
+def seconds_until_reset() -> float:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time(),
+                                         tzinfo=datetime.timezone.utc)
+    return (midnight - now).total_seconds()
+
+
+def budget_exceeded(api_key: Optional[str], key_source: Optional[str]) -> bool:
+    """True when the key has used up its daily token budget (never on a storage error)."""
+    budget = daily_budget(key_source)
+    if budget <= 0:
+        return False
+    try:
+        return tokens_used_today(key_id(api_key)) >= budget
+    except sqlite3.Error:
+        logger.warning("Could not read LLM usage for the budget check", exc_info=True)
+        return False
+
+
+def usage_authorized(request) -> bool:
+    """True when USAGE_TOKEN is set and the request carries it in X-Usage-Token."""
+    if not USAGE_TOKEN or request is None:
+        return False
+    supplied = request.headers.get('x-usage-token') or ''
+    if not hmac.compare_digest(supplied, USAGE_TOKEN):
+        logger.warning("Rejected usage report request with missing/invalid token")
+        return False
+    return True
+
+
+def usage_report(days: int = 7, key: Optional[str] = None, key_source: Optional[str] = None) -> Dict[str, Any]:
+    """Daily aggregates for the last `days` UTC days, with totals per feature and per key source."""
+    since = (datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=max(days, 1) - 1)).isoformat()
+    query = 'SELECT * FROM llm_usage WHERE day >= ?'
+    params: List[Any] = [since]
+    if key:
+        query += ' AND key_id = ?'
+        params.append(key)
+    if key_source:
+        query += ' AND key_source = ?'
+        params.append(key_source)
+    rows = [dict(r) for r in _connect().execute(query + ' ORDER BY day DESC, key_id, feature', params)]
+
+    def totals(group: str) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        for r in rows:
+            t = out.setdefault(r[group], dict.fromkeys(_FIELDS, 0))
+            for k in _FIELDS:
+                t[k] += r[k]
+        for t in out.values():
+            t['estimated_cost_usd'] = estimate_cost(t['input_tokens'], t['cached_tokens'], t['output_tokens'])
+        return out
+
+    for r in rows:
+        r['estimated_cost_usd'] = estimate_cost(r['input_tokens'], r['cached_tokens'], r['output_tokens'])
+    return {
+        'since': since,
+        'rows': rows,
+        'by_feature': totals('feature'),
+        'by_key_source': totals('key_source'),
+        'by_day': totals('day'),
+        'budgets': {'default': DAILY_TOKEN_BUDGET, **SOURCE_BUDGETS},
+    }
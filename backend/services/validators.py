@@ -2,7 +2,9 @@ import re
 from typing import Any, List, Dict, Tuple, Optional
 from pydantic import ValidationError
 from models.schemas import CommentModel, SummaryModel, DocsModel
+from services.instrumentation import instrumented
 
+@instrumented("pydantic_validation")
 def validate_comments(raw: Any) -> Tuple[List[Dict], List[str]]:
     """
     Validate/clean comments using Pydantic CommentModel.
@@ -31,6 +33,7 @@ def validate_comments(raw: Any) -> Tuple[List[Dict], List[str]]:
             errors.append(f"comment[{idx}] unexpected error: {str(e)}")
     return cleaned, errors
 
+@instrumented("pydantic_validation")
 def validate_tags(raw: Any) -> Tuple[List[str], List[str]]:
     errors: List[str] = []
     cleaned: List[str] = []
@@ -45,6 +48,7 @@ def validate_tags(raw: Any) -> Tuple[List[str], List[str]]:
         errors.append("tags must be an array of strings")
     return cleaned, errors
 
+@instrumented("pydantic_validation")
 def validate_summary(raw: Any) -> Tuple[Optional[Dict[str, Any]], List[str]]:
     errors: List[str] = []
     if raw is None:
@@ -65,6 +69,7 @@ def validate_summary(raw: Any) -> Tuple[Optional[Dict[str, Any]], List[str]]:
         errors.append(str(e))
         return None, errors
 
+@instrumented("pydantic_validation")
 def validate_docs(raw: Any) -> Tuple[List[str], List[str]]:
     errors: List[str] = []
     cleaned: List[str] = []
@@ -0,0 +1,75 @@
+"""Optional startup warmup and the readiness state behind GET /ready.
+
+With WARMUP_ON_STARTUP=1 the app loads the lazily imported stacks in a background thread
+right after startup: it resolves the LLM model for the server key, runs pylint once, and
+builds the PDF styles and worker pool. /ready answers 503 until that has finished, so a
+load balancer only routes traffic to warm workers. Without the flag the app is ready immediately
+and everything loads on first use. A failing step is logged and reported but does not
+keep the worker unready.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict
+import logging
+
+from services.instrumentation import WARMUP_SECONDS, timed_import
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "").lower() in ("1", "true", "yes")
+
+_ready = threading.Event()
+_status: Dict[str, Any] = {'warmup': 'pending' if WARMUP_ON_STARTUP else 'disabled', 'steps': {}}
+_lock = threading.Lock()
+
+
+def _warm_llm():
+    timed_import('services.gemini_client').warm_model()
+
+
+def _warm_pylint():
+    timed_import('services.metrics').warm_pylint()
+
+
+def _warm_pdf():
+    timed_import('services.pdf_jobs').start_pdf_pool()
+
+
+WARMUP_STEPS = (('llm_model', _warm_llm), ('pylint', _warm_pylint), ('pdf', _warm_pdf))
+
+
+def run_warmup():
+    with _lock:
+        _status['warmup'] = 'running'
+    for name, step in WARMUP_STEPS:
+        start = time.perf_counter()
+        try:
+            step()
+            outcome = 'ok'
+        except Exception as e:
+            logger.exception("Warmup step %s failed", name)
+            outcome = f'error: {e}'
+        elapsed = time.perf_counter() - start
+        WARMUP_SECONDS.set(elapsed, step=name)
+        with _lock:
+            _status['steps'][name] = {'status': outcome, 'seconds': round(elapsed, 3)}
+    with _lock:
+        _status['warmup'] = 'done'
+    _ready.set()
+    logger.info("Warmup finished: %s", _status['steps'])
+
+
+def start_warmup():
+    """Called from the app lifespan: run the warmup in the background, or become ready at once."""
+    if not WARMUP_ON_STARTUP:
+        _ready.set()
+        return
+    threading.Thread(target=run_warmup, name="startup-warmup", daemon=True).start()
+
+
+def readiness() -> Dict[str, Any]:
+    with _lock:
+        steps = {k: dict(v) for k, v in _status['steps'].items()}
+        return {'ready': _ready.is_set(), 'warmup': _status['warmup'], 'steps': steps}
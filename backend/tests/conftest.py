@@ -0,0 +1,58 @@
+# Test configuration: everything runs offline and in a scratch directory.
+# Services read their settings at import time, so the environment is set up here, before any
+# test module imports them: the replay LLM with stub answers (services/llm_replay.py), and
+# history, result cache and usage databases under a temporary HISTORY_DIR.
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+_SCRATCH = tempfile.mkdtemp(prefix='code-review-tests-')
+os.environ['HISTORY_DIR'] = _SCRATCH
+os.environ['LLM_BACKEND'] = 'replay'
+os.environ['LLM_REPLAY_ON_MISS'] = 'stub'
+os.environ['LLM_CASSETTE_DIR'] = os.path.join(_SCRATCH, 'cassettes')
+os.environ['PROFILE_DIR'] = os.path.join(_SCRATCH, 'profiles')
+os.environ['WARMUP_ON_STARTUP'] = '0'
+os.environ['EVENT_LOOP_MONITOR'] = '0'
+os.environ.pop('GOOGLE_GENAI_API_KEY', None)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_SCRATCH, ignore_errors=True)
+
+
+@pytest.fixture
+def scratch_dir():
+    return _SCRATCH
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    """services.history_store on a fresh database in tmp_path (legacy history.json next to it)."""
+    from services import history_store as hs
+    monkeypatch.setattr(hs, 'STORE_PATH', str(tmp_path))
+    monkeypatch.setattr(hs, 'DB_FILE', str(tmp_path / 'history.sqlite3'))
+    monkeypatch.setattr(hs, 'LEGACY_HISTORY_FILE', str(tmp_path / 'history.json'))
+    previous = getattr(hs._local, 'conn', None)
+    hs._local.conn = None
+    yield hs
+    conn = getattr(hs._local, 'conn', None)
+    if conn is not None:
+        conn.close()
+    hs._local.conn = previous
+
+
+@pytest.fixture
+def client(history):
+    """TestClient for the app, with history in a fresh database."""
+    from fastapi.testclient import TestClient
+    from main import app
+    with TestClient(app) as c:
+        yield c
@@ -0,0 +1,63 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks import corpus
+from conftest import BACKEND_DIR
+
+
+@pytest.fixture
+def run():
+    # the runner configures the environment of its own process on import; keep that out of ours
+    saved = dict(os.environ)
+    from benchmarks import run as runner
+    os.environ.clear()
+    os.environ.update(saved)
+    yield runner
+    shutil.rmtree(runner._SCRATCH, ignore_errors=True)
+
+
+def test_corpus_is_deterministic():
+    assert corpus.history_entry(3) == corpus.history_entry(3)
+    assert corpus.comments(20) == corpus.comments(20)
+    assert dict(corpus.sources(False)) == dict(corpus.sources(False))
+
+
+def test_compare_flags_regressions_beyond_threshold_and_delta(run):
+    baseline = {'a': {'median_ms': 10.0}, 'b': {'median_ms': 10.0}, 'c': {'median_ms': 0.1}, 'd': {'median_ms': 10.0}}
+    results = {'a': {'median_ms': 20.0}, 'b': {'median_ms': 11.0}, 'c': {'median_ms': 0.5},
+               'd': {'median_ms': 4.0}, 'e': {'median_ms': 1.0}}
+    statuses = {k: v['status'] for k, v in run.compare(results, baseline, threshold=1.5, min_delta_ms=1.0).items()}
+    # c is 5x slower but only by 0.4 ms: noise, not a regression
+    assert statuses == {'a': 'regression', 'b': 'ok', 'c': 'ok', 'd': 'improvement', 'e': 'new'}
+
+
+def test_quick_run_writes_a_report(tmp_path):
+    out = tmp_path / 'report.json'
+    subprocess.run([sys.executable, 'benchmarks/run.py', '--quick', '--only', 'history,json_extract', '--repeat', '1',
+                    '--output', str(out), '--baseline', str(tmp_path / 'none.json')],
+                   cwd=BACKEND_DIR, check=True, capture_output=True)
+    results = json.loads(out.read_text())['results']
+    assert {'history/search_q', 'history/stats_day'} <= set(results)
+    assert all(r['median_ms'] >= 0 and r['runs'] == 1 for r in results.values())
+
+
+def test_fail_on_regression_needs_a_baseline(tmp_path):
+    proc = subprocess.run([sys.executable, 'benchmarks/run.py', '--quick', '--only', 'json_extract', '--repeat', '1',
+                           '--output', str(tmp_path / 'report.json'), '--baseline', str(tmp_path / 'none.json'),
+                           '--fail-on-regression'], cwd=BACKEND_DIR, capture_output=True, text=True)
+    assert proc.returncode == 2
+    assert 'needs a baseline' in proc.stderr
+    assert not (tmp_path / 'report.json').exists()
+
+
+def test_committed_baseline_covers_every_case(run):
+    with open(run.DEFAULT_BASELINE, encoding='utf-8') as f:
+        baseline = json.load(f)
+    assert baseline['meta']['quick'] is False
+    names = {name for group in run.GROUPS for name, _ in run.CASE_BUILDERS[group](False)}
+    assert names <= set(baseline['results'])
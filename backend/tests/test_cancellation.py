@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from services import cancellation, llm_replay
+from services.cancellation import AnalysisCancelled, CancelToken, register_session, release_session
+
+
+def test_cancelled_token_abandons_a_blocking_call():
+    token = CancelToken()
+    fired = []
+    token.on_cancel(lambda: fired.append('cb'))
+    threading.Timer(0.1, token.cancel, args=('client_disconnected',)).start()
+    started = time.monotonic()
+    with pytest.raises(AnalysisCancelled) as e:
+        token.call(time.sleep, 5, stage='llm_comments')
+    assert time.monotonic() - started < 1
+    assert (e.value.reason, e.value.stage) == ('client_disconnected', 'llm_comments')
+    assert fired == ['cb']
+    # callbacks registered after the fact run at once; the first reason sticks
+    token.on_cancel(lambda: fired.append('late'))
+    token.cancel('superseded')
+    assert fired == ['cb', 'late'] and token.reason == 'client_disconnected'
+
+
+def test_check_cancelled_only_inside_a_scope():
+    cancellation.check_cancelled('anywhere')
+    token = CancelToken()
+    token.cancel()
+    with cancellation.cancel_scope(token), pytest.raises(AnalysisCancelled):
+        cancellation.check_cancelled('local_metrics')
+
+
+def test_newer_session_request_supersedes_the_older():
+    first, second = CancelToken(), CancelToken()
+    assert register_session('s', 'r1', first) is None
+    assert register_session('s', 'r2', second) == 'r1'
+    assert first.reason == 'superseded' and not second.cancelled
+    # the superseded run finishing late must not unregister its successor
+    release_session('s', first)
+    third = CancelToken()
+    assert register_session('s', 'r3', third) == 'r2'
+    release_session('s', third)
+    assert register_session('s', 'r4', CancelToken()) is None
+
+
+def test_superseded_analyze_request_gets_409(client, monkeypatch):
+    monkeypatch.setattr(llm_replay, 'REPLAY_LATENCY_MS', 300)
+    statuses = {}
+
+    def post(name, code):
+        r = client.post('/api/v1/analyze', files={'file': ('edit.py', code)},
+                        data={'mode': 'cloud', 'api_key': 'k', 'session_id': 'editor', 'request_id': name})
+        statuses[name] = r.status_code
+
+    older = threading.Thread(target=post, args=('older', b'def older():\n    return 1\n'))
+    older.start()
+    time.sleep(0.2)
+    post('newer', b'def newer():\n    return 2\n')
+    older.join(10)
+    assert statuses == {'older': 409, 'newer': 200}
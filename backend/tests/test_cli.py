@@ -0,0 +1,59 @@
+import json
+
+import cli
+
+
+def _tree(tmp_path):
+    root = tmp_path / 'repo'
+    (root / 'pkg').mkdir(parents=True)
+    (root / 'node_modules').mkdir()
+    (root / 'pkg' / 'a.py').write_text('def a():\n    return 1\n')
+    (root / 'pkg' / 'b.py').write_text('def b(x):\n    return x * 2\n')
+    (root / 'node_modules' / 'c.py').write_text('x = 1\n')
+    (root / 'notes.txt').write_text('not python\n')
+    (root / 'blob.py').write_bytes(b'\x00\x01')
+    return root
+
+
+def _run(root, out, capsys, *extra):
+    code = cli.main([str(root), '--output', str(out), '--mode', 'local', '--jobs', '1', *extra])
+    captured = capsys.readouterr()
+    return code, captured.err.splitlines()[0], json.loads(captured.out)
+
+
+def test_walk_applies_includes_and_default_excludes(tmp_path):
+    root = _tree(tmp_path)
+    assert list(cli.walk(str(root), ['*.py'], cli.DEFAULT_EXCLUDE)) == ['blob.py', 'pkg/a.py', 'pkg/b.py']
+
+
+def test_rerun_resumes_and_only_analyses_changed_files(tmp_path, capsys):
+    root, out = _tree(tmp_path), tmp_path / 'review.jsonl'
+    code, progress, summary = _run(root, out, capsys)
+    assert code == 0 and progress.startswith('3 file(s) to analyse')
+    assert summary['status'] == {'ok': 2, 'error': 0, 'skipped': 1} and summary['files'] == 3
+
+    assert _run(root, out, capsys)[1].startswith('0 file(s) to analyse')
+
+    (root / 'pkg' / 'b.py').write_text('def b(x):\n    return x * 3\n')
+    # an interrupted run can leave a torn last line; it is dropped before appending
+    with open(out, 'a') as f:
+        f.write('{"path": "pkg/a.py", "sta')
+    _, progress, summary = _run(root, out, capsys)
+    assert progress.startswith('1 file(s) to analyse')
+    assert summary['files'] == 3
+    records = cli.read_records(str(out))
+    assert [r['path'] for r in records].count('pkg/b.py') == 2 and len(records) == 4
+
+    _, progress, _ = _run(root, out, capsys, '--no-resume')
+    assert progress.startswith('3 file(s) to analyse') and len(cli.read_records(str(out))) == 3
+
+
+def test_aggregate_uses_the_latest_record_per_path():
+    records = [{'path': 'a.py', 'status': 'error'},
+               {'path': 'a.py', 'status': 'ok', 'result': {'metrics': {'lines': 4, 'cc_avg': 2.0},
+                                                          'comments': [{'severity': 'warning'}]}},
+               {'path': 'b.py', 'status': 'ok', 'result': {'metrics': {'lines': 6, 'cc_avg': 4.0}, 'llm_disabled': True}}]
+    summary = cli.aggregate(records)
+    assert summary['status'] == {'ok': 2, 'error': 0, 'skipped': 0}
+    assert summary['lines'] == 10 and summary['metrics_avg'] == {'cc_avg': 3.0}
+    assert summary['severity']['warning'] == 1 and summary['llm_degraded'] == 1
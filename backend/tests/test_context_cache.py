@@ -0,0 +1,30 @@
+from services import gemini_client, llm_replay
+from services.analyzer import run_analysis
+from services.usage import collect_usage
+
+CODE = 'def scale(x, k):\n    return x * k\n'
+THREE = {'metrics': False, 'summary': True, 'review': True, 'tags': True, 'docs': False}
+
+
+def _run(features):
+    llm_replay.reset_stats()
+    with collect_usage() as usage:
+        results = run_analysis(CODE, features, 'cloud', api_key='k', api_key_source='form')
+    return results, dict(llm_replay.STATS), usage.as_dict()['total']
+
+
+def test_file_is_cached_once_and_shared_by_the_feature_prompts(monkeypatch):
+    monkeypatch.setattr(gemini_client, 'CONTEXT_CACHE_MIN_TOKENS', 0)
+    results, stats, total = _run(THREE)
+    assert not results.get('llm_disabled')
+    assert (stats['calls'], stats['cache_creates'], stats['cache_hits'], stats['cache_deletes']) == (3, 1, 3, 1)
+    assert 0 < total['cached_tokens'] < total['input_tokens']
+
+
+def test_small_files_and_single_features_are_sent_inline(monkeypatch):
+    _, stats, total = _run(THREE)
+    assert stats['cache_creates'] == 0 and total['cached_tokens'] == 0
+
+    monkeypatch.setattr(gemini_client, 'CONTEXT_CACHE_MIN_TOKENS', 0)
+    _, stats, _ = _run(dict(THREE, summary=False, tags=False))
+    assert stats['calls'] == 1 and stats['cache_creates'] == 0
@@ -0,0 +1,63 @@
+import json
+
+from services.exporter import iter_export, normalize_format
+
+ENTRY = {
+    'id': 7, 'fileName': 'app/db.py', 'timestamp': '2024-03-01T10:20:00Z',
+    'summary': {'summary': 'Database helpers', 'key_points': ['pooling']},
+    'metrics': {'cc_avg': 2.345, 'lines': 40},
+    'comments': [
+        {'line': 12, 'column': 5, 'severity': 'error', 'category': 'Security', 'message': 'SQL built from input',
+         'suggestion': 'use parameters'},
+        {'line': None, 'severity': 'bogus', 'category': None, 'message': 'a | b\nc'},
+    ],
+}
+
+
+def _export(fmt, entries):
+    return b''.join(iter_export(fmt, entries)).decode()
+
+
+def test_format_aliases():
+    assert [normalize_format(f) for f in ('SARIF', 'md', 'ndjson', 'pdf', None)] == \
+        ['sarif', 'markdown', 'jsonl', None, None]
+
+
+def test_sarif_has_a_run_per_entry_with_rules_and_regions():
+    log = json.loads(_export('sarif', [ENTRY, {'fileName': 'empty.py', 'comments': []}]))
+    assert log['version'] == '2.1.0' and len(log['runs']) == 2
+    run = log['runs'][0]
+    assert [r['id'] for r in run['tool']['driver']['rules']] == ['security', 'other']
+    first, second = run['results']
+    assert first['level'] == 'error' and first['properties']['suggestion'] == 'use parameters'
+    assert first['locations'][0]['physicalLocation'] == {
+        'artifactLocation': {'uri': 'app/db.py'}, 'region': {'startLine': 12, 'startColumn': 5}}
+    # unknown severities are info (note); comments without a line have no region
+    assert second['level'] == 'note' and 'region' not in second['locations'][0]['physicalLocation']
+    assert run['properties']['summary'] == 'Database helpers'
+    assert log['runs'][1]['results'] == []
+
+
+def test_jsonl_has_an_analysis_line_and_a_line_per_comment():
+    lines = [json.loads(l) for l in _export('jsonl', [ENTRY]).splitlines()]
+    assert [l['type'] for l in lines] == ['analysis', 'comment', 'comment']
+    assert lines[0]['file_name'] == 'app/db.py' and lines[1]['line'] == 12
+
+
+def test_markdown_escapes_table_cells():
+    md = _export('markdown', [ENTRY])
+    assert md.startswith('# Code Review Report\n\n## app/db.py\n')
+    assert '| cc_avg | 2.35 |' in md
+    assert '| - | info | Other | a \\| b<br>c |  |' in md
+
+
+def test_export_endpoints_stream_the_formats(client):
+    r = client.post('/api/v1/export?format=md', json=ENTRY)
+    assert r.status_code == 200 and r.headers['content-type'] == 'text/markdown; charset=utf-8'
+    assert r.headers['content-disposition'] == 'attachment; filename="code_review_report.md"'
+    assert client.post('/api/v1/export?format=xml', json=ENTRY).status_code == 400
+
+    client.post('/api/v1/history', json=ENTRY)
+    client.post('/api/v1/history', json=dict(ENTRY, fileName='other.py', comments=[]))
+    r = client.get('/api/v1/history/export', params={'format': 'sarif', 'severity': 'error'})
+    assert [run['artifacts'][0]['location']['uri'] for run in r.json()['runs']] == ['app/db.py']
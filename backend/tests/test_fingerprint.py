@@ -0,0 +1,51 @@
+from services.fingerprint import fingerprint, remap_comments
+
+
+def test_python_fingerprint_ignores_formatting_and_comments():
+    a = fingerprint('def f(x):\n    """Doc."""\n    return x + 1  # add one\n')
+    b = fingerprint("def f(x):\n\n    return (x +\n            1)\n")
+    assert a[0] == b[0]
+    assert a[0].startswith('py:')
+
+
+def test_python_fingerprint_sees_code_changes():
+    assert fingerprint('x = 1\n')[0] != fingerprint('x = 2\n')[0]
+
+
+def test_js_private_fields_are_code():
+    a = fingerprint('class A { #count = 0; inc() { this.#count++; } }', language='javascript')
+    b = fingerprint('class A { #other = 99; inc() { this.#zzz--; } }', language='javascript')
+    assert a[0] != b[0]
+
+
+def test_rust_attributes_are_code():
+    a = fingerprint('#[derive(Debug)]\nstruct S;\n', language='rust')
+    b = fingerprint('#[derive(Clone)]\nstruct S;\n', language='rust')
+    assert a[0] != b[0]
+
+
+def test_hash_is_code_when_language_unknown():
+    assert fingerprint('#region a\nint x;\n')[0] != fingerprint('#region b\nint x;\n')[0]
+
+
+def test_hash_comments_dropped_where_the_language_uses_them():
+    assert fingerprint('echo 1 # one\n', language='shell')[0] == fingerprint('echo  1   # two\n', language='shell')[0]
+
+
+def test_c_comments_and_whitespace_ignored():
+    a = fingerprint('int f(int a) { return a; } // x\n', language='c')
+    b = fingerprint('int f(int a)\n{\n  /* y */ return a;\n}\n', language='c')
+    assert a[0] == b[0]
+
+
+def test_remap_comments_follows_reformatting():
+    old_fp, old_anchors = fingerprint('def f(x):\n    return x\n')
+    new_fp, new_anchors = fingerprint('\n\ndef f(x):\n\n    return x\n')
+    assert old_fp == new_fp
+    moved = remap_comments([{'line': 2, 'column': 4, 'message': 'm'}], old_anchors, new_anchors)
+    assert moved == [{'line': 5, 'column': 4, 'message': 'm'}]
+
+
+def test_remap_comments_gives_up_on_unanchored_lines():
+    _, anchors = fingerprint('def f(x):\n    return x\n')
+    assert remap_comments([{'line': 40, 'message': 'm'}], anchors, anchors) is None
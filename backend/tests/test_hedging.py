@@ -0,0 +1,73 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services import gemini_client
+
+
+class _Client:
+    """generate_content stand-in: call n sleeps delays[n] seconds, then answers (or raises) with its number."""
+
+    def __init__(self, *delays, error=None):
+        self.delays = list(delays)
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.models = SimpleNamespace(generate_content=self._generate)
+
+    def _generate(self, model, contents, config=None):
+        with self._lock:
+            n = self.calls
+            self.calls += 1
+        time.sleep(self.delays[n])
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(text=f'answer {n}')
+
+
+@pytest.fixture
+def hedges(monkeypatch):
+    outcomes, billed = [], []
+    monkeypatch.setattr(gemini_client, 'HEDGE_DELAY_SECONDS', 0.05)
+    monkeypatch.setattr(gemini_client, 'record_hedge', lambda feature, outcome: outcomes.append(outcome))
+    monkeypatch.setattr(gemini_client, '_record_usage',
+                        lambda client, feature, contents, resp, text, hedge_loser=False: billed.append((text, hedge_loser)))
+    return outcomes, billed
+
+
+def test_slow_primary_is_overtaken_by_the_hedge(hedges):
+    outcomes, billed = hedges
+    client = _Client(0.6, 0.0)
+    resp = gemini_client._hedged_generate(client, 'm', 'prompt', None, 'summary', None)
+    assert resp.text == 'answer 1'
+    assert outcomes == ['sent', 'hedge_won']
+    # the abandoned primary still completes and its tokens are counted as hedge waste
+    time.sleep(0.8)
+    assert billed == [('answer 0', True)]
+
+
+def test_fast_primary_sends_no_hedge(hedges):
+    outcomes, _ = hedges
+    client = _Client(0.0)
+    assert gemini_client._hedged_generate(client, 'm', 'prompt', None, 'summary', None).text == 'answer 0'
+    assert outcomes == [] and client.calls == 1
+
+
+def test_failed_primary_is_not_hedged(hedges):
+    outcomes, _ = hedges
+    client = _Client(0.0, error=RuntimeError('boom'))
+    with pytest.raises(RuntimeError):
+        gemini_client._hedged_generate(client, 'm', 'prompt', None, 'summary', None)
+    assert outcomes == [] and client.calls == 1
+
+
+def test_features_route_to_their_tier_unless_overridden(monkeypatch):
+    monkeypatch.setenv('LLM_FAST_MODEL', 'fast-model')
+    monkeypatch.setenv('LLM_STRONG_MODEL', 'strong-model')
+    monkeypatch.setenv('LLM_MODEL_TAGS', 'tags-model')
+    assert gemini_client._feature_preference('summary') == 'fast-model'
+    assert gemini_client._feature_preference('comments') == 'strong-model'
+    assert gemini_client._feature_preference('tags') == 'tags-model'
+    assert gemini_client._feature_preference(None) is None
@@ -0,0 +1,74 @@
+import sqlite3
+import threading
+import time
+
+
+def test_history_round_trip(client):
+    saved = client.post('/api/v1/history', json={'fileName': 'a.py', 'metrics': {'cc_avg': 1.5}, 'comments': []}).json()
+    assert saved['id']
+    page = client.get('/api/v1/history').json()
+    assert [item['id'] for item in page['items']] == [saved['id']]
+    entry = client.get(f"/api/v1/history/{saved['id']}").json()
+    assert entry['fileName'] == 'a.py'
+    assert client.get('/api/v1/history/999999').status_code == 404
+    assert client.delete('/api/v1/history').json() == {'status': 'cleared'}
+    assert client.get('/api/v1/history').json()['items'] == []
+
+
+def test_blocked_history_write_does_not_stall_the_event_loop(client, history):
+    client.get('/api/v1/history')  # create the database
+    blocker = sqlite3.connect(history.DB_FILE, isolation_level=None)
+    blocker.execute('BEGIN IMMEDIATE')
+    done = threading.Event()
+
+    def post():
+        client.post('/api/v1/history', json={'fileName': 'b.py', 'comments': []})
+        done.set()
+
+    writer = threading.Thread(target=post)
+    writer.start()
+    try:
+        time.sleep(0.3)  # the POST is now waiting on the database lock
+        assert not done.is_set()
+        started = time.perf_counter()
+        assert client.get('/api/v1/health').status_code == 200
+        assert time.perf_counter() - started < 1.0
+    finally:
+        blocker.execute('COMMIT')
+        blocker.close()
+        writer.join(10)
+    assert done.is_set()
+
+
+def _post(client, name, cc, comments, tags=(), summary=''):
+    client.post('/api/v1/history', json={
+        'fileName': name, 'metrics': {'cc_avg': cc, 'lines': 10}, 'tags': list(tags),
+        'summary': {'summary': summary, 'key_points': []}, 'comments': comments})
+
+
+def test_history_filters_and_search(client):
+    _post(client, 'a.py', 2.0, [{'line': 1, 'severity': 'error', 'category': 'Security', 'message': 'SQL injection risk'}],
+          tags=['Database'], summary='Query helpers')
+    _post(client, 'b.py', 8.0, [{'line': 1, 'severity': 'info', 'category': 'Style', 'message': 'long line'}],
+          tags=['CLI'], summary='Argument parsing')
+    _post(client, 'a.py', 5.0, [], summary='Refactored query helpers')
+
+    def names(**params):
+        r = client.get('/api/v1/history', params=params)
+        assert r.status_code == 200, r.text
+        return [i['file_name'] for i in r.json()['items']]
+
+    assert names(file_name='a.py') == ['a.py', 'a.py']
+    assert names(tag='database') == ['a.py']
+    assert names(severity='error') == ['a.py']
+    assert names(severity='info', category='style') == ['b.py']
+    assert names(severity='error', category='style') == []
+    assert names(cc_avg_min=4) == ['a.py', 'b.py']
+    assert names(cc_avg_min=4, cc_avg_max=6) == ['a.py']
+    assert names(q='injection') == ['a.py']
+    assert names(q='query helpers') == ['a.py', 'a.py']
+    # operators in the search text are matched literally
+    assert names(q='query OR "argument') == []
+    assert names(until='2000-01-01') == []
+    assert client.get('/api/v1/history', params={'cc_avg_min': 'x'}).status_code == 400
+    assert client.get('/api/v1/history', params={'since': 'soon'}).status_code == 400
@@ -0,0 +1,154 @@
+import datetime
+import json
+import sqlite3
+
+import pytest
+
+
+def _entry(name='a.py', cc=2.0, severities=('warning',), **extra):
+    # the frontend posts the analysis result itself, plus fileName and timestamp
+    return dict({
+        'fileName': name,
+        'metrics': {'cc_avg': cc, 'mi_avg': 70.0, 'pylint_score': 8.0, 'lines': 10},
+        'summary': {'summary': f'Summary of {name}', 'key_points': []},
+        'comments': [{'line': i + 1, 'severity': s, 'category': 'Other', 'message': f'{s} {i}'}
+                     for i, s in enumerate(severities)],
+        'tags': ['Readability'],
+    }, **extra)
+
+
+def _epoch(iso):
+    return datetime.datetime.fromisoformat(iso.replace('Z', '+00:00')).timestamp()
+
+
+def test_legacy_migration_keeps_entry_timestamps(history, tmp_path):
+    legacy = [  # newest first, as the JSON store kept it
+        _entry('new.py', timestamp='2024-03-02T10:00:00.000Z'),
+        _entry('naive.py', timestamp='2024-02-01T08:30:00'),
+        _entry('bad.py', timestamp='not a date'),
+        _entry('old.py', timestamp='2023-12-31T23:00:00+00:00'),
+    ]
+    (tmp_path / 'history.json').write_text(json.dumps(legacy))
+
+    entries = {e['fileName']: e for e in history.list_history(10)}
+
+    assert (tmp_path / 'history.json.migrated').exists()
+    assert _epoch(entries['new.py']['timestamp']) == _epoch('2024-03-02T10:00:00Z')
+    assert _epoch(entries['naive.py']['timestamp']) == _epoch('2024-02-01T08:30:00+00:00')
+    assert _epoch(entries['old.py']['timestamp']) == _epoch('2023-12-31T23:00:00+00:00')
+    # unreadable timestamps fall back to the migration time
+    assert _epoch(entries['bad.py']['timestamp']) > _epoch('2025-01-01T00:00:00+00:00')
+    # same order as the legacy file: newest first
+    assert [e['fileName'] for e in history.list_history(10)] == ['new.py', 'naive.py', 'bad.py', 'old.py']
+
+
+def test_migrated_entries_filter_and_roll_up_by_their_own_time(history, tmp_path):
+    legacy = [_entry('b.py', cc=4.0, timestamp='2024-03-02T10:00:00Z'),
+              _entry('a.py', cc=2.0, timestamp='2024-03-01T10:00:00Z')]
+    (tmp_path / 'history.json').write_text(json.dumps(legacy))
+
+    page, _ = history.list_history_index(10, filters={'until': _epoch('2024-03-01T23:59:59Z')})
+    assert [e['file_name'] for e in page] == ['a.py']
+
+    days = history.history_stats('day')
+    assert [d['bucket_start'] for d in days] == [_epoch('2024-03-01T00:00:00Z'), _epoch('2024-03-02T00:00:00Z')]
+    assert [d['metrics']['cc_avg'] for d in days] == [2.0, 4.0]
+
+
+def test_keyset_pages_walk_newest_first_without_overlap(history):
+    for i in range(5):
+        history.save_entry(_entry(f'{i}.py', cc=float(i)))
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = history.list_history_index(2, before_id=cursor)
+        seen.append([e['file_name'] for e in page])
+        if cursor is None:
+            break
+    assert seen == [['4.py', '3.py'], ['2.py', '1.py'], ['0.py']]
+
+
+def test_retention_keeps_the_newest_entries_and_drops_old_ones(history, monkeypatch):
+    monkeypatch.setattr(history, 'MAX_ENTRIES', 3)
+    for i in range(5):
+        history.save_entry(_entry(f'{i}.py', cc=float(i)))
+    assert [e['file_name'] for e in history.list_history_index(10)[0]] == ['4.py', '3.py', '2.py']
+
+    monkeypatch.setattr(history, 'MAX_ENTRIES', 0)
+    monkeypatch.setattr(history, 'MAX_AGE_DAYS', 1)
+    now = history.time.time()
+    monkeypatch.setattr(history.time, 'time', lambda: now + 2 * 86400)
+    history.save_entry(_entry('fresh.py'))
+    assert [e['file_name'] for e in history.list_history_index(10)[0]] == ['fresh.py']
+
+
+def test_identical_payloads_are_stored_once(history, monkeypatch):
+    first = history.save_entry(_entry('a.py', timestamp='2024-03-01T10:00:00Z'))
+    second = history.save_entry(_entry('a.py', timestamp='2024-03-02T10:00:00Z'))
+    history.save_entry(_entry('b.py'))
+
+    page, _ = history.list_history_index(10)
+    a_rows = [e for e in page if e['file_name'] == 'a.py']
+    assert a_rows[0]['content_hash'] == a_rows[1]['content_hash']
+    assert [e['occurrences'] for e in a_rows] == [2, 2]
+    conn = history._connect()
+    assert conn.execute('SELECT COUNT(*) FROM history_blobs').fetchone()[0] == 2
+
+    # each submission keeps its own id and time; the shared blob outlives one of its rows
+    assert first['id'] != second['id']
+    monkeypatch.setattr(history, 'MAX_ENTRIES', 3)
+    history.save_entry(_entry('c.py'))
+    assert history.get_entry(first['id']) is None
+    assert history.get_entry(second['id'])['fileName'] == 'a.py'
+    assert conn.execute('SELECT COUNT(*) FROM history_blobs').fetchone()[0] == 3
+    # occurrences counts the submissions still kept, not every one ever made
+    page, _ = history.list_history_index(10)
+    assert [e['occurrences'] for e in page if e['file_name'] == 'a.py'] == [1]
+
+
+def test_rollups_bucket_by_granularity_and_outlive_retention(history, monkeypatch):
+    clock = {'now': _epoch('2024-03-04T10:30:00Z')}  # a Monday
+    monkeypatch.setattr(history.time, 'time', lambda: clock['now'])
+    for at, name, cc, sev in [('2024-03-04T10:30:00Z', 'a.py', 2.0, ('error', 'info')),
+                              ('2024-03-04T11:15:00Z', 'b.py', 4.0, ('warning',)),
+                              ('2024-03-06T09:00:00Z', 'a.py', 6.0, ())]:
+        clock['now'] = _epoch(at)
+        history.save_entry(_entry(name, cc=cc, severities=sev))
+
+    days = history.history_stats('day')
+    assert [(d['entries'], d['metrics']['cc_avg']) for d in days] == [(2, 3.0), (1, 6.0)]
+    assert days[0]['comment_counts'] == {'error': 1, 'warning': 1, 'info': 1}
+    assert [d['bucket_start'] for d in history.history_stats('hour')][:2] == [
+        _epoch('2024-03-04T10:00:00Z'), _epoch('2024-03-04T11:00:00Z')]
+    weeks = history.history_stats('week')
+    assert [(w['bucket_start'], w['entries']) for w in weeks] == [(_epoch('2024-03-04T00:00:00Z'), 3)]
+    assert [d['metrics']['cc_avg'] for d in history.history_stats('day', file_name='a.py')] == [2.0, 6.0]
+    assert len(history.history_stats('day', since=_epoch('2024-03-05T00:00:00Z'))) == 1
+
+    monkeypatch.setattr(history, 'MAX_ENTRIES', 1)
+    history.save_entry(_entry('c.py', cc=8.0))
+    assert sum(d['entries'] for d in history.history_stats('day')) == 4
+
+    with pytest.raises(ValueError):
+        history.history_stats('month')
+
+
+def test_single_table_databases_migrate_to_index_and_compressed_payloads(history):
+    old = sqlite3.connect(history.DB_FILE)
+    old.execute('CREATE TABLE history (id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, payload TEXT NOT NULL)')
+    for id_, name, cc in ((3, 'a.py', 2.0), (8, 'b.py', 6.0)):
+        old.execute('INSERT INTO history VALUES (?, ?, ?)', (id_, _epoch('2024-03-01T10:00:00Z') + id_,
+                                                              json.dumps(_entry(name, cc=cc, severities=('error', 'info')))))
+    old.execute('INSERT INTO history VALUES (9, 0, ?)', ('{not json',))
+    old.execute('PRAGMA user_version = 1')
+    old.commit()
+    old.close()
+
+    page, _ = history.list_history_index(10)
+    assert [(e['id'], e['file_name'], e['metrics']['cc_avg']) for e in page] == [(8, 'b.py', 6.0), (3, 'a.py', 2.0)]
+    assert page[0]['comment_counts'] == {'error': 1, 'warning': 0, 'info': 1}
+    assert history.get_entry(3)['summary']['summary'] == 'Summary of a.py'
+    conn = history._connect()
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'history'").fetchone() is None
+    assert {r['codec'] for r in conn.execute('SELECT codec FROM history_blobs')} <= {'zstd', 'zlib'}
+    assert history.save_entry(_entry('c.py'))['id'] > 8
@@ -0,0 +1,55 @@
+import pytest
+
+from services.languages import detect_language
+from services.metrics import analyze_metrics
+
+JS = '''// helpers
+function pick(a, b) {
+  if (a && b) { return a; }
+  for (let i = 0; i < 3; i++) { if (i) { return b; } }
+  return null;
+}
+class Box { size() { return 1; } }
+const re = /[{}]/g;
+const s = "not { a brace";
+'''
+
+
+@pytest.mark.parametrize('filename, code, language', [
+    ('a.py', 'x = 1\n', 'python'),
+    ('A.TSX', '', 'typescript'),
+    ('main.rs', '', 'rust'),
+    (None, 'x = [i for i in range(3)]\n', 'python'),
+    (None, '#!/usr/bin/env node\nconsole.log(1)\n', 'javascript'),
+    (None, '#!/bin/bash\necho hi\n', 'shell'),
+    (None, '#include <stdio.h>\nint main() { return 0; }\n', 'c'),
+    (None, '#include <vector>\nstd::vector<int> v;\n', 'cpp'),
+    (None, 'package demo;\npublic class A {}\n', 'java'),
+    (None, 'interface A { x: number }\n', 'typescript'),
+    (None, 'const f = (a) => a + 1;\n', 'javascript'),
+    (None, 'SELECT * FROM t WHERE', 'python'),
+    ('notes.txt', 'Some notes: see the README.\n', 'text'),
+])
+def test_detect_language(filename, code, language):
+    assert detect_language(filename, code) == language
+
+
+def test_brace_metrics_skip_comments_strings_and_regexes():
+    metrics = analyze_metrics(JS, 'helpers.js')
+    assert metrics['language'] == 'javascript'
+    assert (metrics['func_count'], metrics['class_count']) == (2, 1)
+    # pick: 1 + if + && + for + if; size: 1
+    assert metrics['cc_avg'] == 3.0
+    assert metrics['max_nesting_depth'] == 2
+    assert 'pylint_score' not in metrics and 'coding_standards' not in metrics
+
+
+def test_other_text_only_gets_its_line_count():
+    assert analyze_metrics('Some notes: see the README.\nMore.\n', 'notes.txt') == {'lines': 3, 'language': 'text'}
+
+
+def test_analyze_skips_python_tools_on_other_sources(client):
+    r = client.post('/api/v1/analyze', files={'file': ('helpers.js', JS.encode())}, data={'mode': 'local'})
+    assert r.status_code == 200
+    metrics = r.json()['metrics']
+    assert metrics['func_count'] == 2 and metrics.get('pylint_score') is None
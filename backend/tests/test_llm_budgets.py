@@ -0,0 +1,57 @@
+from services import llm_replay, usage
+from services.analyzer import run_analysis
+from services.usage import collect_usage, key_id
+
+FEATURES = {'metrics': False, 'summary': True, 'review': True, 'tags': True, 'docs': False}
+CODE = 'def total(items):\n    return sum(items)\n'
+
+
+def test_provider_quota_error_falls_back_to_local_results(monkeypatch):
+    monkeypatch.setattr(llm_replay, 'REPLAY_QUOTA_RATE', 1.0)
+    results = run_analysis(CODE, FEATURES, 'cloud', api_key='quota-key', api_key_source='form')
+    assert results['llm_disabled'] is True
+    assert 'Quota exceeded' in results['llm_disabled_reason']
+    assert results['llm_retry_after_seconds'] == 30
+    assert results['llm_disabled_key_source'] == 'form'
+    # local stand-ins so the client still gets every field, never the provider error as content
+    assert results['comments'] == [] and results['tags'] == [] and 'summary' in results
+    assert 'RESOURCE_EXHAUSTED' not in str(results['summary'])
+
+
+def test_usage_is_accounted_per_feature_and_key():
+    with collect_usage() as collector:
+        run_analysis(CODE, FEATURES, 'cloud', api_key='usage-key', api_key_source='header')
+    per_request = collector.as_dict()
+    assert set(per_request['features']) == {'summary', 'comments', 'tags'}
+    assert per_request['total']['calls'] == 3 and per_request['total']['input_tokens'] > 0
+
+    report = usage.usage_report(1, key=key_id('usage-key'))
+    assert report['by_key_source']['header']['calls'] == 3
+    assert report['by_feature']['comments']['input_tokens'] == per_request['features']['comments']['input_tokens']
+
+
+def test_key_over_its_daily_budget_gets_local_only_analysis(monkeypatch):
+    monkeypatch.setattr(usage, 'SOURCE_BUDGETS', {'form': 1})
+    first = run_analysis(CODE, FEATURES, 'cloud', api_key='budget-key', api_key_source='form')
+    assert not first.get('llm_disabled')
+
+    llm_replay.reset_stats()
+    second = run_analysis(CODE, FEATURES, 'cloud', api_key='budget-key', api_key_source='form')
+    assert second['llm_disabled'] is True
+    assert 'budget' in second['llm_disabled_reason']
+    assert 0 < second['llm_retry_after_seconds'] <= 86400
+    assert llm_replay.STATS['calls'] == 0
+    # other key sources and keys are unaffected
+    assert not run_analysis(CODE, FEATURES, 'cloud', api_key='budget-key', api_key_source='header').get('llm_disabled')
+    assert not run_analysis(CODE, FEATURES, 'cloud', api_key='another-key', api_key_source='form').get('llm_disabled')
+
+
+def test_usage_endpoint_needs_the_operator_token(client, monkeypatch):
+    monkeypatch.setattr(usage, 'USAGE_TOKEN', None)
+    assert client.get('/usage').status_code == 404
+
+    monkeypatch.setattr(usage, 'USAGE_TOKEN', 'ops-secret')
+    assert client.get('/usage').status_code == 404
+    assert client.get('/usage', headers={'X-Usage-Token': 'wrong'}).status_code == 404
+    resp = client.get('/usage', params={'days': 1}, headers={'X-Usage-Token': 'ops-secret'})
+    assert resp.status_code == 200
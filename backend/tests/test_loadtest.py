@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+from services import loop_monitor
+from services.instrumentation import record_loop_lag
+from tools import loadtest
+
+
+def test_loop_monitor_records_blocked_time(monkeypatch):
+    lags = []
+    monkeypatch.setattr(loop_monitor, 'record_loop_lag', lags.append)
+
+    async def block_the_loop():
+        task = asyncio.get_running_loop().create_task(loop_monitor._monitor(0.01))
+        await asyncio.sleep(0.05)
+        time.sleep(0.2)
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    asyncio.run(block_the_loop())
+    assert max(lags) >= 0.15 and min(lags) < 0.05
+
+
+def test_lag_report_from_two_histogram_snapshots(client):
+    record_loop_lag(0.001)
+    before = loadtest.loop_lag_histogram(client)
+    assert before is not None and before['buckets'][float('inf')] == before['count']
+    after = {'buckets': {le: n + (4 if le >= 0.01 else 0) + (1 if le >= 0.5 else 0) for le, n in before['buckets'].items()},
+             'sum': before['sum'] + 4 * 0.004 + 0.3, 'count': before['count'] + 5}
+    report = loadtest.loop_lag_report(before, after)
+    assert report['samples'] == 5
+    assert report['p50_le_ms'] == 10.0 and report['max_le_ms'] == 500.0
+    assert report['mean_ms'] == round((4 * 0.004 + 0.3) / 5 * 1000, 3)
+    assert loadtest.loop_lag_report(after, after) is None
+
+
+def test_weights_and_percentiles():
+    assert loadtest.parse_weights('analyze:3,history=1,export') == [('analyze', 3.0), ('history', 1.0), ('export', 1.0)]
+    assert loadtest.parse_weights('50:2,500', int) == [(50, 2.0), (500, 1.0)]
+    values = [float(v) for v in range(1, 101)]
+    assert [loadtest.percentile(values, p) for p in (50, 95, 99, 100)] == [50.0, 95.0, 99.0, 100.0]
+    assert loadtest.percentile([3.0], 99) == 3.0 and loadtest.percentile([], 50) is None
@@ -0,0 +1,63 @@
+import re
+import subprocess
+import sys
+import threading
+
+from conftest import BACKEND_DIR
+
+
+def _analyze(client, query=''):
+    return client.post(f'/api/v1/analyze{query}', files={'file': ('a.py', b'x = 1\n')}, data={'mode': 'local'})
+
+
+def test_metrics_exposes_stage_latency_histograms(client):
+    assert _analyze(client).status_code == 200
+    r = client.get('/metrics')
+    assert r.status_code == 200 and r.headers['content-type'].startswith('text/plain; version=0.0.4')
+    assert '# TYPE code_review_stage_seconds histogram' in r.text
+    count = re.search(r'^code_review_stage_seconds_count\{stage="local_metrics"\} (\d+)', r.text, re.M)
+    assert count and int(count.group(1)) >= 1
+    assert re.search(r'^code_review_stage_seconds_bucket\{stage="local_metrics",le="\+Inf"\} ', r.text, re.M)
+
+
+def test_stage_timings_in_header_and_on_request_in_body(client):
+    r = _analyze(client)
+    stages = dict(part.strip().split(';dur=') for part in r.headers['server-timing'].split(','))
+    assert {'upload_decode', 'local_metrics', 'total'} <= set(stages)
+    assert 'timings' not in r.json()
+
+    body = _analyze(client, '?timings=true&fields=metrics').json()
+    assert set(body) == {'metrics', 'timings'}
+    assert body['timings']['total'] >= body['timings']['local_metrics'] > 0
+
+
+def test_ready_reports_the_startup_warmup(client, monkeypatch):
+    from services import warmup
+
+    release = threading.Event()
+
+    def failing():
+        raise RuntimeError('no key')
+
+    monkeypatch.setattr(warmup, '_ready', threading.Event())
+    monkeypatch.setattr(warmup, '_status', {'warmup': 'pending', 'steps': {}})
+    monkeypatch.setattr(warmup, 'WARMUP_STEPS', (('llm_model', failing), ('pylint', release.wait)))
+    monkeypatch.setattr(warmup, 'WARMUP_ON_STARTUP', True)
+    warmup.start_warmup()
+
+    r = client.get('/ready')
+    assert r.status_code == 503 and r.json()['warmup'] in ('pending', 'running')
+    release.set()
+    assert warmup._ready.wait(5)
+    r = client.get('/ready')
+    assert r.status_code == 200
+    # a failed step is reported but does not keep the worker unready
+    assert r.json()['steps']['llm_model']['status'] == 'error: no key'
+    assert r.json()['steps']['pylint']['status'] == 'ok'
+
+
+def test_importing_the_app_defers_the_heavy_stacks():
+    code = ('import sys, main; '
+            'print(",".join(m for m in ("reportlab", "google.genai", "pylint", "radon") if m in sys.modules))')
+    out = subprocess.run([sys.executable, '-c', code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ''
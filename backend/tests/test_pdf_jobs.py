@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+
+from services import pdf_exporter, pdf_jobs
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Render in a thread, counting builds; each test starts with an empty cache."""
+    calls = []
+
+    def build(payload, group_by_severity=False):
+        calls.append(payload)
+        return repr(sorted(payload.items())).encode()
+
+    monkeypatch.setattr(pdf_jobs, 'PDF_WORKERS', 0)
+    monkeypatch.setattr(pdf_jobs, 'build_report_bytes', build)
+    pdf_jobs._cache.clear()
+    yield calls
+    pdf_jobs._cache.clear()
+
+
+@pytest.mark.parametrize('ts, expected', [
+    ('2024-03-01T10:20:00Z', '2024-03-01 10:20 UTC'),
+    ('2024-03-01T12:20:00+02:00', '2024-03-01 10:20 UTC'),
+    ('2024-03-01T10:20:00', '2024-03-01 10:20 UTC'),
+    (1709288400, '2024-03-01 10:20 UTC'),
+    (1709288400000, '2024-03-01 10:20 UTC'),
+    ('yesterday', None),
+    (None, None),
+])
+def test_report_stamp_comes_from_the_payload(ts, expected):
+    assert pdf_exporter._analysis_time({'timestamp': ts}) == expected
+
+
+def test_cached_pdf_is_not_reused_for_another_timestamp(renders):
+    first = {'summary': {'summary': 's'}, 'timestamp': '2024-03-01T10:20:00Z', 'id': 1}
+    asyncio.run(pdf_jobs.render_pdf(first))
+    asyncio.run(pdf_jobs.render_pdf(dict(first, id=2)))
+    assert len(renders) == 1
+    asyncio.run(pdf_jobs.render_pdf(dict(first, timestamp='2024-03-02T10:20:00Z')))
+    assert len(renders) == 2
+
+
+def test_concurrent_exports_of_one_payload_share_a_render(renders, monkeypatch):
+    build = pdf_jobs.build_report_bytes
+
+    def slow_build(payload, group_by_severity=False):
+        time.sleep(0.2)
+        return build(payload, group_by_severity)
+
+    monkeypatch.setattr(pdf_jobs, 'build_report_bytes', slow_build)
+    payload = {'summary': {'summary': 's'}, 'timestamp': '2024-03-01T10:20:00Z'}
+
+    async def export_many():
+        return await asyncio.gather(*(pdf_jobs.render_pdf(payload) for _ in range(5)),
+                                    pdf_jobs.render_pdf(payload, group_by_severity=True))
+
+    pdfs = asyncio.run(export_many())
+    assert len(renders) == 2
+    assert len(set(pdfs[:5])) == 1
+    asyncio.run(pdf_jobs.render_pdf(payload))
+    assert len(renders) == 2
+
+
+def test_a_failed_render_reaches_every_waiter_and_is_not_cached(renders, monkeypatch):
+    def broken(payload, group_by_severity=False):
+        renders.append(payload)
+        time.sleep(0.1)
+        raise RuntimeError('layout failed')
+
+    monkeypatch.setattr(pdf_jobs, 'build_report_bytes', broken)
+
+    async def export_twice():
+        return await asyncio.gather(pdf_jobs.render_pdf({'a': 1}), pdf_jobs.render_pdf({'a': 1}),
+                                    return_exceptions=True)
+
+    assert [type(r) for r in asyncio.run(export_twice())] == [RuntimeError, RuntimeError]
+    assert len(renders) == 1
+    with pytest.raises(RuntimeError):
+        asyncio.run(pdf_jobs.render_pdf({'a': 1}))
+    assert len(renders) == 2 and not pdf_jobs._inflight
+
+
+def test_export_endpoint_renders_a_pdf(client, monkeypatch):
+    monkeypatch.setattr(pdf_jobs, 'PDF_WORKERS', 0)
+    r = client.post('/api/v1/export', json={'summary': {'summary': 'ok', 'key_points': []}, 'comments': [],
+                                            'timestamp': '2024-03-01T10:20:00Z'})
+    assert r.status_code == 200
+    assert r.headers['content-type'] == 'application/pdf'
+    assert r.content.startswith(b'%PDF')
+
+
+def test_large_reports_stream_from_a_spooled_file_that_is_removed(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(pdf_jobs, 'PDF_WORKERS', 0)
+    monkeypatch.setattr(pdf_jobs, 'PDF_SPOOL_DIR', str(tmp_path))
+    monkeypatch.setattr(pdf_jobs, 'LARGE_REPORT_COMMENTS', 50)
+    comments = [{'line': i, 'severity': ('error', 'warning', 'info')[i % 3], 'category': 'Other',
+                 'message': f'issue {i}'} for i in range(1, 61)]
+    payload = {'summary': {'summary': 'big', 'key_points': []}, 'comments': comments}
+    assert pdf_jobs.is_large_report(payload)
+
+    r = client.post('/api/v1/export?group=severity', json=payload)
+    assert r.status_code == 200 and r.content.startswith(b'%PDF')
+    assert int(r.headers['content-length']) == len(r.content)
+    assert list(tmp_path.iterdir()) == []
+    assert client.post('/api/v1/export?group=file', json=payload).status_code == 400
@@ -0,0 +1,41 @@
+import pytest
+
+from routers import observability
+from services import profiling
+
+
+@pytest.fixture
+def enabled(monkeypatch, tmp_path):
+    for module in (profiling, observability):
+        monkeypatch.setattr(module, 'PROFILING_ENABLED', True)
+    monkeypatch.setattr(profiling, 'PROFILE_TOKEN', 'secret')
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+    return tmp_path
+
+
+def _analyze(client, **headers):
+    return client.post('/api/v1/analyze', files={'file': ('a.py', b'def f(x):\n    return x\n')},
+                       data={'mode': 'local'}, headers=headers)
+
+
+def test_profiling_is_off_unless_the_server_enables_it(client):
+    assert 'x-profile-id' not in _analyze(client, **{'X-Profile': 'pstats'}).headers
+
+
+def test_profile_needs_the_operator_token(client, enabled):
+    assert 'x-profile-id' not in _analyze(client, **{'X-Profile': 'pstats', 'X-Profile-Token': 'wrong'}).headers
+    assert list(enabled.iterdir()) == []
+
+
+@pytest.mark.parametrize('mode', ['pstats', 'collapsed'])
+def test_profiled_request_stores_and_serves_its_profile(client, enabled, mode):
+    auth = {'X-Profile': mode, 'X-Profile-Token': 'secret'}
+    r = _analyze(client, **auth)
+    assert r.status_code == 200
+    profile_id = r.headers['x-profile-id']
+    assert profile_id.endswith('.' + mode) and (enabled / profile_id).exists()
+    assert 'x-profile-hotspots' in r.headers
+
+    assert client.get(f'/profiles/{profile_id}', headers=auth).content == (enabled / profile_id).read_bytes()
+    assert client.get(f'/profiles/{profile_id}').status_code == 404
+    assert client.get('/profiles/..%2Fhistory.sqlite3', headers=auth).status_code == 404
@@ -0,0 +1,79 @@
+from services import prompt_builder
+from services.prompt_builder import prepare
+
+CODE = '''import os
+
+
+def load(path):
+    """Read a file.
+
+    Longer explanation that the prompt does not need.
+    """
+    # open it
+    with open(path) as f:
+        return f.read()
+'''
+
+
+def test_review_prompt_is_compacted_and_keeps_original_line_numbers():
+    prepared = prepare('comments', CODE, {'cc_avg': 1.0, 'func_count': 1})
+    lines = prepared.code.split('\n')
+    assert lines[0] == '1| import os'
+    assert '2| ' in lines[1] and '3|' not in prepared.code  # blank run collapsed
+    assert '5|     """Read a file."""' in lines
+    assert 'Longer explanation' not in prepared.code
+    assert '11|         return f.read()' in lines
+    assert 'cc_avg' in prepared.metrics and 'func_count' not in prepared.metrics
+    assert not prepared.truncated
+
+
+def test_features_only_get_their_metrics():
+    assert prepare('summary', CODE, {'cc_avg': 1.0}).metrics == ''
+    assert 'func_count' in prepare('tags', CODE, {'cc_avg': 1.0, 'func_count': 1}).metrics
+
+
+def test_over_budget_code_keeps_head_tail_and_outline(monkeypatch):
+    body = '\n'.join(f'def f{i}(x):\n    # step {i}\n    return x + {i}\n' for i in range(300))
+    monkeypatch.setitem(prompt_builder.BUDGETS, 'comments', 800)
+    prepared = prepare('comments', body)
+
+    assert prepared.truncated and prepared.omitted_lines > 0
+    assert prepared.tokens <= 800
+    assert '# step' not in prepared.code
+    assert prepared.code.startswith('1| def f0(x):')
+    assert 'return x + 299' in prepared.code
+    assert 'lines omitted, outline kept' in prepared.code
+    assert prepared.code.count('def f') > prepared.code.count('return x')
+
+
+def test_zero_budget_means_unlimited(monkeypatch):
+    body = 'x = 1\n' * 5000
+    monkeypatch.setitem(prompt_builder.BUDGETS, 'summary', 0)
+    prepared = prepare('summary', body)
+    assert not prepared.truncated
+    assert prepared.code.count('x = 1') == 5000
+
+
+def test_over_budget_c_keeps_preprocessor_lines_and_drops_slash_comments(monkeypatch):
+    body = '#include <stdio.h>\n#define N 10\n' + '\n'.join(
+        f'// step {i}\nint f{i}(int x) {{ return x + N; }}' for i in range(1000))
+    monkeypatch.setitem(prompt_builder.BUDGETS, 'comments', 4000)
+    prepared = prepare('comments', body, language='c')
+
+    assert '#include <stdio.h>' in prepared.code
+    assert '#define N 10' in prepared.code
+    assert '// step' not in prepared.code
+
+    # without the language the file is taken for Python, as before
+    assert '#include' not in prepare('comments', body).code
+
+
+def test_analysis_passes_the_detected_language_to_the_prompt(monkeypatch):
+    from services import analyzer, gemini_client
+    seen = []
+    real = prompt_builder.prepare
+    monkeypatch.setattr(gemini_client, 'prepare', lambda *a, **kw: seen.append(kw.get('language')) or real(*a, **kw))
+    analyzer.run_analysis('#include <stdio.h>\nint main(void) { return 0; }\n',
+                          {'summary': True, 'review': False, 'tags': False, 'docs': False}, 'cloud',
+                          api_key='k', api_key_source='user', filename='main.cpp')
+    assert seen and set(seen) == {'cpp'}
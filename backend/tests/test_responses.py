@@ -0,0 +1,37 @@
+import datetime
+import gzip
+import json
+from decimal import Decimal
+
+import pytest
+
+from utils import responses
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_dumps_stringifies_non_native_values_on_both_paths(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(responses, 'orjson', None)
+    elif responses.orjson is None:
+        pytest.skip('orjson not installed')
+    out = json.loads(responses.dumps({'x': Decimal('1.5'), 'when': datetime.date(2024, 3, 1), 1: 'int key'}))
+    assert out == {'x': '1.5', 'when': '2024-03-01', '1': 'int key'}
+
+
+def test_json_response_compresses_large_bodies_only():
+    class _Req:
+        headers = {'accept-encoding': 'gzip'}
+
+    small = responses.json_response(_Req(), {'a': 1})
+    assert 'Content-Encoding' not in small.headers
+    big = responses.json_response(_Req(), {'a': 'x' * 5000})
+    assert big.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(big.body)) == {'a': 'x' * 5000}
+
+
+def test_analyze_drops_top_level_none_and_documents_the_schema(client):
+    r = client.post('/api/v1/analyze', files={'file': ('a.py', b'x = 1\n')}, data={'mode': 'local'})
+    assert r.status_code == 200
+    assert all(v is not None for v in r.json().values())
+    schema = client.get('/openapi.json').json()['paths']['/api/v1/analyze']['post']['responses']['200']
+    assert schema['content']['application/json']['schema']['$ref'].endswith('/AnalyzeResponse')
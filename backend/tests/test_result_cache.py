@@ -0,0 +1,42 @@
+from services import llm_replay, result_cache
+
+FEATURES = {'metrics': True, 'summary': True, 'review': True, 'tags': True, 'docs': False}
+CODE = 'def area(w, h):\n    """Rectangle area."""\n    return w * h\n'
+
+
+def _analyze(code, filename='shapes.py'):
+    return result_cache.cached_analysis(code, FEATURES, 'cloud', api_key='k', api_key_source='form', filename=filename)
+
+
+def test_exact_and_reformatted_repeats_skip_the_llm():
+    llm_replay.reset_stats()
+    first = _analyze(CODE)
+    calls = llm_replay.STATS['calls']
+    assert calls > 0 and first['comments'][0]['line'] == 1
+
+    assert _analyze(CODE) == first
+    # formatting, comments and the docstring differ; the code does not
+    reformatted = '# shapes\n\ndef area(w, h):\n    """Area of a rectangle."""\n\n    return w * h  # product\n'
+    again = _analyze(reformatted)
+    assert llm_replay.STATS['calls'] == calls
+    assert again['summary'] == first['summary']
+    assert [c['line'] for c in again['comments']] == [3]
+
+
+def test_code_changes_and_other_languages_miss():
+    llm_replay.reset_stats()
+    _analyze('def perimeter(w, h):\n    return 2 * (w + h)\n')
+    calls = llm_replay.STATS['calls']
+    _analyze('def perimeter(w, h):\n    return 2 * (w - h)\n')
+    assert llm_replay.STATS['calls'] > calls
+    calls = llm_replay.STATS['calls']
+    # same text under another language is another cache scope
+    _analyze('def perimeter(w, h):\n    return 2 * (w + h)\n', filename='shapes.rb')
+    assert llm_replay.STATS['calls'] > calls
+
+
+def test_local_runs_bypass_the_cache(monkeypatch):
+    stored = []
+    monkeypatch.setattr(result_cache, '_put', lambda *a: stored.append(a))
+    result_cache.cached_analysis(CODE, FEATURES, 'local', filename='shapes.py')
+    assert stored == []
@@ -0,0 +1,115 @@
+import pytest
+
+from services import sessions
+
+BASE = '''import os
+
+
+def first(a):
+    return a + 1
+
+
+class Box:
+    def second(self, b):
+        return b * 2
+
+
+def third(c):
+    return c - 3
+'''
+
+
+def _fake_review(calls):
+    def run_analysis(code, features, mode='local', api_key=None, api_key_source=None, filename=None):
+        if not features.get('review'):
+            return {'metrics': {'lines': code.count('\n') + 1}}
+        calls.append(code)
+        lines = code.split('\n')
+        # one comment on every "return" line of the snippet, at its column
+        return {'comments': [{'line': i + 1, 'column': len(l) - len(l.lstrip()) + 1, 'severity': 'info',
+                              'category': 'style', 'message': 'r'}
+                             for i, l in enumerate(lines) if l.strip().startswith('return')]}
+    return run_analysis
+
+
+def _session(monkeypatch, calls, code=BASE):
+    monkeypatch.setattr(sessions, 'run_analysis', _fake_review(calls))
+    store = sessions.SessionStore(10, 60)
+    monkeypatch.setattr(sessions, 'SESSIONS', store)
+    previous = {'comments': [{'line': 1, 'severity': 'info', 'message': 'kept'}], 'summary': 's'}
+    store.put(sessions.AnalysisSession('s1', 'a.py', code, previous, 'cloud', {}, sessions.key_id('k')))
+
+
+def test_changed_functions_are_reviewed_in_one_request(monkeypatch):
+    calls = []
+    _session(monkeypatch, calls)
+    edited = BASE.replace('a + 1', 'a + 10').replace('c - 3', 'c - 30')
+    results = sessions.analyze_in_session('s1', 'a.py', edited, {}, 'cloud', api_key='k')
+
+    assert len(calls) == 1
+    assert results['incremental']['reviewed_ranges'] == [[4, 5], [13, 14]]
+    by_line = {c['line']: c for c in results['comments']}
+    assert sorted(by_line) == [1, 5, 14]
+    assert by_line[1]['message'] == 'kept'
+    assert by_line[5]['column'] == 5 and by_line[14]['column'] == 5
+
+
+def test_indented_spans_map_columns_back(monkeypatch):
+    calls = []
+    _session(monkeypatch, calls)
+    results = sessions.analyze_in_session('s1', 'a.py', BASE.replace('b * 2', 'b * 20'), {}, 'cloud', api_key='k')
+    assert calls[0].startswith('def second')
+    assert [(c['line'], c.get('column')) for c in results['comments'] if c['message'] == 'r'] == [(10, 9)]
+
+
+def test_too_many_scattered_edits_get_a_full_pass(monkeypatch):
+    calls = []
+    _session(monkeypatch, calls)
+    monkeypatch.setattr(sessions, 'INCREMENTAL_MAX_SPANS', 1)
+    full = []
+    monkeypatch.setattr(sessions, 'cached_analysis', lambda code, *a, **k: full.append(code) or {'comments': []})
+    edited = BASE.replace('a + 1', 'a + 10').replace('c - 3', 'c - 30')
+    results = sessions.analyze_in_session('s1', 'a.py', edited, {}, 'cloud', api_key='k')
+    assert calls == [] and full == [edited]
+    assert 'incremental' not in results
+
+
+def test_session_is_bound_to_the_key_that_opened_it(monkeypatch):
+    calls = []
+    _session(monkeypatch, calls)
+    sessions.SESSIONS.get('s1').owner = sessions.key_id('owner-key')
+    edited = BASE.replace('a + 1', 'a + 10')
+    with pytest.raises(sessions.SessionKeyMismatch):
+        sessions.analyze_in_session('s1', 'a.py', edited, {}, 'cloud', api_key='other-key')
+    assert sessions.SESSIONS.get('s1').content == BASE
+    assert sessions.analyze_in_session('s1', 'a.py', edited, {}, 'cloud', api_key='owner-key')['incremental']
+
+
+def test_analyze_rejects_a_session_opened_with_another_key(client):
+    def post(**headers):
+        return client.post('/api/v1/analyze', files={'file': ('a.py', b'x = 1\n')},
+                           data={'mode': 'local', 'session_id': 'bound'}, headers=headers)
+
+    assert post(**{'x-api-key': 'first'}).status_code == 200
+    assert post(**{'x-api-key': 'first'}).status_code == 200
+    r = post(**{'x-api-key': 'second'})
+    assert r.status_code == 403
+    assert post().status_code == 403
+
+
+def test_kept_comments_follow_inserted_lines_and_edited_ones_are_dropped(monkeypatch):
+    calls = []
+    _session(monkeypatch, calls)
+    previous = sessions.SESSIONS.get('s1').results
+    previous['comments'] = [{'line': 1, 'message': 'import'}, {'line': 5, 'message': 'first'},
+                            {'line': 14, 'message': 'third'}, {'message': 'file-level'}]
+    edited = BASE.replace('import os\n', 'import os\nimport sys\n\n').replace('c - 3', 'c - 30')
+    results = sessions.analyze_in_session('s1', 'a.py', edited, {}, 'cloud', api_key='k')
+
+    got = [(c.get('line'), c['message']) for c in results['comments']]
+    # 'import' falls in the context re-reviewed around the inserted lines and 'third' in the edited
+    # function: both are replaced by the fresh review; 'first' moves down with the insertion
+    assert results['incremental']['reviewed_ranges'] == [[1, 6], [15, 16]]
+    assert got == [(None, 'file-level'), (7, 'first'), (16, 'r')]
+    assert results['incremental']['comments_kept'] == 2
+    assert sessions.SESSIONS.get('s1').version == 2
@@ -0,0 +1,37 @@
+import pytest
+
+from utils import file_utils
+
+
+def _post(client, data: bytes, name='a.py'):
+    return client.post('/api/v1/analyze', files={'file': (name, data)}, data={'mode': 'local'})
+
+
+def test_small_text_upload_is_analyzed(client):
+    r = _post(client, 'def f():\n    return "héllo"'.encode())
+    assert r.status_code == 200
+    assert r.json()['metrics']['lines'] == 2
+
+
+@pytest.mark.parametrize('data, status, detail', [
+    (b'x = 1\n' * (file_utils.MAX_UPLOAD_LINES + 1), 413, 'lines limit'),
+    (b'#' * (file_utils.MAX_UPLOAD_BYTES + 1), 413, 'bytes limit'),
+    (b'x = 1\n\x00\x01\x02', 415, 'Binary'),
+    (b'x = "\xff\xfe"\n', 415, 'UTF-8'),
+])
+def test_oversized_binary_and_non_utf8_uploads_are_rejected(client, data, status, detail):
+    r = _post(client, data)
+    assert r.status_code == status
+    assert detail in r.json()['detail']
+
+
+def test_line_cap_counts_a_trailing_line_without_newline(client):
+    at_cap = b'x = 1\n' * (file_utils.MAX_UPLOAD_LINES - 1) + b'x = 1'
+    assert _post(client, at_cap).status_code == 200
+    assert _post(client, at_cap + b'\ny = 2').status_code == 413
+
+
+def test_multibyte_characters_split_across_chunks_decode(client, monkeypatch):
+    monkeypatch.setattr(file_utils, 'UPLOAD_CHUNK_SIZE', 3)
+    r = _post(client, 's = "ééé"\n'.encode())
+    assert r.status_code == 200
@@ -0,0 +1,82 @@
+# Benchmark PDF export for large issue tables: standard vs large-report layout.
+# Run from the backend dir: python tools/bench_pdf.py --comments 1000 10000
+#
+# Reports wall time and output size per mode; --memory adds a second, traced run for the peak
+# Python heap (tracemalloc slows reportlab several times over, so it is not timed). The standard
+# layout is skipped above --standard-max comments since it grows superlinearly.
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services.pdf_exporter import build_pdf_report, write_pdf_report, warm_pdf_styles  # noqa: E402
+
+SEVERITIES = ('error', 'warning', 'info')
+CATEGORIES = ('Style', 'Security', 'Performance', 'Maintainability', 'Correctness')
+
+
+def make_payload(n: int) -> dict:
+    comments = []
+    for i in range(n):
+        comments.append({
+            'line': i + 1,
+            'severity': SEVERITIES[i % 3],
+            'category': CATEGORIES[i % len(CATEGORIES)],
+            'message': f'Issue {i}: the value computed here is reassigned before use, which hides a logic error.',
+            'suggestion': 'Remove the dead assignment or use the intermediate value explicitly.',
+        })
+    return {
+        'summary': {'summary': 'Synthetic report for benchmarking.', 'key_points': ['generated']},
+        'metrics': {'cc_avg': 3.2, 'mi_avg': 61.5, 'loc': n * 4},
+        'comments': comments,
+        'docs_links': [{'name': 'reportlab', 'url': 'https://docs.reportlab.com/'}],
+    }
+
+
+def run(label: str, fn, memory: bool) -> None:
+    start = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - start
+    line = f'{label:<34} {elapsed:>8.2f}s  pdf {size / 2**20:>6.2f} MiB'
+    if memory:
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        line += f'  peak {peak / 2**20:>7.1f} MiB'
+    print(line)
+
+
+def bench_large(payload: dict, group_by_severity: bool) -> int:
+    with tempfile.TemporaryFile() as f:
+        write_pdf_report(payload, f, large=True, group_by_severity=group_by_severity)
+        return f.tell()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark PDF export layouts')
+    parser.add_argument('--comments', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--standard-max', type=int, default=2000,
+                        help='skip the standard single-table layout above this many comments')
+    parser.add_argument('--memory', action='store_true', help='also measure peak heap with tracemalloc')
+    args = parser.parse_args()
+
+    warm_pdf_styles()
+    for n in args.comments:
+        payload = make_payload(n)
+        print(f'--- {n} comments')
+        if n <= args.standard_max:
+            run('standard (single table, bytes)', lambda: len(build_pdf_report(payload, large=False)), args.memory)
+        else:
+            print(f'{"standard (single table, bytes)":<34} skipped (> --standard-max)')
+        run('large (chunked, temp file)', lambda: bench_large(payload, False), args.memory)
+        run('large + group by severity', lambda: bench_large(payload, True), args.memory)
+
+
+if __name__ == '__main__':
+    main()
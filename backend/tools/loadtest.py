@@ -0,0 +1,388 @@
+# Load test for the HTTP API: /api/v1/analyze, /api/v1/history and /api/v1/export.
+# Run from the backend dir: python tools/loadtest.py --duration 30 --concurrency 8
+#
+# By default a local server is started (uvicorn main:app in a subprocess) with the offline replay
+# LLM (LLM_BACKEND=replay, see services/llm_replay.py) and scratch history/cache storage; --url
+# targets a server that is already running instead (its LLM backend is whatever it was started with).
+#
+# Closed loop (default): --concurrency workers each send the next request as soon as the previous
+# one returns. Open loop: --rate N sends N requests/s with Poisson arrivals regardless of how fast
+# the server answers; latency is then measured from the scheduled send time, so queueing shows up.
+#
+# --mix weights the request kinds (analyze, history, history_save, export), --sizes the upload
+# sizes in lines, --quota-rate makes that fraction of LLM calls fail with a quota error and
+# --llm-latency-ms sets the replay LLM's latency (both only for the local server).
+#
+# Reported per request kind: count, throughput, error rate, degraded analyses (LLM errors or quota
+# fallback) and p50/p95/p99/max latency; plus the server's event-loop lag over the run, read
+# from the code_review_event_loop_lag_seconds histogram in /metrics. --output writes it as JSON.
+
+import argparse
+import json
+import math
+import os
+import queue
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.corpus import python_source, comments as make_comments  # noqa: E402
+
+KINDS = ('analyze', 'history', 'history_save', 'export')
+_LAG_METRIC = 'code_review_event_loop_lag_seconds'
+
+
+def parse_weights(value: str, cast=str) -> List[Tuple[Any, float]]:
+    out = []
+    for item in value.split(','):
+        key, _, weight = item.partition(':' if ':' in item else '=')
+        if key.strip():
+            out.append((cast(key.strip()), float(weight or 1)))
+    return out
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    # nearest rank: the smallest value with at least p% of the samples at or below it
+    rank = max(math.ceil(p / 100.0 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class LocalServer:
+    """uvicorn main:app in a subprocess with the replay LLM and scratch storage."""
+
+    def __init__(self, llm_latency_ms: float, quota_rate: float, workers: int):
+        self.scratch = tempfile.mkdtemp(prefix='code-review-loadtest-')
+        self.port = _free_port()
+        env = dict(os.environ)
+        env.update({
+            'LLM_BACKEND': 'replay',
+            'LLM_REPLAY_ON_MISS': 'stub',
+            'LLM_REPLAY_LATENCY_MS': str(llm_latency_ms),
+            'LLM_REPLAY_QUOTA_RATE': str(quota_rate),
+            'LLM_CASSETTE_DIR': os.path.join(self.scratch, 'cassettes'),
+            'HISTORY_DIR': self.scratch,
+            'WARMUP_ON_STARTUP': '1',
+        })
+        env.setdefault('MAX_UPLOAD_LINES', '10000')
+        self.proc = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(self.port),
+             '--log-level', 'warning', '--workers', str(workers)],
+            cwd=BACKEND_DIR, env=env)
+        self.url = f'http://127.0.0.1:{self.port}'
+
+    def wait_ready(self, timeout: float = 60.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f'server exited with status {self.proc.returncode}')
+            try:
+                if httpx.get(self.url + '/ready', timeout=1.0).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError('server did not become ready in time')
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        shutil.rmtree(self.scratch, ignore_errors=True)
+
+
+def loop_lag_histogram(client: httpx.Client) -> Optional[Dict[str, Any]]:
+    try:
+        text = client.get('/metrics').text
+    except httpx.HTTPError:
+        return None
+    buckets: Dict[float, float] = {}
+    total = count = 0.0
+    for line in text.splitlines():
+        if not line.startswith(_LAG_METRIC):
+            continue
+        name, _, value = line.rpartition(' ')
+        if name.startswith(_LAG_METRIC + '_bucket'):
+            le = name.split('le="', 1)[1].split('"', 1)[0]
+            buckets[float('inf') if le == '+Inf' else float(le)] = float(value)
+        elif name == _LAG_METRIC + '_sum':
+            total = float(value)
+        elif name == _LAG_METRIC + '_count':
+            count = float(value)
+    return {'buckets': buckets, 'sum': total, 'count': count} if buckets else None
+
+
+def loop_lag_report(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Lag over the run from two cumulative histogram snapshots; quantiles are bucket upper bounds."""
+    if not after:
+        return None
+    before = before or {'buckets': {}, 'sum': 0.0, 'count': 0.0}
+    count = after['count'] - before['count']
+    if count <= 0:
+        return None
+    bounds = sorted(after['buckets'])
+    cumulative = [(le, after['buckets'][le] - before['buckets'].get(le, 0.0)) for le in bounds]
+
+    def quantile(q: float) -> float:
+        for le, n in cumulative:
+            if n >= q * count:
+                return le
+        return float('inf')
+
+    worst = next((le for le, n in cumulative if n >= count), float('inf'))
+    return {
+        'samples': int(count),
+        'mean_ms': round((after['sum'] - before['sum']) / count * 1000.0, 3),
+        'p50_le_ms': quantile(0.5) * 1000.0,
+        'p99_le_ms': quantile(0.99) * 1000.0,
+        'max_le_ms': worst * 1000.0,
+    }
+
+
+class LoadTest:
+    def __init__(self, args, url: str):
+        self.args = args
+        self.url = url
+        self.rng = random.Random(args.seed)
+        self.rng_lock = threading.Lock()
+        self.mix = [(k, w) for k, w in parse_weights(args.mix) if w > 0]
+        unknown = [k for k, _ in self.mix if k not in KINDS]
+        if unknown:
+            raise SystemExit(f'unknown request kinds in --mix: {", ".join(unknown)}')
+        self.sizes = parse_weights(args.sizes, int)
+        self.sources = {lines: python_source(lines, 'mixed', seed=7) for lines, _ in self.sizes}
+        self.results: Dict[str, List[Tuple[float, bool, bool]]] = {k: [] for k, _ in self.mix}
+        self.status_counts: Dict[str, Dict[str, int]] = {k: {} for k, _ in self.mix}
+        self.recent: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+        self.counter = 0
+
+    def _choice(self, weighted):
+        with self.rng_lock:
+            return self.rng.choices([k for k, _ in weighted], weights=[w for _, w in weighted])[0]
+
+    def _next_id(self) -> int:
+        with self.lock:
+            self.counter += 1
+            return self.counter
+
+    def _upload(self) -> Tuple[str, bytes]:
+        lines = self._choice(self.sizes)
+        code = self.sources[lines]
+        n = self._next_id()
+        if not self.args.reuse_files:
+            # a real statement (not a comment) so neither the exact nor the fingerprint cache hits
+            code += f'_loadtest_request = {n}\n'
+        return f'loadtest_{lines}_{n}.py', code.encode()
+
+    def _export_payload(self) -> Dict[str, Any]:
+        with self.lock:
+            if self.recent:
+                return self.recent[self.counter % len(self.recent)]
+        return {'summary': {'summary': 'Load test report.', 'key_points': []}, 'metrics': {'cc_avg': 2.0},
+                'comments': make_comments(50)}
+
+    def request(self, client: httpx.Client, kind: str) -> Tuple[int, bool]:
+        """Send one request; returns (status, degraded)."""
+        if kind == 'analyze':
+            name, body = self._upload()
+            resp = client.post('/api/v1/analyze', files={'file': (name, body, 'text/x-python')},
+                               data={'mode': self.args.mode, 'api_key': self.args.api_key})
+            degraded = False
+            if resp.status_code == 200:
+                result = resp.json()
+                # quota fallback, a failed feature, or an LLM error the validators passed through as text
+                degraded = bool(result.get('llm_disabled') or any(k.endswith('_error') for k in result)
+                                or '__LLM_ERROR__' in resp.text)
+                with self.lock:
+                    self.recent = (self.recent + [result])[-20:]
+            return resp.status_code, degraded
+        if kind == 'history':
+            return client.get('/api/v1/history', params={'limit': 50}).status_code, False
+        if kind == 'history_save':
+            payload = dict(self._export_payload(), fileName=f'loadtest_{self._next_id()}.py')
+            return client.post('/api/v1/history', json=payload).status_code, False
+        resp = client.post('/api/v1/export', params={'format': self.args.export_format}, json=self._export_payload())
+        return resp.status_code, False
+
+    def _record(self, kind: str, seconds: float, status: Optional[int], degraded: bool):
+        label = str(status) if status is not None else 'exception'
+        with self.lock:
+            self.results[kind].append((seconds, status is None or status >= 400, degraded))
+            counts = self.status_counts[kind]
+            counts[label] = counts.get(label, 0) + 1
+
+    def _send(self, client: httpx.Client, kind: str, since: float):
+        status, degraded = None, False
+        try:
+            status, degraded = self.request(client, kind)
+        except httpx.HTTPError:
+            pass
+        self._record(kind, time.perf_counter() - since, status, degraded)
+
+    def run_closed(self, deadline: float):
+        def worker():
+            with httpx.Client(base_url=self.url, timeout=self.args.timeout) as client:
+                while time.perf_counter() < deadline and not self._done():
+                    self._send(client, self._choice(self.mix), time.perf_counter())
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.args.concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def run_open(self, deadline: float):
+        jobs: "queue.Queue[Optional[Tuple[str, float]]]" = queue.Queue()
+
+        def worker():
+            with httpx.Client(base_url=self.url, timeout=self.args.timeout) as client:
+                while True:
+                    job = jobs.get()
+                    if job is None:
+                        return
+                    kind, scheduled = job
+                    # latency from the scheduled send time: time spent queued behind a slow server counts
+                    self._send(client, kind, scheduled)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.args.concurrency)]
+        for t in threads:
+            t.start()
+        scheduled = time.perf_counter()
+        sent = 0
+        while scheduled < deadline and (not self.args.requests or sent < self.args.requests):
+            with self.rng_lock:
+                scheduled += self.rng.expovariate(self.args.rate)
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            jobs.put((self._choice(self.mix), scheduled))
+            sent += 1
+        for _ in threads:
+            jobs.put(None)
+        for t in threads:
+            t.join()
+
+    def _done(self) -> bool:
+        if not self.args.requests:
+            return False
+        with self.lock:
+            return sum(len(v) for v in self.results.values()) >= self.args.requests
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        out = {}
+        for kind, samples in self.results.items():
+            latencies = sorted(s[0] * 1000.0 for s in samples)
+            errors = sum(1 for s in samples if s[1])
+            degraded = sum(1 for s in samples if s[2])
+
+            def ms(p):
+                v = percentile(latencies, p)
+                return round(v, 2) if v is not None else None
+
+            out[kind] = {
+                'count': len(samples),
+                'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+                'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+                'degraded_rate': round(degraded / len(samples), 4) if samples else 0.0,
+                'p50_ms': ms(50), 'p95_ms': ms(95), 'p99_ms': ms(99),
+                'max_ms': round(latencies[-1], 2) if latencies else None,
+                'status': self.status_counts[kind],
+            }
+        return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Load test /api/v1/analyze, /history and /export')
+    parser.add_argument('--url', help='target an already running server instead of starting one')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds to send requests for')
+    parser.add_argument('--requests', type=int, default=0, help='stop after this many requests (0: duration only)')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads (closed loop: in-flight requests)')
+    parser.add_argument('--rate', type=float, default=0.0, help='open loop: mean requests/s (Poisson arrivals)')
+    parser.add_argument('--mix', default='analyze:6,history:2,history_save:1,export:1', help='request kind weights')
+    parser.add_argument('--sizes', default='50:5,200:3,500:2', help='upload size mix, lines:weight')
+    parser.add_argument('--reuse-files', action='store_true', help='send identical uploads (lets the result cache hit)')
+    parser.add_argument('--mode', default='cloud', choices=('cloud', 'local'))
+    parser.add_argument('--api-key', default='loadtest', help='LLM key sent with analyze requests')
+    parser.add_argument('--export-format', default='pdf', help='pdf, sarif, jsonl or markdown')
+    parser.add_argument('--quota-rate', type=float, default=0.0, help='local server: fraction of LLM calls failing with 429')
+    parser.add_argument('--llm-latency-ms', type=float, default=300.0, help='local server: replay LLM latency per call')
+    parser.add_argument('--server-workers', type=int, default=1, help='local server: uvicorn worker processes')
+    parser.add_argument('--timeout', type=float, default=120.0, help='per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the report as JSON here')
+    args = parser.parse_args(argv)
+
+    server = None
+    url = args.url
+    if not url:
+        server = LocalServer(args.llm_latency_ms, args.quota_rate, args.server_workers)
+        url = server.url
+    try:
+        if server is not None:
+            server.wait_ready()
+        test = LoadTest(args, url)
+        with httpx.Client(base_url=url, timeout=10.0) as client:
+            lag_before = loop_lag_histogram(client)
+            started = time.perf_counter()
+            deadline = started + args.duration
+            if args.rate > 0:
+                test.run_open(deadline)
+            else:
+                test.run_closed(deadline)
+            elapsed = time.perf_counter() - started
+            lag_after = loop_lag_histogram(client)
+    finally:
+        if server is not None:
+            server.stop()
+
+    endpoints = test.report(elapsed)
+    lag = loop_lag_report(lag_before, lag_after)
+    print(f'{"kind":<13} {"count":>6} {"rps":>7} {"err%":>6} {"degr%":>6} {"p50":>9} {"p95":>9} {"p99":>9} {"max":>9}  (ms)')
+    for kind, r in endpoints.items():
+        def fmt(v):
+            return f'{v:>9.1f}' if v is not None else f'{"-":>9}'
+        print(f'{kind:<13} {r["count"]:>6} {r["throughput_rps"]:>7.2f} {r["error_rate"] * 100:>6.1f} '
+              f'{r["degraded_rate"] * 100:>6.1f} {fmt(r["p50_ms"])} {fmt(r["p95_ms"])} {fmt(r["p99_ms"])} {fmt(r["max_ms"])}')
+    if lag:
+        print(f'event loop lag: mean {lag["mean_ms"]:.2f} ms, p50 <= {lag["p50_le_ms"]:g} ms, '
+              f'p99 <= {lag["p99_le_ms"]:g} ms, max <= {lag["max_le_ms"]:g} ms over {lag["samples"]} samples')
+    else:
+        print('event loop lag: not available (server without the loop monitor?)')
+
+    if args.output:
+        report = {
+            'config': {k: v for k, v in vars(args).items() if k != 'api_key'},
+            'target': url,
+            'elapsed_seconds': round(elapsed, 3),
+            'endpoints': endpoints,
+            'event_loop_lag': lag,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+            f.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
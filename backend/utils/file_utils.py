@@ -1,5 +1,62 @@
 # File validation (lines count, type)
 
-def validate_file_lines(content: str, max_lines: int = 500) -> bool:
-    lines = content.splitlines()
-    return len(lines) <= max_lines
+import codecs
+import os
+
+# hard cap on raw upload size; the line limit is usually hit first for text files
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(256 * 1024)))
+MAX_UPLOAD_LINES = int(os.environ.get("MAX_UPLOAD_LINES", "500"))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# control bytes that never appear in source text (NUL and friends); tab/newline/formfeed are allowed
+_BINARY_BYTES = bytes(b for b in range(32) if b not in (9, 10, 12, 13, 27))
+
+
+class UploadRejected(Exception):
+    """Raised while reading an upload that must not be analyzed; carries the HTTP status to use."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+async def read_upload_text(file, max_bytes: int = None, max_lines: int = None) -> str:
+    """
+    Read an UploadFile incrementally and return its decoded text.
+    Stops as soon as the byte or line cap is exceeded (413) or binary / non UTF-8
+    content is seen (415), so memory stays bounded by max_bytes regardless of the upload.
+    """
+    max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    max_lines = MAX_UPLOAD_LINES if max_lines is None else max_lines
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="strict")
+    parts = []
+    total = 0
+    newlines = 0
+    last_byte = b""
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadRejected(f"File exceeds {max_bytes} bytes limit.", 413)
+        if chunk.translate(None, _BINARY_BYTES) != chunk:
+            raise UploadRejected("Binary files are not supported.", 415)
+        newlines += chunk.count(b"\n")
+        last_byte = chunk[-1:]
+        if newlines > max_lines:
+            raise UploadRejected(f"File exceeds {max_lines} lines limit.", 413)
+        try:
+            parts.append(decoder.decode(chunk))
+        except UnicodeDecodeError:
+            raise UploadRejected("File is not valid UTF-8 text.", 415)
+    try:
+        parts.append(decoder.decode(b"", final=True))
+    except UnicodeDecodeError:
+        raise UploadRejected("File is not valid UTF-8 text.", 415)
+    # a trailing line without newline still counts
+    if last_byte and last_byte != b"\n":
+        newlines += 1
+    if newlines > max_lines:
+        raise UploadRejected(f"File exceeds {max_lines} lines limit.", 413)
+    return "".join(parts)
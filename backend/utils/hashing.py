@@ -0,0 +1,20 @@
+# Canonical content hashing for analysis payloads
+
+import hashlib
+import json
+from typing import Any, Iterable
+
+# keys that change between submissions of the same analysis and must not affect its identity
+VOLATILE_KEYS = ('timestamp', 'id', 'timings')
+
+
+def canonical_json(obj: Any, exclude: Iterable[str] = VOLATILE_KEYS) -> bytes:
+    """Serialize with sorted keys and no whitespace, dropping volatile top-level keys."""
+    if isinstance(obj, dict) and exclude:
+        skip = set(exclude)
+        obj = {k: v for k, v in obj.items() if k not in skip}
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str).encode('utf-8')
+
+
+def canonical_hash(obj: Any, exclude: Iterable[str] = VOLATILE_KEYS) -> str:
+    return hashlib.sha256(canonical_json(obj, exclude)).hexdigest()
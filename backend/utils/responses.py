@@ -0,0 +1,67 @@
+# JSON serialization and response compression helpers
+
+import gzip
+import json
+from typing import Any, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
+
+try:
+    # optional: install `brotli` to enable br content-encoding
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# bodies smaller than this are sent uncompressed; framing overhead outweighs the savings
+MIN_COMPRESS_BYTES = 1024
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to compact JSON bytes, using orjson when available; both paths str() unknown types."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+def _accepted_encodings(request: Optional[Request]) -> set:
+    if request is None:
+        return set()
+    header = request.headers.get("accept-encoding") or ""
+    accepted = set()
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 1.0
+        if token and q > 0:
+            accepted.add(token.strip().lower())
+    return accepted
+
+
+def json_response(request: Optional[Request], content: Any, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    """
+    Build a JSON response, compressing the body with brotli or gzip when the client accepts it.
+    Compression is negotiated here rather than by middleware so only large payloads pay for it.
+    """
+    body = dumps(content)
+    out_headers = dict(headers or {})
+    if len(body) >= MIN_COMPRESS_BYTES:
+        accepted = _accepted_encodings(request)
+        if brotli is not None and "br" in accepted:
+            body = brotli.compress(body, quality=4)
+            out_headers["Content-Encoding"] = "br"
+        elif "gzip" in accepted:
+            body = gzip.compress(body, compresslevel=5)
+            out_headers["Content-Encoding"] = "gzip"
+        out_headers["Vary"] = "Accept-Encoding"
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=out_headers)